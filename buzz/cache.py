@@ -0,0 +1,321 @@
+"""
+buzz: columnar on-disk cache of parsed corpora
+
+Every parsed file is stored as a feather shard in a hidden directory next to
+the corpus, alongside a manifest of the size, mtime and hash of its source.
+Loading a corpus then only has to re-read CONLL-U files that have changed.
+The parser can write these shards too, so that even the first load is quick.
+"""
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .constants import CACHE_DIRNAME
+
+# bump this whenever the shard format changes, invalidating existing caches
+CACHE_VERSION = 2
+
+MANIFEST = "manifest.json"
+
+
+def _cache_path(corpus_path):
+    """
+    Get the cache directory for the corpus at corpus_path
+    """
+    corpus_path = os.path.abspath(corpus_path).rstrip(os.sep)
+    parent, name = os.path.split(corpus_path)
+    return os.path.join(parent, CACHE_DIRNAME, name)
+
+
+def _hash_file(path, blocksize=2 ** 20):
+    """
+    Get the sha1 hex digest of a file's bytes
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as fo:
+        for block in iter(lambda: fo.read(blocksize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode_objects(df):
+    """
+    Feather cannot store object columns holding anything but strings, so
+    json-encode those, returning the names of the columns that were encoded
+    """
+    encoded = list()
+    for col in df.columns:
+        # arrow dictionaries need categories all of one type
+        if df[col].dtype.name == "category":
+            if pd.api.types.infer_dtype(df[col].cat.categories) == "string":
+                continue
+            df[col] = df[col].astype(object)
+        if df[col].dtype != object:
+            continue
+        if pd.api.types.infer_dtype(df[col], skipna=True) in {"string", "empty"}:
+            continue
+        df[col] = df[col].map(json.dumps, na_action="ignore")
+        encoded.append(col)
+    return encoded
+
+
+def _decode_objects(df, encoded):
+    """
+    Undo _encode_objects, and give back nan rather than None for missing data
+    """
+    df = df.fillna(np.nan)
+    for col in encoded:
+        if col in df.columns:
+            df[col] = df[col].map(json.loads, na_action="ignore")
+    return df
+
+
+class CorpusCache(object):
+    """
+    Feather shards plus a manifest, for one corpus and one set of load settings
+    """
+
+    def __init__(self, corpus, folders="index", morph=True, misc=True, **kwargs):
+        # a Corpus, or the path of one that may not exist yet
+        path = getattr(corpus, "path", corpus)
+        self.corpus_path = os.path.abspath(path)
+        # each combination of settings gets its own shards
+        variant = [str(folders).lower()]
+        if morph:
+            variant.append("morph")
+        if misc:
+            variant.append("misc")
+        self.path = os.path.join(_cache_path(path), "-".join(variant))
+        self.settings = dict(version=CACHE_VERSION, folders=folders, morph=morph, misc=misc)
+        self.files = dict()
+        self.changed = dict()
+        manifest = self._read_manifest()
+        if manifest.get("settings") == self.settings:
+            self.files = manifest.get("files", dict())
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST), "r") as fo:
+                return json.load(fo)
+        except (OSError, ValueError):
+            return dict()
+
+    def _key(self, file):
+        return os.path.relpath(os.path.abspath(file.path), self.corpus_path)
+
+    def _shard_path(self, key, kind=""):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, name + kind + ".feather")
+
+    def for_file(self, file):
+        """
+        A copy that only knows the manifest entry of file, so that sending it
+        to a worker process does not mean pickling the whole manifest
+        """
+        key = self._key(file)
+        entry = self.changed.get(key) or self.files.get(key)
+        one = copy.copy(self)
+        one.files = {key: entry} if entry else dict()
+        one.changed = dict()
+        return one
+
+    def is_fresh(self, file):
+        """
+        Is there a cached shard for this file, made from its current contents?
+        """
+        key = self._key(file)
+        entry = self.changed.get(key) or self.files.get(key)
+        if not entry or not os.path.isfile(self._shard_path(key)):
+            return False
+        stat = os.stat(file.path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime"]:
+            return True
+        # touched but maybe not changed: compare contents to be sure
+        if _hash_file(file.path) != entry["hash"]:
+            return False
+        self.changed[key] = {**entry, "mtime": stat.st_mtime_ns}
+        return True
+
+    def _read(self, file, usecols=None):
+        """
+        Get the cached data for a file as a Dataset
+        """
+        from .dataset import Dataset
+
+        key = self._key(file)
+        entry = self.changed.get(key) or self.files[key]
+        columns = None
+        if usecols:
+            # the columns that _to_df would have made with these usecols
+            keep = set(usecols) | {"file", "s", "i", "subcorpus"}
+            if "m" in usecols:
+                keep.update(entry["morph"])
+            if "o" in usecols:
+                keep.update(entry["misc"])
+            columns = [i for i in entry["columns"] if i in keep]
+        df = pd.read_feather(self._shard_path(key), columns=columns)
+        df = _decode_objects(df, entry["encoded"])
+        return Dataset(df.set_index(["file", "s", "i"]), name=file.name)
+
+    def _write(self, file, df, origins):
+        """
+        Store the data parsed from file as a shard, and note it in the manifest
+        """
+        key = self._key(file)
+        stat = os.stat(file.path)
+        entry = dict(
+            mtime=stat.st_mtime_ns,
+            size=stat.st_size,
+            hash=_hash_file(file.path),
+            morph=origins.get("morph", list()),
+            misc=origins.get("misc", list()),
+        )
+        os.makedirs(self.path, exist_ok=True)
+        df = df.reset_index()
+        entry["columns"] = [str(i) for i in df.columns]
+        entry["encoded"] = _encode_objects(df)
+        shard = self._shard_path(key)
+        tmp = shard + ".tmp"
+        try:
+            df.to_feather(tmp)
+        except (TypeError, ValueError, NotImplementedError):
+            # data feather cannot represent. just do not cache this file
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+            return
+        os.replace(tmp, shard)
+        self.changed[key] = entry
+
+    def store(self, file, sents):
+        """
+        Cache the sentences just written to file as CONLL-U, straight from the
+        parser's metadata and token fields rather than reading the file back
+
+        sents: as made by parse._doc_to_sents
+        """
+        from .utils import _to_df
+
+        origins = dict()
+        df = _to_df(file, _complete=False, _origins=origins, _sents=sents)
+        if df is None:
+            return
+        try:
+            self._write(file, df, origins)
+        except OSError:
+            pass
+
+    def load(self, file, usecols=None, add_governor=False, **kwargs):
+        """
+        Load one file, from its shard if fresh, otherwise parsing and caching it
+
+        kwargs are those of utils._to_df
+        """
+        from .utils import _decode_categories, _encode_categories, _finish_df, _to_df
+
+        if self.is_fresh(file):
+            df = self._read(file, usecols=usecols)
+        else:
+            origins = dict()
+            df = _to_df(file, usecols=None, _complete=False, _origins=origins, **kwargs)
+            if df is None:
+                return
+            try:
+                self._write(file, df.copy(), origins)
+            except OSError:
+                pass
+            if usecols and self._key(file) in self.changed:
+                df = self._read(file, usecols=usecols)
+            elif usecols:
+                df = _to_df(file, usecols=usecols, _complete=False, **kwargs)
+        if "g" in df.columns and add_governor:
+            # as _to_df does it, before missing values become nan
+            df = _decode_categories(df)
+            df = _finish_df(df, set_data_types=False, add_governor=True)
+        # shards may have been written with or without categories
+        if kwargs.get("set_data_types", True):
+            return _encode_categories(df)
+        return _decode_categories(df)
+
+    def load_file(self, file, usecols=None):
+        """
+        Load one file, exactly as File.load would, but from its shard if fresh
+        """
+        from .constants import COLUMN_NAMES
+        from .utils import _finish_df, _order_df_columns
+
+        df = self.load(file, usecols=usecols, set_data_types=False)
+        entry = self.changed.get(self._key(file)) or self.files.get(self._key(file))
+        if df is None or entry is None:
+            return file.load(usecols=usecols) if usecols else file.load()
+        extra = [i for i in entry["morph"] + entry["misc"] if i in df.columns]
+        metadata = [i for i in df.columns if i not in COLUMN_NAMES and i not in extra]
+        df = _order_df_columns(df, metadata, extra)
+        df = _finish_df(df)
+        df["_n"] = range(len(df))
+        df = _order_df_columns(df)
+        df.reference = df
+        return df
+
+    def trees(self, file, parses):
+        """
+        Get the parse trees of a file as arrays for tgrep, from their shard if
+        fresh, otherwise making them from parses (one per sentence) and caching
+        them alongside the file's shard
+        """
+        from .tgrep import _Trees
+
+        key = self._key(file)
+        path = self._shard_path(key, ".trees")
+        if self.is_fresh(file):
+            entry = self.changed.get(key) or self.files[key]
+            if entry.get("trees"):
+                try:
+                    return _Trees.from_frame(pd.read_feather(path), len(parses))
+                except (OSError, ValueError):
+                    pass
+        trees = _Trees.from_strings(parses)
+        # only trees made from a fresh shard can be kept with it
+        if not self.is_fresh(file):
+            return trees
+        tmp = path + ".tmp"
+        try:
+            trees.to_frame().to_feather(tmp)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            return trees
+        self.changed[key] = {**(self.changed.get(key) or self.files[key]), "trees": True}
+        return trees
+
+    def save(self, files=None):
+        """
+        Write the manifest, adding any changes and dropping files no longer in corpus
+        """
+        merged = {**self.files, **self.changed}
+        removed = set()
+        if files is not None:
+            removed = set(merged) - {self._key(f) for f in files}
+        if not self.changed and not removed:
+            return
+        for key in removed:
+            del merged[key]
+            for kind in ["", ".trees"]:
+                try:
+                    os.remove(self._shard_path(key, kind))
+                except OSError:
+                    pass
+        manifest = dict(settings=self.settings, files=merged)
+        tmp = os.path.join(self.path, MANIFEST + ".tmp")
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, "w") as fo:
+                json.dump(manifest, fo, indent=4, sort_keys=True)
+            os.replace(tmp, os.path.join(self.path, MANIFEST))
+        except OSError:
+            return
+        self.files, self.changed = merged, dict()
@@ -1,7 +1,8 @@
+import numpy as np
 import pandas as pd
 
 from .constants import CONLL_COLUMNS
-from .utils import _auto_window, _make_match_col
+from .utils import _auto_window, _make_match_col, _sentence_offsets
 from .views import _tabview
 
 
@@ -28,24 +29,78 @@ class Concordance(pd.DataFrame):
         return _tabview(self, self.reference, *args, **kwargs)
 
 
-def _get_right(n, allwords, window, multiword=0):
+def _word_offsets(words):
     """
-    For df.apply(), generate right
-
-    This needs to be performant.
+    Join words with spaces, and get the character offset where each one starts.
+    The last offset is one past the end of the text, as if another word followed.
     """
-    # get smallest out of: this index+window_right, or last index
-    end = min(multiword + n + window[1], multiword + len(allwords) - 1)
-    return " ".join(allwords[n + 1 + multiword : end])[: window[1] + multiword]
+    words = [str(word) for word in words]
+    starts = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum([len(word) + 1 for word in words], out=starts[1:])
+    return " ".join(words), starts
 
 
-def _get_left(n, allwords, window, multiword=0):
+def _window_rows(starts, ends, n_rows):
+    """
+    Sorted row numbers that are in any of the spans from starts to ends
+    """
+    lengths = np.maximum(ends - starts, 0)
+    if lengths.sum() > n_rows:
+        # windows cover more rows than there are: cheaper to mark them all
+        spans = lengths > 0
+        edges = np.bincount(starts[spans], minlength=n_rows + 1)
+        edges -= np.bincount(ends[spans], minlength=n_rows + 1)
+        return np.flatnonzero(np.cumsum(edges[:-1]) > 0)
+    first = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.unique(first + np.arange(lengths.sum()))
+
+
+def _contexts(words, positions, window, multiword=0, sentences=None):
     """
-    For df.apply(), generate left
+    Make left and right context for tokens at positions, by slicing the joined
+    text of just those reference corpus words that are inside some window
 
-    This needs to be performant.
+    window: size of context, as (left, right). Left context is up to that many
+    words, cut to that many characters. Right context is one word fewer.
+    sentences: row numbers where each sentence starts, to stop context at
+    sentence boundaries
+
+    Return: list of left strings, list of right strings
     """
-    return " ".join(allwords[max(n - window[0], 0) : n])[-window[0] :]
+    n_words = len(words)
+    positions = np.asarray(positions, dtype=np.int64)
+    left_start = np.maximum(positions - window[0], 0)
+    right_start = positions + 1 + multiword
+    right_end = np.minimum(positions + multiword + window[1], n_words + multiword - 1)
+    if sentences is not None:
+        sent = np.searchsorted(sentences, positions, side="right") - 1
+        sent_ends = np.append(sentences[1:], n_words)
+        left_start = np.maximum(left_start, sentences[sent])
+        right_end = np.minimum(right_end, sent_ends[sent])
+    right_start = np.minimum(right_start, n_words)
+    right_end = np.clip(right_end, right_start, n_words)
+
+    # each window is a run of rows, and stays one in the text of just these rows
+    spans = np.append(left_start, right_start), np.append(positions, right_end)
+    rows = _window_rows(*spans, n_words)
+    if isinstance(words, pd.Categorical):
+        # each category made into a string once, with missing words as "nan"
+        names = np.append(words.categories.astype(str), "nan").astype(object)
+        text, starts = _word_offsets(names[words.codes[rows]])
+    else:
+        text, starts = _word_offsets(words[rows])
+    spans = [left_start, positions, right_start, right_end]
+    left_start, positions, right_start, right_end = (np.searchsorted(rows, i) for i in spans)
+
+    # character spans: the text between the words, minus the space after the last
+    left_hi = np.maximum(starts[positions] - 1, starts[left_start])
+    left_lo = np.maximum(starts[left_start], left_hi - window[0])
+    right_lo = starts[right_start]
+    right_hi = np.minimum(starts[right_end] - 1, right_lo + window[1] + multiword)
+    right_hi = np.maximum(right_hi, right_lo)
+    left = [text[lo:hi] for lo, hi in zip(left_lo.tolist(), left_hi.tolist())]
+    right = [text[lo:hi] for lo, hi in zip(right_lo.tolist(), right_hi.tolist())]
+    return left, right
 
 
 def multiword_matches(matches, multiword, preserve_case):
@@ -79,9 +134,12 @@ def _concordance(
     metadata=True,
     preserve_case=True,
     preserve_index=False,
+    within_sentence=False,
 ):
     """
     Generate a concordance
+
+    within_sentence: do not let left and right context go past the sentence
     """
     # cut dataset down
     if n and n > 0:
@@ -114,12 +172,16 @@ def _concordance(
         matches = matches[data_in["_position"] == 0]
         match_indices = match_indices[data_in["_position"] == 0]
 
+    sentences = None
+    if within_sentence:
+        sentences = getattr(reference, "sentence_offsets", None)
+        if sentences is None:
+            sentences = _sentence_offsets(reference.index)
     words = reference["w"].values
-    apply_data = dict(allwords=words, window=window, multiword=multiword)
-    left = match_indices.apply(_get_left, **apply_data)
-    right = match_indices.apply(_get_right, **apply_data)
-
-    left.name, matches.name, right.name = "left", "match", "right"
+    lines = _contexts(words, match_indices.values, window, int(multiword), sentences)
+    left = pd.Series(lines[0], index=match_indices.index, name="left")
+    right = pd.Series(lines[1], index=match_indices.index, name="right")
+    matches.name = "match"
 
     ignores = ["_match", "_n", "sent_len", "parse", "text", "_position"]
 
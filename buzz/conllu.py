@@ -0,0 +1,163 @@
+"""
+buzz: reading CONLL-U data straight into column arrays
+"""
+import os
+
+import numpy as np
+
+from .constants import CONLL_COLUMNS
+from .utils import cast
+
+# columns pandas used to infer as integers when reading the old csv format
+INT_COLUMNS = {"s", "i", "g"}
+
+
+def _get_fname_and_subcorpus(fname, folders):
+    """
+    Turn a CONLL-U path into the name used in the file level of the index.
+
+    folders: a seperate column for subcorpus, or should it
+    be in the file level of the multiindex
+
+    Return: str (file name) and str or None (subcorpus name)
+    """
+    colname = None
+    # todo: find better way to use correct path as file index
+    fname = os.path.normcase(fname)
+    fname = fname.rsplit("-parsed" + os.sep)[-1]
+    # no file extensions!
+    if ".txt" in fname:
+        fname = fname.split(".txt", 1)[0]
+    # how to deal with folders??
+    if folders == "column" or not folders:
+        colname, fname = fname.rsplit("/", 1)
+        colname = colname.split("/conllu/", 1)[-1]
+    else:
+        fname = fname.split("/conllu/", 1)[-1]
+    return fname, colname
+
+
+def _make_column(values, name):
+    """
+    Turn a list of strings into an array, using ints where pandas would have
+    """
+    if name in INT_COLUMNS:
+        try:
+            return np.array(values, dtype=np.int64)
+        except ValueError:
+            pass
+    return np.array(values, dtype=object)
+
+
+def _read_conllu(data, fname, usecols=None, folders="index"):
+    """
+    Read raw CONLL-U file data in a single pass, filling column arrays directly.
+
+    Metadata stored as comments becomes a dict for each sentence, and the
+    [file, sent#, token#] index is built as we go.
+
+    usecols: if given, only these CONLL-U columns and metadata keys are kept
+    folders: "index", "column" or None, as per `Corpus.load`
+
+    Return: dict of column arrays (always including file/s/i), list of dicts
+    (metadata for each discovered sentence)
+    """
+    fname, colname = _get_fname_and_subcorpus(fname, folders)
+    wanted = [
+        (position, name)
+        for position, name in enumerate(CONLL_COLUMNS)
+        if not usecols or name in usecols or name == "i"
+    ]
+    columns = {name: list() for _, name in wanted}
+    appenders = [(position, columns[name].append) for position, name in wanted]
+    width = len(CONLL_COLUMNS)
+    sent_ids = list()
+    meta_dicts = list()  # our sent-level metadata will go in here
+    sent_meta = None  # metadata for the sentence being read, or None between sentences
+    in_tokens = False
+    sent_id = 0
+
+    for line in data.splitlines():
+        # blank line: end of sentence
+        if not line.strip():
+            if sent_meta is not None and not in_tokens:
+                raise ValueError(f"Data format problem in {fname}: {sent_meta}")
+            sent_meta, in_tokens = None, False
+            continue
+        if sent_meta is None:
+            sent_meta = dict()
+            if folders == "column":
+                sent_meta["subcorpus"] = colname
+        # metadata comments: '# key = value'
+        if line.startswith("#"):
+            if not line.startswith("# ") or " = " not in line:
+                continue
+            key, _, value = line[2:].partition(" = ")
+            key = key.strip()
+            if usecols and key not in usecols:
+                continue
+            # turn the string into an object if it's valid json
+            sent_meta[key] = cast(value.strip())
+            continue
+        # first token of a sentence
+        if not in_tokens:
+            in_tokens = True
+            sent_id += 1
+            meta_dicts.append(sent_meta)
+        parts = line.split("\t")
+        if len(parts) < width:
+            parts += ["_"] * (width - len(parts))
+        for position, append in appenders:
+            append(parts[position])
+        sent_ids.append(sent_id)
+
+    if sent_meta is not None and not in_tokens:
+        raise ValueError(f"Data format problem in {fname}: {sent_meta}")
+
+    return _finish_columns(fname, sent_ids, columns), meta_dicts
+
+
+def _read_sents(sents, fname, usecols=None, folders="index"):
+    """
+    Fill the same column arrays as _read_conllu, from sentences that are
+    already split up, as the parser has them, rather than from CONLL-U text.
+
+    sents: for each sentence, a dict of metadata and the ten CONLL-U fields of
+    each token. Metadata values are read as they would be from the text.
+
+    Return: as for _read_conllu
+    """
+    fname, colname = _get_fname_and_subcorpus(fname, folders)
+    wanted = [
+        (position, name)
+        for position, name in enumerate(CONLL_COLUMNS)
+        if not usecols or name in usecols or name == "i"
+    ]
+    columns = {name: list() for _, name in wanted}
+    sent_ids = list()
+    meta_dicts = list()
+
+    for sent_meta, rows in sents:
+        meta = dict(subcorpus=colname) if folders == "column" else dict()
+        for key, value in sent_meta.items():
+            if not usecols or key in usecols:
+                meta[key] = cast(str(value).strip())
+        if not rows:
+            raise ValueError(f"Data format problem in {fname}: {meta}")
+        meta_dicts.append(meta)
+        sent_ids.extend([len(meta_dicts)] * len(rows))
+        for position, name in wanted:
+            columns[name].extend(parts[position] for parts in rows)
+
+    return _finish_columns(fname, sent_ids, columns), meta_dicts
+
+
+def _finish_columns(fname, sent_ids, columns):
+    """
+    Turn lists of values into column arrays, adding the file and s columns
+    """
+    out = dict(file=np.array([fname] * len(sent_ids), dtype=object))
+    out["s"] = np.array(sent_ids, dtype=np.int64)
+    for name, values in columns.items():
+        out[name] = _make_column(values, name)
+    return out
@@ -7,6 +7,18 @@ VALID_EXTENSIONS["conllu"].add("conll")
 VALID_EXTENSIONS["tiff"].add("tif")
 VALID_EXTENSIONS["source"] = set()
 
+CACHE_DIRNAME = ".buzz-cache"
+
+# record of what each parsed file was made from, kept in the parsed corpus
+PARSE_MANIFEST = ".buzz-parse.json"
+
+# how many files spaCy parses at once, in each process
+PARSE_BATCH_SIZE = 32
+
+# how many bytes of CONLL-U files on disk may be loading at once when using
+# several processes. this is not a limit on the memory the loaded corpus uses
+LOAD_MAX_BYTES = 2 ** 30
+
 CONLL_COLUMNS = ["i", "w", "l", "x", "p", "m", "g", "f", "e", "o"]
 
 COLUMN_NAMES = ["file", "s"] + CONLL_COLUMNS
@@ -262,7 +274,7 @@ TOPOLOGY_QUERIES = dict(
         prep_dependent=("X/PREP/ <- {query}", True, _wanted_features),
         modified_by=("F/amod/ <- {query}", True, _wanted_features),
         classified_by=("F/nummod/ <- {query}", True, _wanted_features),
-        conjoined_with=("F/conj/ ( <- {query} | -> {query})", True, _wanted_features,),
+        conjoined_with=("F/conj/ [ <- {query} | -> {query} ]", True, _wanted_features,),
         appositional=("F/appos/ [ <- {query} | -> {query} ]", True, _wanted_features,),
         compound=("F/compound$/ [ <- {query} | -> {query} ]", True, _wanted_features,),
     ),
@@ -6,7 +6,7 @@ from collections import MutableSequence
 from functools import total_ordering
 
 from . import utils
-from .constants import FORMATS, VALID_EXTENSIONS
+from .constants import FORMATS, PARSE_BATCH_SIZE, VALID_EXTENSIONS
 from .contents import Contents
 from .parse import Parser
 from .search import Searcher
@@ -56,7 +56,16 @@ class Collection(object):
             shutil.copytree(subpath, format_path)
         return cls(path)
 
-    def parse(self, language="en", multiprocess=False, constituencies=False, speakers=True, just_missing=False):
+    def parse(
+        self,
+        language="en",
+        multiprocess=False,
+        constituencies=False,
+        speakers=True,
+        just_missing=False,
+        batch_size=PARSE_BATCH_SIZE,
+        cache=False,
+    ):
         language = language.split('_', 1)[0] # de_frak to de
         parsed_path = os.path.join(self.path, "conllu")
         if self.conllu or os.path.isdir(parsed_path):
@@ -68,7 +77,9 @@ class Collection(object):
             multiprocess=multiprocess,
             constituencies=constituencies,
             speakers=speakers,
-            just_missing=just_missing
+            just_missing=just_missing,
+            batch_size=batch_size,
+            cache=cache,
         )
         parsed = self.parser.run(self)
         self.conllu = parsed
@@ -89,9 +100,12 @@ class Corpus(MutableSequence):
     Model a collection of plain text or CONLL-U files.
     """
 
-    def __init__(self, path=None, in_collection=None):
+    def __init__(self, path=None, in_collection=None, cache=False):
         """
         Initialise the corpus, deteremine if parsed, hook up methods
+
+        cache: keep a columnar copy of each parsed file (and an index of them)
+        in a hidden directory next to the corpus, to load and search it faster
         """
         path = os.path.expanduser(path)
         self.format = os.path.basename(path)
@@ -103,6 +117,7 @@ class Corpus(MutableSequence):
             else:
                 self.format = "txt"
         self.in_collection = in_collection
+        self.cache = cache
 
         if not os.path.isdir(path):
             raise NotADirectoryError(f"Not a valid path: {path}")
@@ -176,10 +191,21 @@ class Corpus(MutableSequence):
         return Searcher().run(self, "d", query, **kwargs)
 
     def parse(
-        self, language="en", multiprocess=False, constituencies=False, speakers=True
+        self,
+        language="en",
+        multiprocess=False,
+        constituencies=False,
+        speakers=True,
+        batch_size=PARSE_BATCH_SIZE,
+        cache=False,
     ):
         """
         Parse a plaintext corpus
+
+        batch_size is how many files each process sends to spaCy at once
+
+        cache: as well as CONLL-U, write the columnar shards that load reads,
+        so that the first load of the parsed corpus does not have to parse it
         """
         language = language.split('_', 1)[0] # de_frak to de
         parsed_path = os.path.join(os.path.dirname(self.path), "conllu")
@@ -192,6 +218,8 @@ class Corpus(MutableSequence):
             multiprocess=multiprocess,
             constituencies=constituencies,
             speakers=speakers,
+            batch_size=batch_size,
+            cache=cache,
         )
         return self.parser.run(self)
 
@@ -207,6 +235,13 @@ class Corpus(MutableSequence):
         an integer (use that many processes), or false/None/0/1, which mean
         just one process.
 
+        cache: use the on-disk load cache this time, whatever the corpus says
+
+        max_bytes: with more than one process, how many bytes of CONLL-U files
+        (as sizes on disk) may be loading at once. Files are still all kept
+        until they are joined into one Dataset at the end, so the peak memory
+        used is about twice that of the loaded Dataset, whatever max_bytes is.
+
         Multiprocess is not specified in the call signature, because the default
         should change based on whether or not your corpus is parsed. For parsed
         corpora, multiprocessing is switched on by default. For unparsed, it is
@@ -13,14 +13,17 @@ from .exceptions import NoReferenceCorpus
 from .search import Searcher
 from .slice import Just, See, Skip  # noqa: F401
 from .tfidf import _tfidf_model, _tfidf_prototypical, _tfidf_score
+from .tgrep import _flat, _Trees
 from .topology import _topology
 from .utils import (
+    _fingerprint,
     _fix_datatypes_on_save,
     _get_nlp,
-    _make_match_col,
+    _governor_positions,
     _make_tree,
+    _make_match_col,
     _series_to_wordlist,
-    _set_best_data_types,
+    _sentence_offsets,
     _tree_once,
 )
 from .views import _add_frequencies, _table, _tabview
@@ -31,7 +34,9 @@ class Dataset(pd.DataFrame):
     A corpus or corpus subset in memory
     """
 
-    _internal_names = pd.DataFrame._internal_names
+    # postings for exact match filtering (see index.py), sentence and
+    # governor positions, and parsed trees. these are never carried over to slices
+    _internal_names = pd.DataFrame._internal_names + ["_postings", "_positions"]
     _internal_names_set = set(_internal_names)
 
     _metadata = ["reference", "_tfidf", "_name"]
@@ -60,6 +65,8 @@ class Dataset(pd.DataFrame):
         self.reference = reference
         self._tfidf = dict()
         self._name = name
+        self._postings = dict()
+        self._positions = dict()
 
     def __len__(self):
         """
@@ -111,12 +118,66 @@ class Dataset(pd.DataFrame):
         """
         return self[self.index.get_level_values("i") == 1]
 
+    def _cached_positions(self, name, maker):
+        """
+        Make an array of row positions once, remaking it only if the index or
+        the data it was made from (governors, or parses for trees) is replaced
+        or edited in place
+        """
+        data = None
+        if name == "governors":
+            data = _fingerprint(self["g"].array)
+        elif name == "trees":
+            data = _fingerprint(self["parse"].array)
+        cached = self._positions.get(name)
+        if cached is None or cached[0] is not self.index or cached[1] != data:
+            cached = (self.index, data, maker())
+            self._positions[name] = cached
+        return cached[2]
+
+    @property
+    def sentence_offsets(self):
+        """
+        Row number at which each sentence starts
+        """
+        return self._cached_positions("sentences", lambda: _sentence_offsets(self.index))
+
+    @property
+    def governor_positions(self):
+        """
+        Row number of each token's governor, or -1 for root governors
+        """
+        if "g" not in self.columns:
+            return
+        return self._cached_positions("governors", lambda: _governor_positions(self))
+
+    def _tree_arrays(self):
+        """
+        Every sentence's parse tree, read once into arrays for tgrep
+        """
+        return self._cached_positions("trees", lambda: _Trees.from_strings(_tree_once(self)))
+
+    def tree(self, n):
+        """
+        Helper: get the parse tree of the nth sentence as an nltk ParentedTree
+        """
+        parse = self.sent(n)["parse"].iloc[0]
+        return _make_tree(parse) if isinstance(parse, str) else parse
+
     def sent(self, n):
         """
         Helper: get nth sentence as DataFrame with all index levels intact
         """
-        # order of magnitude faster than groupby:
-        return self.iloc[self.index.get_loc(self.index.droplevel("i").unique()[n])]
+        offsets = self.sentence_offsets
+        # only if each sentence is in one piece, else fall back to the index
+        if self._positions.get("contiguous") is not offsets:
+            starts = self.index[offsets].droplevel("i")
+            self._positions["contiguous"] = offsets if starts.is_unique else None
+        if self._positions["contiguous"] is None:
+            return self.iloc[self.index.get_loc(self.index.droplevel("i").unique()[n])]
+        n = range(len(offsets))[n]
+        end = offsets[n + 1] if n + 1 < len(offsets) else len(self)
+        return self.iloc[offsets[n] : end]
 
     def formality(self, **kwargs):
         """
@@ -160,8 +221,10 @@ class Dataset(pd.DataFrame):
         queries = [q.format(query=depgrep_query) for q in QUERYSETS[queryset]]
         multiprocess = multi.how_many(multiprocess)
         chunks = np.array_split(queries, multiprocess)
-        delay = (multi.search(self, x, i, **kwargs) for i, x in enumerate(chunks))
-        nested = Parallel(n_jobs=multiprocess)(delay)
+        # workers map one shared copy of the data, rather than getting their own
+        with multi.shared(self, multiprocess) as data:
+            delay = (multi.search(data, x, i, **kwargs) for i, x in enumerate(chunks))
+            nested = Parallel(n_jobs=multiprocess)(delay)
         # unpack the nested list that multiprocessing creates
         results = [item for sublist in nested for item in sublist]
 
@@ -265,9 +328,13 @@ class Dataset(pd.DataFrame):
         site.run()
         return site
 
-    def save(self, savename=None, use="feather"):
+    def save(self, savename=None, use="feather", compression=None):
         """
         Save to feather/parquet
+
+        compression: passed to pyarrow. Use "uncompressed" for feather files
+        that will be loaded with `memory_map=True`, so that reading a column
+        does not mean decompressing it into memory.
         """
         if not savename:
             savename = self._name
@@ -282,29 +349,30 @@ class Dataset(pd.DataFrame):
         if to_reduce:
             # amazing line: make nan in many places, save a lot of memory!
             df.loc[df.i != 1, to_reduce] = np.nan
-        getattr(df, "to_feather" if use == "feather" else "to_parquet")(savename)
+        if "parse" in df.columns:
+            # any trees, now one per sentence, are stored as bracketed strings
+            df["parse"] = df["parse"].map(_flat, na_action="ignore")
+        kwargs = dict(compression=compression) if compression else dict()
+        getattr(df, "to_feather" if use == "feather" else "to_parquet")(savename, **kwargs)
         print("Done!")
 
     @staticmethod
-    def load(loadname, multiprocess=True):
+    def load(loadname, multiprocess=True, columns=None, rows=None, memory_map=False):
         """
         Load from feather
+
+        columns: only load these columns (plus the index)
+        rows: only load this slice (or (start, stop) tuple) of rows
+        memory_map: do not load anything yet, but get a `MappedDataset` that
+        reads columns and rows from the memory-mapped file on demand. The
+        file must be feather, saved with compression="uncompressed".
         """
+        from .mapped import MappedDataset, _load_saved
+
+        if memory_map:
+            return MappedDataset(loadname)
         multiprocess = multi.how_many(multiprocess)
-        if loadname.endswith(".feather"):
-            df = pd.read_feather(loadname, use_threads=multiprocess)
-        elif loadname.endswith(".parquet"):
-            df = pd.read_parquet(loadname)  # use_threads??
-        name = os.path.splitext(os.path.basename(loadname))[0]
-        if name.endswith("-parsed"):
-            name = name[:-7]
-        df = df.set_index(["file", "s", "i"])
-        if "parse" in df.columns:
-            tree_once = _tree_once(df)
-            df["parse"] = tree_once.apply(_make_tree)
-        df = df.ffill()
-        df = _set_best_data_types(df)
-        return Dataset(df, reference=df, name=name)
+        return _load_saved(loadname, columns=columns, rows=rows, use_threads=bool(multiprocess))
 
     def content_table(
         self,
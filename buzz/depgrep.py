@@ -0,0 +1,714 @@
+"""
+buzz: vectorised depgrep
+
+depgrep compiles a query into a function that is applied to every row of the
+data. Here, the same query language is instead compiled into operations over
+whole columns: attribute tests become boolean masks, worked out once for each
+distinct value in a column, and relations between tokens become index
+arithmetic over the position of each token's governor.
+
+Results are the same as those of depgrep, including its quirks. Queries using
+features that are not handled here (node labels, macros, some rare operators),
+or data whose sentences are not complete, raise Unsupported, so that the
+caller can fall back to depgrep itself.
+"""
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+import pyparsing
+
+ROOT = "ROOT"
+
+ATTRIBUTES = "siwlxpmgfeo"
+
+# stands in for the node of each word, in query templates run by _depgrep_pairs
+SLOT = 'l"<word>"'
+
+
+class Unsupported(Exception):
+    """
+    The query, or the data, needs depgrep's row by row engine
+    """
+
+    pass
+
+
+class _Tokens(object):
+    """
+    Column arrays for one DataFrame, plus lazily made governor arrays, and
+    the masks of query parts already worked out over them
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.size = len(df)
+        self.rows = np.arange(self.size)
+        self.masks = dict()
+        self._tree = None
+
+    def column(self, name):
+        if name not in self.df.columns:
+            raise Unsupported(f"No column {name}")
+        return self.df[name]
+
+    def _ints(self, name):
+        column = self.column(name)
+        if not pd.api.types.is_integer_dtype(column.dtype):
+            raise Unsupported(f"Column {name} is not integers")
+        return column.values.astype(np.int64)
+
+    @property
+    def tree(self):
+        """
+        head: row number of each token's governor, -1 for root
+        sent_len: length of each token's sentence
+        """
+        if self._tree is not None:
+            return self._tree
+        if not self.size:
+            raise Unsupported("No data")
+        i, g = self._ints("i"), self._ints("g")
+        # sentences must be complete: token numbers run from 1, without gaps
+        if i[0] != 1 or not ((i[1:] == 1) | (i[1:] == i[:-1] + 1)).all():
+            raise Unsupported("Incomplete sentences")
+        starts = np.flatnonzero(i == 1)
+        lengths = np.diff(np.append(starts, self.size))
+        sent_len = np.repeat(lengths, lengths)
+        if (g < 0).any() or (g > sent_len).any():
+            raise Unsupported("Governor outside sentence")
+        head = np.where(g > 0, self.rows - i + g, -1)
+        self._tree = dict(i=i, head=head, sent_len=sent_len)
+        return self._tree
+
+    def check_sent_len(self):
+        """
+        depgrep finds sentences using the sent_len metadata, so it must be right
+        """
+        if not np.array_equal(self._ints("sent_len"), self.tree["sent_len"]):
+            raise Unsupported("sent_len does not match sentences")
+
+    def governed_by(self, mask):
+        """
+        For each token, do any of its dependents match mask?
+        """
+        head = self.tree["head"]
+        out = np.zeros(self.size, dtype=bool)
+        out[head[mask & (head >= 0)]] = True
+        return out
+
+    def governor_is(self, mask, on_root=False):
+        """
+        For each token, does its governor match mask?
+        """
+        head = self.tree["head"]
+        return np.where(head >= 0, mask[np.maximum(head, 0)], on_root)
+
+    def dependent_counts(self, mask=None):
+        """
+        For each token, how many of its dependents match mask?
+        """
+        head = self.tree["head"]
+        keep = head >= 0 if mask is None else mask & (head >= 0)
+        return np.bincount(head[keep], minlength=self.size)
+
+    def shift(self, mask, by, wrap=False):
+        """
+        For each token n, does token n + by match? Like indexing the rows,
+        negative numbers can wrap around to the end, but only with wrap
+        """
+        out = np.zeros(self.size, dtype=bool)
+        target = self.rows + by
+        if wrap:
+            ok = (target < self.size) & (target >= -self.size)
+            target = target % max(self.size, 1)
+        else:
+            ok = (target < self.size) & (target >= 0)
+        out[ok] = mask[target[ok]]
+        return out
+
+    def any_between(self, mask, starts, ends):
+        """
+        For each token, do any of the rows from starts to ends match mask?
+        """
+        counts = np.concatenate([[0], np.cumsum(mask)])
+        starts = np.clip(starts, 0, self.size)
+        ends = np.clip(ends, 0, self.size)
+        return (ends > starts) & (counts[ends] - counts[np.minimum(starts, ends)] > 0)
+
+
+class _Node(object):
+    """
+    A compiled part of a query, true or false for every token
+    """
+
+    # the same for parts written the same way, or None if it cannot be shared
+    key = None
+
+    def mask(self, tokens):
+        raise NotImplementedError()  # noqa
+
+    def shared(self, tokens):
+        """
+        mask, worked out only once for each key over the same tokens
+        """
+        masks = getattr(tokens, "masks", None)
+        if masks is None or self.key is None:
+            return self.mask(tokens)
+        if self.key not in masks:
+            masks[self.key] = self.mask(tokens)
+        return masks[self.key]
+
+    def pairs(self, tokens, slot):
+        """
+        Matches as (row, word) pairs, coded as row * slot.size + word, if
+        the slot is in this part of the query. Otherwise, just the mask
+        """
+        return self.shared(tokens)
+
+    def root(self, tokens):
+        """
+        Does the pretend governor of root tokens, the string ROOT, match?
+        """
+        raise Unsupported("Relation from ROOT")
+
+
+class _Attribute(_Node):
+    """
+    A test on one column, like l/regex/ or X"NOUN". Lower case attributes
+    are case insensitive
+    """
+
+    def __init__(self, token):
+        self.key = token
+        attr, body = token[0], token[1:]
+        self.column = attr.lower()
+        self.case_sensitive = attr.isupper()
+        if not self.case_sensitive:
+            body = body.lower()
+        if body.startswith('"'):
+            body = body[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+            literals = set(body.split(","))
+            self.test = literals.__contains__
+        else:
+            try:
+                self.test = re.compile(body[1:-1]).search
+            except re.error as err:
+                raise Unsupported(str(err)) from err
+
+    def _value_matches(self, value):
+        try:
+            value = value if self.case_sensitive else value.lower()
+            return bool(self.test(value))
+        # depgrep would fail on this row, if it ever looked at it
+        except (AttributeError, TypeError):
+            return False
+
+    def mask(self, tokens):
+        column = tokens.column(self.column)
+        if column.dtype.name == "category":
+            codes, uniques = column.cat.codes.values, column.cat.categories
+        else:
+            codes, uniques = pd.factorize(column.values)
+        matches = np.array([self._value_matches(i) for i in uniques] + [False], dtype=bool)
+        # code -1, for missing values, is the last one
+        return matches[codes]
+
+    def pairs(self, tokens, slot):
+        if self.key == slot.key:
+            return slot.codes
+        return self.shared(tokens)
+
+    def root(self, tokens):
+        return self._value_matches(ROOT)
+
+
+def _key(node, parts):
+    """
+    Key for a node made of parts, if they all have one
+    """
+    keys = [part.key for part in parts]
+    return None if None in keys else (type(node).__name__, *keys)
+
+
+class _And(_Node):
+    def __init__(self, parts):
+        self.parts = parts
+        self.key = _key(self, parts)
+
+    def mask(self, tokens):
+        out = self.parts[0].shared(tokens)
+        for part in self.parts[1:]:
+            out = out & part.shared(tokens)
+        return out
+
+    def pairs(self, tokens, slot):
+        found = [part.pairs(tokens, slot) for part in self.parts]
+        masks = [i for i in found if i.dtype == bool]
+        codes = [i for i in found if i.dtype != bool]
+        if not codes:
+            return self.shared(tokens)
+        out = functools.reduce(np.intersect1d, codes)
+        for mask in masks:
+            out = out[mask[out // slot.size]]
+        return out
+
+    def root(self, tokens):
+        return all(part.root(tokens) for part in self.parts)
+
+
+class _Or(_And):
+    def mask(self, tokens):
+        out = self.parts[0].shared(tokens)
+        for part in self.parts[1:]:
+            out = out | part.shared(tokens)
+        return out
+
+    def pairs(self, tokens, slot):
+        found = [part.pairs(tokens, slot) for part in self.parts]
+        if all(i.dtype == bool for i in found):
+            return self.shared(tokens)
+        # a match without the slot would be a match for every word
+        if any(i.dtype == bool for i in found):
+            raise Unsupported("Alternative without the slot")
+        return functools.reduce(np.union1d, found)
+
+    def root(self, tokens):
+        return any(part.root(tokens) for part in self.parts)
+
+
+class _Not(_Node):
+    def __init__(self, part):
+        self.part = part
+        self.key = _key(self, [part])
+
+    def mask(self, tokens):
+        return ~self.part.shared(tokens)
+
+    def pairs(self, tokens, slot):
+        found = self.part.pairs(tokens, slot)
+        if found.dtype != bool:
+            raise Unsupported("Negated slot")
+        return self.shared(tokens)
+
+    def root(self, tokens):
+        return not self.part.root(tokens)
+
+
+class _Same(_Not):
+    """
+    A = B: a token matching both
+    """
+
+    def mask(self, tokens):
+        return self.part.shared(tokens)
+
+    def pairs(self, tokens, slot):
+        return self.part.pairs(tokens, slot)
+
+    def root(self, tokens):
+        return self.part.root(tokens)
+
+
+class _Relation(_Node):
+    """
+    A relation between each token and others, with predicate for the others
+    """
+
+    def __init__(self, operator, predicate):
+        self.operator = operator
+        self.predicate = predicate
+        self.places = None
+        if operator[0] in "+-" and operator[1:].isdigit():
+            self.operator, self.places = operator[0] + "N", int(operator[1:])
+        if self.operator not in RELATIONS:
+            raise Unsupported(f"Operator {operator}")
+        if predicate.key is not None:
+            self.key = (operator, predicate.key)
+
+    def mask(self, tokens):
+        return RELATIONS[self.operator](self, tokens, self.predicate.shared(tokens))
+
+    def pairs(self, tokens, slot):
+        found = self.predicate.pairs(tokens, slot)
+        if found.dtype == bool:
+            return self.shared(tokens)
+        if self.operator not in LINKS:
+            raise Unsupported(f"Operator {self.operator} with the slot")
+        # each row is a match for the words its linked rows match
+        rows, linked = LINKS[self.operator](self, tokens)
+        order = np.argsort(linked, kind="stable")
+        rows, linked = rows[order], linked[order]
+        found_rows, words = found // slot.size, found % slot.size
+        starts = np.searchsorted(linked, found_rows, side="left")
+        counts = np.searchsorted(linked, found_rows, side="right") - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = rows[np.repeat(starts, counts) + offsets]
+        return np.unique(rows * slot.size + np.repeat(words, counts))
+
+
+def _governs(rel, tokens, mask):
+    tokens.check_sent_len()
+    return tokens.governed_by(mask)
+
+
+def _depends_on(rel, tokens, mask):
+    # root tokens have the string ROOT as their governor
+    on_root = rel.predicate.root(tokens) if (tokens.tree["head"] < 0).any() else False
+    return tokens.governor_is(mask, on_root=on_root)
+
+
+def _dominates(rel, tokens, mask):
+    tokens.check_sent_len()
+    # depgrep looks at most five levels down
+    out = np.zeros(tokens.size, dtype=bool)
+    level = mask
+    for _ in range(5):
+        level = tokens.governed_by(level)
+        out |= level
+    return out
+
+
+def _dominated_by(rel, tokens, mask):
+    tree = tokens.tree
+    head, i = tree["head"], tree["i"]
+    # depgrep's quirk: for root tokens, it checks the row before the sentence
+    before = mask[(tokens.rows - i) % tokens.size]
+    out = np.where(head < 0, before, False)
+    # and otherwise, up to ten governors up the tree
+    current = head.copy()
+    for _ in range(10):
+        ok = current >= 0
+        out[ok] |= mask[current[ok]]
+        current[ok] = head[current[ok]]
+    return out
+
+
+def _only_dependent(rel, tokens, mask):
+    tokens.check_sent_len()
+    return (tokens.dependent_counts() == 1) & tokens.governed_by(mask)
+
+
+def _only_child(rel, tokens, mask):
+    tokens.check_sent_len()
+    head = tokens.tree["head"]
+    safe = np.maximum(head, 0)
+    only = (head >= 0) & (head[safe] >= 0) & (tokens.dependent_counts()[safe] == 1)
+    return only & mask[safe]
+
+
+def _precedes_immediately(rel, tokens, mask):
+    return tokens.shift(mask, 1)
+
+
+def _follows_immediately(rel, tokens, mask):
+    # the first row has the last row before it
+    return tokens.shift(mask, -1, wrap=True)
+
+
+def _precedes(rel, tokens, mask):
+    # depgrep's quirk: everything up to row sent_len, not to the sentence end
+    tokens.check_sent_len()
+    return tokens.any_between(mask, tokens.rows + 1, tokens.tree["sent_len"])
+
+
+def _follows(rel, tokens, mask):
+    i = tokens.tree["i"]
+    return tokens.any_between(mask, tokens.rows + 1 - i, tokens.rows)
+
+
+def _precedes_by(rel, tokens, mask):
+    return tokens.shift(mask, rel.places)
+
+
+def _follows_by(rel, tokens, mask):
+    return tokens.shift(mask, -rel.places, wrap=True)
+
+
+def _sister_of(rel, tokens, mask):
+    tokens.check_sent_len()
+    head = tokens.tree["head"]
+    safe = np.maximum(head, 0)
+    # dependents of the same governor matching mask, not counting this token
+    others = tokens.dependent_counts(mask)[safe] - (mask & (head >= 0))
+    return (head >= 0) & (others > 0)
+
+
+RELATIONS = {
+    "->": _governs,
+    "<-": _depends_on,
+    "->>": _dominates,
+    "<<-": _dominated_by,
+    "->:": _only_dependent,
+    "<-:": _only_child,
+    "+": _precedes_immediately,
+    "-": _follows_immediately,
+    "<|": _precedes,
+    "|>": _follows,
+    "+N": _precedes_by,
+    "-N": _follows_by,
+    "$": _sister_of,
+    "%": _sister_of,
+}
+
+
+def _ancestor_links(tokens, levels):
+    """
+    Each row paired with its governors, up to levels up the tree
+    """
+    head = tokens.tree["head"]
+    rows, linked = list(), list()
+    current = head.copy()
+    for _ in range(levels):
+        ok = current >= 0
+        rows.append(tokens.rows[ok])
+        linked.append(current[ok])
+        current = np.where(ok, head[np.maximum(current, 0)], -1)
+    return np.concatenate(rows), np.concatenate(linked)
+
+
+def _shift_links(tokens, by, wrap=False):
+    target = tokens.rows + by
+    if wrap:
+        ok = (target < tokens.size) & (target >= -tokens.size)
+        target = target % max(tokens.size, 1)
+    else:
+        ok = (target < tokens.size) & (target >= 0)
+    return tokens.rows[ok], target[ok]
+
+
+def _governs_links(rel, tokens):
+    tokens.check_sent_len()
+    dependents, governors = _ancestor_links(tokens, 1)
+    return governors, dependents
+
+
+def _depends_on_links(rel, tokens):
+    # the slot never matches ROOT, so root tokens are left out
+    return _ancestor_links(tokens, 1)
+
+
+def _dominates_links(rel, tokens):
+    tokens.check_sent_len()
+    below, above = _ancestor_links(tokens, 5)
+    return above, below
+
+
+def _dominated_by_links(rel, tokens):
+    below, above = _ancestor_links(tokens, 10)
+    # depgrep's quirk, as in _dominated_by
+    tree = tokens.tree
+    roots = np.flatnonzero(tree["head"] < 0)
+    before = (roots - tree["i"][roots]) % tokens.size
+    return np.concatenate([below, roots]), np.concatenate([above, before])
+
+
+def _only_dependent_links(rel, tokens):
+    tokens.check_sent_len()
+    dependents, governors = _ancestor_links(tokens, 1)
+    only = tokens.dependent_counts()[governors] == 1
+    return governors[only], dependents[only]
+
+
+def _only_child_links(rel, tokens):
+    tokens.check_sent_len()
+    dependents, governors = _ancestor_links(tokens, 1)
+    head = tokens.tree["head"]
+    only = (head[governors] >= 0) & (tokens.dependent_counts()[governors] == 1)
+    return dependents[only], governors[only]
+
+
+def _sister_of_links(rel, tokens):
+    tokens.check_sent_len()
+    dependents, governors = _ancestor_links(tokens, 1)
+    df = pd.DataFrame(dict(row=dependents, head=governors))
+    both = df.merge(df, on="head")
+    both = both[both.row_x != both.row_y]
+    return both.row_x.values, both.row_y.values
+
+
+LINKS = {
+    "->": _governs_links,
+    "<-": _depends_on_links,
+    "->>": _dominates_links,
+    "<<-": _dominated_by_links,
+    "->:": _only_dependent_links,
+    "<-:": _only_child_links,
+    "+": lambda rel, tokens: _shift_links(tokens, 1),
+    "-": lambda rel, tokens: _shift_links(tokens, -1, wrap=True),
+    "+N": lambda rel, tokens: _shift_links(tokens, rel.places),
+    "-N": lambda rel, tokens: _shift_links(tokens, -rel.places, wrap=True),
+    "$": _sister_of_links,
+    "%": _sister_of_links,
+}
+
+
+def _unsupported_action(_s, _l, tokens):
+    raise Unsupported(f"Cannot vectorise {tokens}")
+
+
+def _node_action(_s, _l, tokens):
+    if tokens[0] == "'":
+        tokens = tokens[1:]
+    if len(tokens) > 1:
+        return _Or([_node_action(_s, _l, [node]) for node in tokens[::2]])
+    token = tokens[0]
+    if isinstance(token, _Node):
+        return token
+    if token[0].lower() not in ATTRIBUTES or token.startswith("i@"):
+        raise Unsupported(f"Cannot vectorise {token}")
+    return _Attribute(token)
+
+
+def _node_label_action(_s, _l, tokens):
+    if len(tokens) > 1:
+        raise Unsupported("Node labels")
+    return tokens[0]
+
+
+def _relation_action(_s, _l, tokens):
+    negated = tokens[0] == "!"
+    if negated:
+        tokens = tokens[1:]
+    if tokens[0] == "[":
+        relation = tokens[1]
+    else:
+        operator, predicate = tokens
+        if operator in {"=", "&"}:
+            relation = _Same(predicate)
+        else:
+            relation = _Relation(operator, predicate)
+    return _Not(relation) if negated else relation
+
+
+def _conjunction_action(_s, _l, tokens, join_char="&"):
+    tokens = [i for i in tokens if i != join_char]
+    if len(tokens) == 1:
+        return tokens[0]
+    return _And(tokens)
+
+
+def _disjunction_action(_s, _l, tokens):
+    tokens = [i for i in tokens if i != "|"]
+    if len(tokens) == 1:
+        return tokens[0]
+    return _Or(tokens)
+
+
+def _exprs_action(_s, _l, tokens):
+    return _disjunction_action(_s, _l, [i for i in tokens if i != ";"])
+
+
+@functools.lru_cache(maxsize=1)
+def _build_parser():
+    """
+    depgrep's grammar, with actions that build _Nodes rather than functions
+    """
+    op = pyparsing.Optional("!") + pyparsing.Regex(r"[$%,.<>&-\|\+][%,.<>0-9\-\':\|]*")
+    node_attr = pyparsing.Regex(r"[siwlxpmgfeoSIWLXPMGFEO][/\"][^/\"]+[/\"]")
+    node_literal = pyparsing.Regex(r"__|\*")
+    expr = pyparsing.Forward()
+    relations = pyparsing.Forward()
+    parens = pyparsing.Literal("(") + expr + ")"
+    node_label = pyparsing.Regex("[A-Za-z0-9]")
+    node_label_use = pyparsing.Combine("=" + node_label)
+    node_label_use_pred = node_label_use.copy()
+    macro_name = pyparsing.Regex("[^];:.,&|<>()[$!@%'^=\r\t\n ]+")
+    macro_name.setWhitespaceChars("")
+    macro_use = pyparsing.Combine("@" + macro_name)
+    node_expr = node_label_use_pred | node_attr | macro_use | "*" | node_literal
+    node_expr2 = (
+        node_expr
+        + pyparsing.Literal("=").setWhitespaceChars("")
+        + node_label.copy().setWhitespaceChars("")
+    ) | node_expr
+    node = parens | (
+        pyparsing.Optional("'") + node_expr2 + pyparsing.ZeroOrMore("|" + node_expr)
+    )
+    brackets = pyparsing.Optional("!") + "[" + relations + "]"
+    relation = brackets | (op + node)
+    rel_conjunction = pyparsing.Forward()
+    rel_conjunction << (relation + pyparsing.ZeroOrMore(pyparsing.Optional("&") + rel_conjunction))
+    relations << rel_conjunction + pyparsing.ZeroOrMore("|" + relations)
+    expr << node + pyparsing.Optional(relations)
+    expr_labeled = node_label_use + pyparsing.Optional(relations)
+    expr2 = expr + pyparsing.ZeroOrMore(":" + expr_labeled)
+    macro_defn = pyparsing.Literal("@") + pyparsing.White().suppress() + macro_name + expr2
+    exprs = (
+        pyparsing.Optional(macro_defn + pyparsing.ZeroOrMore(";" + macro_defn) + ";")
+        + expr2
+        + pyparsing.ZeroOrMore(";" + (macro_defn | expr2))
+        + pyparsing.ZeroOrMore(";").suppress()
+    )
+
+    node_label_use.setParseAction(_unsupported_action)
+    node_label_use_pred.setParseAction(_unsupported_action)
+    macro_use.setParseAction(_unsupported_action)
+    macro_defn.setParseAction(_unsupported_action)
+    expr_labeled.setParseAction(_unsupported_action)
+    node.setParseAction(_node_action)
+    node_expr2.setParseAction(_node_label_action)
+    parens.setParseAction(lambda s, _l, t: t[1])
+    relation.setParseAction(_relation_action)
+    rel_conjunction.setParseAction(_conjunction_action)
+    relations.setParseAction(_disjunction_action)
+    expr.setParseAction(_conjunction_action)
+    expr2.setParseAction(functools.partial(_conjunction_action, join_char=":"))
+    exprs.setParseAction(_exprs_action)
+    return exprs.ignore("#" + pyparsing.restOfLine)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(query):
+    """
+    Turn a depgrep query into a _Node, raising Unsupported if we can't
+    """
+    if isinstance(query, bytes):
+        query = query.decode()
+    try:
+        return list(_build_parser().parseString(query, parseAll=True))[0]
+    except pyparsing.ParseBaseException as err:
+        raise Unsupported(str(err)) from err
+
+
+def _vectorised_depgrep(query, df, tokens=None):
+    """
+    Run a depgrep query over df, which has file, s and i as columns rather
+    than in the index, as in Searcher._depgrep_iteration.
+
+    tokens: _Tokens for df, shared by queries run over the same data, so that
+    parts they have in common are only worked out once
+
+    Return: boolean array of matches
+    """
+    return _compile(query).shared(tokens or _Tokens(df))
+
+
+class _Slot(object):
+    """
+    The rows standing in for each word, as pairs coded like _Node.pairs
+    """
+
+    def __init__(self, rows, words, size):
+        self.key = SLOT
+        self.size = size
+        self.codes = np.unique(np.asarray(rows, dtype=np.int64) * size + words)
+
+
+def _depgrep_pairs(template, df, rows, words, n_words, tokens=None):
+    """
+    Run a query template over df for many words at once, as if the node for
+    each word had been put into it in turn. The template is compiled just once.
+
+    template: query with {query} where the node for a word goes
+    rows, words: the rows matching the node for each word, by its number
+    tokens: _Tokens for df, to share between queries
+
+    Return: row and word number of each match, by row
+    """
+    node = _compile(template.format(query=SLOT))
+    found = node.pairs(tokens or _Tokens(df), _Slot(rows, words, n_words))
+    if found.dtype == bool:
+        raise Unsupported("No slot in template")
+    return found // n_words, found % n_words
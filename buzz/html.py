@@ -6,6 +6,17 @@ from buzz.utils import cast
 
 SPEAKER_REGEX = re.compile(r"^([A-Z0-9-_]{1,30}):\s*", re.MULTILINE)
 
+# a < that cannot start a tag, because no > closes it before the next <
+STRAY_BRACKET = re.compile(r"<(?![A-Za-z/!?][^<>]*>)")
+
+
+def _escape_stray_brackets(text):
+    """
+    Escape any < in text that does not start a tag, so that the parser keeps
+    it as text rather than swallowing what comes after it
+    """
+    return re.sub(STRAY_BRACKET, "&lt;", text)
+
 
 class MetadataStripper(HTMLParser):
     """
@@ -37,7 +48,11 @@ class InputParser(HTMLParser):
         self.num_elements = 0
         self.num_done = 0
         self.speakers = speakers
-        self.stripper = MetadataStripper()
+        # the text without its tags, and (start, end, features) of annotated
+        # text, as offsets into it
+        self.chunks = list()
+        self.spans = list()
+        self.position = 0
 
     def _has_sent_meta(self):
         if "<meta" not in self.text:
@@ -58,10 +73,12 @@ class InputParser(HTMLParser):
 
     def feed(self, text, *args, **kwargs):
         self.text = text
-        self.stripper.feed(text)
-        self.clean_text = self.stripper.text
         self.num_elements = text.count("<meta")
-        return super().feed(text, *args, **kwargs)
+        return super().feed(_escape_stray_brackets(text), *args, **kwargs)
+
+    @property
+    def clean_text(self):
+        return "".join(self.chunks)
 
     def handle_data(self, data):
         """
@@ -73,10 +90,69 @@ class InputParser(HTMLParser):
         # we should use clean_text for this, which is not used elsewhere rn.
         text_before_this = self.text[:offset]
         nth = text_before_this.count(data)
+        clean = data
         if not offset and self.speakers:
             found_speaker = re.search(SPEAKER_REGEX, data)
             if found_speaker:
                 self.sent_meta["speaker"] = found_speaker.group(1)
+            # as MetadataStripper does
+            clean = re.sub(SPEAKER_REGEX, "", data)
+        start = self.position
+        self.chunks.append(clean)
+        self.position += len(clean)
         if self.tmp:
             self.result[(data, nth)] = self.tmp
+            self.spans.append((start, self.position, self.tmp))
             self.tmp = None
+
+
+class DocumentParser(object):
+    """
+    Strip metadata from a whole document, parsing each line on its own with
+    InputParser, keeping for each line its sentence metadata, and for each
+    annotated span its offsets in the stripped text
+    """
+
+    def __init__(self, speakers=True):
+        self.speakers = speakers
+        self.chunks = list()
+        self.line_starts = list()
+        self.sent_meta = list()
+        # does the line have annotated spans
+        self.line_spans = list()
+        self.spans = list()  # (start, end, features)
+
+    def feed(self, text):
+        position = sum(len(i) for i in self.chunks)
+        for n, line in enumerate(text.split("\n")):
+            if n:
+                self.chunks.append("\n")
+                position += 1
+            self.line_starts.append(position)
+            sent_meta, clean, spans = self._parse_line(line)
+            self.sent_meta.append(sent_meta)
+            self.line_spans.append(bool(spans))
+            self.spans += [(position + i, position + j, tmp) for i, j, tmp in spans]
+            self.chunks.append(clean)
+            position += len(clean)
+
+    def _parse_line(self, line):
+        """
+        Get sentence metadata, stripped text and annotated spans of one line
+        """
+        # nothing for the html parser to do, but maybe take off the speaker
+        if "<" not in line and "&" not in line:
+            found_speaker = self.speakers and re.search(SPEAKER_REGEX, line)
+            if not found_speaker:
+                return dict(), line, list()
+            clean = re.sub(SPEAKER_REGEX, "", line)
+            return dict(speaker=found_speaker.group(1)), clean, list()
+        # tags, and stray brackets, never carry over to the next line
+        parser = InputParser(speakers=self.speakers)
+        parser.feed(line)
+        parser.close()
+        return parser.sent_meta, parser.clean_text, parser.spans
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
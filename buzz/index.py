@@ -0,0 +1,236 @@
+"""
+buzz: inverted indexes, mapping each value of a column to the rows it occurs in
+
+Datasets build these for their categorical columns the first time a column is
+filtered by exact match. Parsed corpora on disk keep one for every column,
+stored next to their load cache, so that `corpus.just.lemma.run` only needs to
+read the files that actually contain a match.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .utils import _fingerprint
+
+# columns we never index: the index levels, and things too unique to be useful
+NOT_INDEXED = {"file", "s", "i", "_n", "parse"}
+
+INDEX_DIRNAME = "index"
+
+
+class Postings(object):
+    """
+    Sorted row positions for each (stringified) value of a column
+    """
+
+    def __init__(self, keys, starts, rows, source=None):
+        self.keys = keys  # str value: slot
+        self.starts = starts  # rows for slot n are rows[starts[n]:starts[n+1]]
+        self.rows = rows
+        # what they were built from, to tell when a Dataset's column has changed
+        self.source = _fingerprint(source) if source is not None else None
+
+    @classmethod
+    def from_codes(cls, codes, uniques, source=None):
+        """
+        Build from integer codes (-1 for nothing) and the string each code means
+        """
+        codes = np.asarray(codes)
+        order = np.argsort(codes, kind="stable")
+        present = codes[order] >= 0
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        rows = order[present].astype(np.int64)
+        keys = {str(k): n for n, k in enumerate(uniques)}
+        return cls(keys, starts, rows, source=source)
+
+    @classmethod
+    def from_categorical(cls, categorical):
+        """
+        Build from a pd.Categorical, reusing its codes rather than comparing strings
+        """
+        # several categories could be the same as strings, e.g. 1 and "1"
+        strings = list(categorical.categories.astype(str)) + ["nan"]
+        remap, uniques = pd.factorize(strings)
+        codes = remap[categorical.codes]  # -1, for nan, becomes the last one
+        return cls.from_codes(codes, uniques, source=categorical)
+
+    def get(self, entry):
+        """
+        Sorted row positions matching a str, or any of an iterable of str
+        """
+        if isinstance(entry, str):
+            entry = [entry]
+        found = list()
+        for value in set(entry):
+            slot = self.keys.get(value)
+            if slot is not None:
+                found.append(self.rows[self.starts[slot] : self.starts[slot + 1]])
+        if not found:
+            return np.array([], dtype=np.int64)
+        if len(found) == 1:
+            return found[0]
+        return np.sort(np.concatenate(found))
+
+
+def _can_use_postings(entry, case=True, exact_match=False, multiword=False, **kwargs):
+    """
+    Can this Filter query be answered by looking up exact strings?
+    """
+    if not case or not exact_match or multiword:
+        return False
+    if isinstance(entry, str):
+        return not kwargs.get("regex")
+    if isinstance(entry, (list, set, tuple)):
+        return bool(entry) and all(isinstance(i, str) for i in entry)
+    return False
+
+
+def _dataset_postings(df, column):
+    """
+    Get postings for a categorical column of a Dataset, building them if need be.
+
+    They are rebuilt whenever the column has changed since last time, whether
+    it was replaced or edited in place.
+    """
+    store = getattr(df, "_postings", None)
+    if store is None or column not in df.columns:
+        return
+    series = df[column]
+    if not isinstance(series, pd.Series) or series.dtype.name != "category":
+        return
+    postings = store.get(column)
+    if postings is None or postings.source != _fingerprint(series.array):
+        postings = Postings.from_categorical(series.array)
+        store[column] = postings
+    return postings
+
+
+class CorpusIndex(object):
+    """
+    Postings for every column of a parsed corpus, with rows numbered from the
+    start of the corpus (as in the `_n` column of the loaded corpus)
+    """
+
+    def __init__(self, corpus):
+        from .cache import CorpusCache
+
+        self.corpus = corpus
+        self.cache = CorpusCache(corpus)
+        self.path = os.path.join(self.cache.path, INDEX_DIRNAME)
+        self.manifest = self._read_manifest()
+        fingerprint = self._fingerprint()
+        if fingerprint is None or self.manifest.get("files") != fingerprint:
+            self.build()
+        self.bounds = np.concatenate([[0], np.cumsum(self.manifest["rows"])])
+        self._postings = dict()
+
+    def _fingerprint(self):
+        """
+        What the corpus looks like now: None if some file has no fresh shard
+        """
+        out = list()
+        for file in self.corpus.files:
+            if not self.cache.is_fresh(file):
+                return
+            key = self.cache._key(file)
+            entry = self.cache.changed.get(key) or self.cache.files[key]
+            out.append([key, entry["hash"]])
+        return out
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, "manifest.json"), "r") as fo:
+                return json.load(fo)
+        except (OSError, ValueError):
+            return dict()
+
+    def _column_path(self, column):
+        name = hashlib.sha1(column.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, name)
+
+    def build(self):
+        """
+        Read every file (from the cache where possible) and index all columns
+        """
+        values, rows = dict(), list()
+        start = 0
+        for file in self.corpus.files:
+            df = self.cache.load_file(file)
+            if df is None:
+                rows.append(0)
+                continue
+            for column in df.columns:
+                if column in NOT_INDEXED:
+                    continue
+                strung = df[column].astype(str).values
+                values.setdefault(column, list()).append((start, strung))
+            rows.append(len(df))
+            start += len(df)
+        self.cache.save(self.corpus.files)
+        os.makedirs(self.path, exist_ok=True)
+        columns = dict()
+        for column, parts in values.items():
+            # rows of files without this column get code -1, and are never matched
+            codes = np.full(start, -1, dtype=np.int64)
+            uniques = dict()
+            for offset, strung in parts:
+                part_codes, part_uniques = pd.factorize(strung)
+                remap = [uniques.setdefault(u, len(uniques)) for u in part_uniques]
+                remap = np.array(remap, dtype=np.int64)
+                codes[offset : offset + len(strung)] = remap[part_codes]
+            postings = Postings.from_codes(codes, list(uniques))
+            stem = self._column_path(column)
+            np.save(stem + ".starts.npy", postings.starts)
+            np.save(stem + ".rows.npy", postings.rows)
+            columns[column] = list(uniques)
+        self.manifest = dict(files=self._fingerprint(), rows=rows, columns=columns)
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w") as fo:
+            json.dump(self.manifest, fo)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+
+    def postings(self, column):
+        """
+        Get the postings for a column, or None if no file has this column
+        """
+        if column not in self.manifest["columns"]:
+            return
+        if column not in self._postings:
+            stem = self._column_path(column)
+            starts = np.load(stem + ".starts.npy", mmap_mode="r")
+            rows = np.load(stem + ".rows.npy", mmap_mode="r")
+            keys = {k: n for n, k in enumerate(self.manifest["columns"][column])}
+            self._postings[column] = Postings(keys, starts, rows)
+        return self._postings[column]
+
+    def filter(self, column, entry, inverse=False, usecols=None):
+        """
+        Get the rows matching (or with inverse, not matching) entry in column,
+        reading only the files that have some.
+
+        Return: list of DataFrames, one for each file, as File.load makes them
+        """
+        postings = self.postings(column)
+        found = postings.get(entry) if postings is not None else np.array([], dtype=np.int64)
+        # which file each match is in
+        where = np.searchsorted(self.bounds, found, side="right") - 1
+        # with no matches at all, every file is needed to get the columns right
+        everything = inverse or not len(found)
+        out = list()
+        for n, file in enumerate(self.corpus.files):
+            local = found[where == n] - self.bounds[n]
+            size = self.bounds[n + 1] - self.bounds[n]
+            if inverse:
+                local = np.setdiff1d(np.arange(size), local, assume_unique=True)
+            if not len(local) and not everything:
+                continue
+            kwargs = dict(usecols=list(usecols)) if usecols else dict()
+            df = self.cache.load_file(file, **kwargs)
+            if df is not None:
+                out.append(df.iloc[local])
+        self.cache.save(self.corpus.files)
+        return out
@@ -0,0 +1,240 @@
+"""
+buzz: reading saved datasets without loading them all into memory
+
+Saved Datasets are Arrow files, which can be memory-mapped. Only the columns
+and rows that are asked for are ever turned into pandas objects, so corpora
+larger than memory can be worked with, and processes reading the same file
+share one copy of it in the page cache.
+"""
+import os
+
+import numpy as np
+
+INDEX_COLUMNS = ["file", "s", "i"]
+
+
+def _name_from_path(path):
+    """
+    Get the dataset name from the path it was saved to
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.endswith("-parsed"):
+        name = name[:-7]
+    return name
+
+
+def _read_table(path, columns=None, memory_map=True):
+    """
+    Get a saved dataset as a pyarrow Table, memory-mapping feather files
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, memory_map=memory_map)
+    from pyarrow import feather
+
+    return feather.read_table(path, columns=columns, memory_map=memory_map)
+
+
+def _mapped_table(path):
+    """
+    Memory-map a saved dataset as a pyarrow Table.
+
+    Return: Table, and whether its data is really read from the mapped file.
+    It is not for compressed feather files, which pyarrow decompresses into
+    memory, nor for parquet files, which are always decoded.
+    """
+    import pyarrow as pa
+
+    if path.endswith(".parquet"):
+        return _read_table(path, memory_map=True), False
+    source = pa.memory_map(path)
+    whole = source.read_buffer()
+    source.seek(0)
+    try:
+        table = pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        # feather version 1, which is never compressed
+        return _read_table(path, memory_map=True), True
+    start, end = whole.address, whole.address + whole.size
+    buffers = (
+        buf
+        for column in table.columns
+        for chunk in column.chunks
+        for buf in chunk.buffers()
+        if buf is not None
+    )
+    return table, all(start <= buf.address < end for buf in buffers)
+
+
+def _column_names(path):
+    """
+    Get the names of the columns in a saved dataset, without reading its data
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    return _read_table(path, memory_map=True).column_names
+
+
+def _sentence_start(positions, row):
+    """
+    Walk back from row to the first token of its sentence
+    """
+    while row > 0 and positions[row] != 1:
+        row -= 1
+    return row
+
+
+def _slice_rows(table, rows, positions=None):
+    """
+    Slice a Table by rows, starting from the beginning of a sentence so that
+    sentence-level metadata can still be filled forward.
+
+    Return: sliced Table, number of leading rows to drop after filling
+    """
+    if isinstance(rows, slice):
+        start, stop, step = rows.indices(table.num_rows)
+        if step != 1:
+            raise ValueError("Row slices cannot have a step")
+    else:
+        start, stop = rows
+        start, stop = max(start, 0), min(stop, table.num_rows)
+    if stop <= start:
+        return table.slice(0, 0), 0
+    if positions is None:
+        positions = table.column("i").to_pandas().values
+    first = _sentence_start(positions, start)
+    return table.slice(first, stop - first), start - first
+
+
+def _table_to_dataset(table, name, skip=0, use_threads=True):
+    """
+    Turn a Table of saved data into a Dataset, as Dataset.load always has
+    """
+    from .dataset import Dataset
+    from .utils import _set_best_data_types
+
+    df = table.to_pandas(use_threads=use_threads)
+    df = df.set_index(INDEX_COLUMNS)
+    # parses stay as strings, made into trees only by what needs them
+    df = df.ffill()
+    if skip:
+        df = df.iloc[skip:]
+    df = _set_best_data_types(df)
+    return Dataset(df, reference=df, name=name)
+
+
+def _load_saved(path, columns=None, rows=None, use_threads=True):
+    """
+    Load some or all of the columns and rows of a saved dataset
+    """
+    if columns is not None:
+        columns = _keep_columns(_column_names(path), columns)
+    table = _read_table(path, columns=columns)
+    skip = 0
+    if rows is not None:
+        table, skip = _slice_rows(table, rows)
+    return _table_to_dataset(table, _name_from_path(path), skip, use_threads)
+
+
+def _keep_columns(available, columns):
+    """
+    Index columns, plus whichever of columns are in the saved data
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    wanted = set(INDEX_COLUMNS) | set(columns)
+    return [i for i in available if i in wanted]
+
+
+class MappedDataset(object):
+    """
+    A saved Dataset, memory-mapped rather than read into memory.
+
+    It has none of Dataset's query methods: use load to get some columns or
+    rows as a Dataset, or chunks to work through all of it a piece at a time.
+    Only feather files saved with compression="uncompressed" are really
+    mapped; `mapped` says whether this one is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = _name_from_path(path)
+        self._table, self.mapped = _mapped_table(path)
+        self._positions = None
+        if not self.mapped:
+            warn = (
+                f"Warning: {path} is compressed, so it has been read into memory. "
+                'Save it with use="feather", compression="uncompressed" to memory-map it.'
+            )
+            print(warn)
+
+    def __len__(self):
+        """
+        Number of rows
+        """
+        return self._table.num_rows
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.name} ({len(self)} rows)>"
+
+    @property
+    def columns(self):
+        """
+        Names of the (non-index) columns in the saved data
+        """
+        return [i for i in self._table.column_names if i not in INDEX_COLUMNS]
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    @property
+    def positions(self):
+        """
+        Token number of each row, read once and kept, used to find sentence starts
+        """
+        if self._positions is None:
+            self._positions = self._table.column("i").to_pandas().values
+        return self._positions
+
+    def load(self, columns=None, rows=None):
+        """
+        Bring some or all of the data into memory as a Dataset
+
+        columns: list of column names to get (the index is always included)
+        rows: slice or (start, stop) tuple. The slice is widened back to the
+        start of its first sentence, so that metadata is filled correctly.
+        """
+        table = self._table
+        if columns is not None:
+            table = table.select(_keep_columns(table.column_names, columns))
+        skip = 0
+        if rows is not None:
+            table, skip = _slice_rows(table, rows, self.positions)
+        return _table_to_dataset(table, self.name, skip)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.load(columns=[key])[key]
+        if isinstance(key, slice):
+            return self.load(rows=key)
+        return self.load(columns=list(key))
+
+    def chunks(self, size=100000, columns=None):
+        """
+        Iterate over the data as Datasets of roughly size rows, never
+        splitting a sentence between chunks
+        """
+        starts = np.flatnonzero(self.positions == 1)
+        start = 0
+        while start < len(self):
+            stop = start + size
+            if stop < len(self):
+                # end the chunk at the next sentence boundary
+                later = starts[np.searchsorted(starts, stop) :]
+                stop = later[0] if len(later) else len(self)
+            yield self.load(columns=columns, rows=(start, stop))
+            start = stop
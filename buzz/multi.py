@@ -3,11 +3,18 @@ buzz: multiprocessing helpers
 """
 import multiprocessing
 import os
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 
 from joblib import delayed
 
+from .constants import LOAD_MAX_BYTES, PARSE_BATCH_SIZE
 from .utils import _get_tqdm, _to_df, _tqdm_close, _tqdm_update
 
+# memory-backed, where the system has it, so that sharing never touches disk
+SHARED_DIR = "/dev/shm"
+
 
 def how_many(multiprocess):
     """
@@ -25,24 +32,140 @@ def how_many(multiprocess):
     return multiprocess
 
 
-@delayed
-def load(files, position, order={}, **kwargs):
+def load_one(file, cache=None, **kwargs):
     """
-    Picklable loader for multiprocessing
+    Picklable loader for a single file, run in a worker process
+
+    cache should be a CorpusCache.for_file copy. When the file is cached, only
+    its new manifest entry comes back: the parent reads the data from the
+    shard itself, rather than having it pickled through a pipe.
+
+    Return: DataFrame or None, and the file's new manifest entry, if any
     """
-    kwa = dict(
-        ncols=120, unit="chunk", desc="Loading", position=position, total=len(files)
-    )
-    t = _get_tqdm()(**kwa)
-    out = []
-    for file in files:
-        df = _to_df(corpus=file, _complete=False, **kwargs)
-        if df is not None and order:
-            df["order"] = order[file.path]
-        out.append(df)
-        _tqdm_update(t)
-    _tqdm_close(t)
-    return out
+    if cache is None:
+        return _to_df(corpus=file, _complete=False, **kwargs), None
+    key = cache._key(file)
+    if not cache.is_fresh(file):
+        df = cache.load(file, **kwargs)
+        # feather could not store it, so it has to be sent back
+        if key not in cache.changed:
+            return df, None
+    return None, cache.changed.get(key)
+
+
+def stream(files, processes, cache=None, max_bytes=LOAD_MAX_BYTES, **kwargs):
+    """
+    Load files in worker processes, yielding (file, DataFrame) in corpus order,
+    each as soon as it and every file before it are done.
+
+    New files are only handed out while the CONLL-U files not yet yielded add
+    up to less than max_bytes on disk. This bounds the work queued up in, and
+    waiting to come back from, the workers. It does not bound what the caller
+    keeps of what is yielded.
+    """
+    sizes = [os.path.getsize(f.path) for f in files]
+    pending, done = dict(), dict()
+    submitted = position = in_flight = 0
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while position < len(files):
+            while submitted < len(files):
+                if pending and in_flight + sizes[submitted] > max_bytes:
+                    break
+                file = files[submitted]
+                one = cache.for_file(file) if cache is not None else None
+                future = pool.submit(load_one, file, cache=one, **kwargs)
+                pending[future] = submitted
+                in_flight += sizes[submitted]
+                submitted += 1
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                n = pending.pop(future)
+                df, entry = future.result()
+                if entry is not None:
+                    cache.changed[cache._key(files[n])] = entry
+                done[n] = df
+            while position in done:
+                df = done.pop(position)
+                if df is None:
+                    df = cache.load(files[position], **kwargs)
+                yield files[position], df
+                in_flight -= sizes[position]
+                position += 1
+
+
+class SharedDataset(object):
+    """
+    A Dataset written once as an uncompressed Arrow file in shared memory, so
+    that worker processes memory-map its columns rather than each being sent
+    a pickled copy. Only the path is pickled.
+    """
+
+    def __init__(self, dataset):
+        import pyarrow as pa
+        from pyarrow import feather
+
+        self.name = getattr(dataset, "_name", None)
+        # arrow gives back object columns of numbers as numbers
+        self.dtypes = {k: v for k, v in dataset.dtypes.items() if v == object}
+        directory = SHARED_DIR if os.path.isdir(SHARED_DIR) else None
+        fd, self.path = tempfile.mkstemp(prefix="buzz-", suffix=".arrow", dir=directory)
+        os.close(fd)
+        try:
+            table = pa.Table.from_pandas(dataset, preserve_index=True)
+            feather.write_feather(table, self.path, compression="uncompressed")
+        except Exception:
+            self.close()
+            raise
+
+    def load(self):
+        """
+        Get the Dataset back, with numeric and categorical columns still in
+        the shared file rather than copied into this process
+        """
+        from pyarrow import feather
+
+        from .dataset import Dataset
+
+        table = feather.read_table(self.path, memory_map=True)
+        df = table.to_pandas(split_blocks=True)
+        for col, dtype in self.dtypes.items():
+            if col in df.columns and df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+        return Dataset(df, name=self.name)
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def shared(dataset, processes):
+    """
+    Share dataset with worker processes as a SharedDataset, removing it after.
+    With one process, or data that Arrow cannot hold, dataset itself is used.
+    """
+    handle = dataset
+    if processes and processes > 1:
+        try:
+            handle = SharedDataset(dataset)
+        except (ImportError, OSError, TypeError, ValueError, NotImplementedError):
+            pass
+    try:
+        yield handle
+    finally:
+        if isinstance(handle, SharedDataset):
+            handle.close()
+
+
+def _unshare(corpus):
+    """
+    Get the Dataset that a worker process was sent, whichever way it was sent
+    """
+    if isinstance(corpus, SharedDataset):
+        return corpus.load()
+    return corpus
 
 
 @delayed
@@ -66,59 +189,102 @@ def read(files, position):
 @delayed
 def search(corpus, queries, position, **kwargs):
     """
-    Picklable searcher for multiprocessing
+    Picklable searcher for multiprocessing, running its queries in one pass
 
-    No need for progress bar  because it is in depgrep
+    No need for progress bar  because it is in run_many
     """
-    out = []
-    for query in queries:
-        res = corpus.depgrep(query, position=position, **kwargs)
-        if res is not None and not res.empty:
-            out.append(res)
-    return out
+    from .search import Searcher
 
+    queries = [str(i) for i in queries]
+    found = Searcher().run_many(_unshare(corpus), queries, position=position, **kwargs)
+    return [res for res in found.values() if not res.empty]
 
-@delayed
-def parse(paths, position, save_as, corpus_name, language, constituencies, speakers, plain_path):
+
+def parse_files(
+    paths, language, constituencies, speakers, plain_path, batch_size=PARSE_BATCH_SIZE, cache=False
+):
     """
-    Parse using multiprocessing, chunks of paths
+    Picklable parser for a group of files, run in a worker process. The model
+    is loaded once for each process, and the files streamed through it.
+
+    cache: also store each parsed file in the load cache. The parent process
+    writes the manifest, from the entries sent back.
+
+    Return: id of the worker process, number of files parsed, and cache entries
     """
-    from .parse import _process_string
+    from .cache import CorpusCache
+    from .parse import _process_files
 
-    kwa = dict(
-        ncols=120, unit="file", desc="Parsing", position=position, total=len(paths)
+    store = None
+    if cache:
+        store = CorpusCache(os.path.join(os.path.dirname(plain_path), "conllu"))
+    parsed = _process_files(
+        paths,
+        language,
+        constituencies,
+        speakers,
+        plain_path,
+        batch_size=batch_size,
+        cache=store,
     )
+    n = sum(1 for _ in parsed)
+    return os.getpid(), n, store.changed if store else dict()
+
+
+def _size_groups(paths, processes, batch_size=PARSE_BATCH_SIZE):
+    """
+    Sort paths biggest file first, and group them so that each group is about
+    the same amount of work: big files on their own, small ones up to batch_size
+    """
+    sizes = {path: os.path.getsize(path) for path in paths}
+    ordered = sorted(paths, key=lambda path: -sizes[path])
+    # several groups per process, so that nobody is left with the last big one
+    target = sum(sizes.values()) / (processes * 4)
+    groups, group, size = list(), list(), 0
+    for path in ordered:
+        group.append(path)
+        size += sizes[path]
+        if len(group) >= batch_size or size >= target:
+            groups.append(group)
+            group, size = list(), 0
+    if group:
+        groups.append(group)
+    return groups
+
+
+def parse(paths, processes, *args, batch_size=PARSE_BATCH_SIZE, cache=False):
+    """
+    Parse files in worker processes, biggest first. Each worker takes the next
+    group of files from a shared queue whenever it is free.
+
+    args are those of parse_files, after paths
+
+    Return: dict of load cache entries for the parsed files, if cache
+    """
+    groups = _size_groups(paths, processes, batch_size)
+    kwa = dict(ncols=120, unit="file", desc="Parsing", total=len(paths))
     t = _get_tqdm()(**kwa)
-    for path in paths:
-        with open(path, "r") as fo:
-            plain = fo.read().strip()
-        _process_string(
-            plain, path, save_as, corpus_name, language, constituencies, speakers, plain_path
-        )
-        _tqdm_update(t)
+    workers, changed = dict(), dict()
+    kwargs = dict(batch_size=batch_size, cache=cache)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(parse_files, group, *args, **kwargs) for group in groups]
+        for future in as_completed(futures):
+            pid, parsed, entries = future.result()
+            changed.update(entries)
+            workers[pid] = workers.get(pid, 0) + parsed
+            t.update(parsed)
+            # files done by each worker
+            t.set_postfix({f"w{n}": v for n, v in enumerate(workers.values(), start=1)})
     _tqdm_close(t)
+    return changed
 
 
 @delayed
-def topology(corpus, queries, position):
+def topology(corpus, searches, counts, position):
     """
-    Topolgy using multiprocessing, chunks of queries
+    Topolgy using multiprocessing, chunks of searches
     """
     # [word, name, query, is_bool, features_of_interest]
     from .topology import _process_chunk
 
-    kwa = dict(
-        ncols=120,
-        unit="query",
-        desc="Surveying",
-        position=position,
-        total=len(queries),
-        postfix="word=...",
-    )
-    t = _get_tqdm()(**kwa)
-    results = []
-    for querybits in queries:
-        results.append(_process_chunk(corpus, *querybits))
-        _tqdm_update(t, postfix=querybits[0])
-    _tqdm_close(t)
-    return results
+    return _process_chunk(_unshare(corpus), searches, counts, position=position)
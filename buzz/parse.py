@@ -1,202 +1,319 @@
 import argparse
+import bisect
+import json
 import os
 import shutil
 
-import numpy as np
-from joblib import Parallel
-
-
 from . import multi
-from .html import MetadataStripper
-from .utils import _get_nlp, _get_tqdm, _make_meta_dict_from_sent
+from .cache import _hash_file
+from .constants import BENEPAR_LANGUAGES, LANGUAGE_TO_MODEL, PARSE_BATCH_SIZE, PARSE_MANIFEST
+from .html import DocumentParser
+from .utils import _get_nlp, _get_tqdm, _make_meta_dict_from_sent, _tqdm_close, _tqdm_update
 
 tqdm = _get_tqdm()
 
 
-def _strip_metadata(plain, speakers):
-    # todo: do this without splitting
-    out = []
-    for line in plain.splitlines():
-        parser = MetadataStripper(speakers)
-        parser.feed(line)
-        out.append(parser.text)
-    return "\n".join(out)
-
-
 def _normalise_word(word, wrap=False):
     return str(word).strip().replace("\t", "").replace("\n", "")
 
 
-def _get_line_with_meta(start, plain, stripped):
-    all_before = stripped[:start]
-    line_index = all_before.count("\n")
-    plain = plain.splitlines()
-    return plain[line_index]
-
-
-def _get_governor_id(word):
-    if word.i == word.head.i:
-        return "0"
-    return str(word.head.i - word.sent[0].i + 1)
-
-
-def _strip_punct(span):
+def _align_token_meta(doc, spans):
     """
-    Fallback only --- last ditch effort to match token in span
-    """
-    return "".join(i for i in span if i.isalnum() or i in {"-"})
+    Find the tokens inside each annotated span, using their character offsets
 
+    spans: (start, end, features) for each span, as offsets into the document
 
-def _get_token_index_in_span(span, word, nlp):
+    Return: dict mapping token index to list of features
     """
-    Inherently imperfect: from span given by html parser, find spacy token
-
-    We should avoid tokenising where possible, because it is imperfect.
-
-    Edge cases are when the span is 'word.'. This is two tokens
-    """
-    # if the span is obviously one token, we're good
-    if span.strip().isalnum() or len(span.strip()) == 1:
-        return 0
-    # this seems imperfect too, but saves running nlp
-    if span.strip().startswith(word.text):
-        return 0
-    # otherwise, tokenise and get its index
-    tokens = nlp(span)
-    gen = (i for i, t in enumerate(tokens) if t.text == word.text)
-    try:
-        return next(gen)
-    except StopIteration:
-        split = enumerate(span.split())
-        fallback = (i for i, t in split if _strip_punct(t) == word.text)
-        return next(fallback, 0)
-    return 0
+    token_starts = [t.idx for t in doc]
+    out = dict()
+    for start, end, features in spans:
+        # first token ending after the span starts, then on until it ends
+        n = max(bisect.bisect_right(token_starts, start) - 1, 0)
+        while n < len(doc) and token_starts[n] < end:
+            token = doc[n]
+            if token.idx + len(token) > start and not token.is_space:
+                out.setdefault(n, list()).append(features)
+            n += 1
+    return out
+
+
+def _get_governor_id(word, sent_start):
+    if word.i == word.head.i:
+        return "0"
+    return str(word.head.i - sent_start + 1)
 
 
-def _is_correct_span(word, span, nth, features, nlp):
-    """
-    Is this spacy token inside an html span? (for token metadata)
-    nth is the number of times this exact span appears to the left in sent.
-    So we need to check that not only is word in the span, but that the ix
-    of the span is correct
-    """
-    # quick exit if it definitely does not match
-    if word.text not in span or len(span) < len(word.text):
-        return False
-    nth_in_span = _get_token_index_in_span(span, word, nlp)
-    # there must be a faster way to get token index in sent than this...
-    ix_in_sent = next(i for i, t in enumerate(word.sent) if t == word)
-    # get the tokens from start of our match to end of seent
-    toks_after = word.sent[ix_in_sent - nth_in_span :]
-    # get this part of the sent as string, and cut it to length of span
-    after = str(toks_after)[: len(span)]
-    # ideally now, we can compare the span and the sent
-    if span != after:
-        return False
-    # if they are the same, we need to check prior occurrences in the sent
-    count_before_here = str(word.sent[:ix_in_sent]).count(after)
-    # prior occurrences should be same as nth from htmlparser
-    return count_before_here == nth
-
-
-def _make_misc_field(word, token_meta, nlp, all_meta):
+def _make_misc_field(word, features, line_features, all_meta):
     """
     Build the misc cell for this word. It has NER, sentiment AND user-added
+
+    features: metadata of the annotated spans this word is in
+    line_features: whether the line the sentence starts on has any
     """
-    if not word.ent_iob and not word.sentiment and not token_meta:
+    if not word.ent_iob and not word.sentiment and not features and not line_features:
         return "_"
     ent = word.ent_type_ or "_"
     formatters = dict(typ=ent, num=word.ent_iob, iob=word.ent_iob_)
     misc = "ent_type={typ}|ent_id={num}|ent_iob={iob}".format(**formatters)
     if word.sentiment:
         misc += "|sentiment={}".format(word.sentiment)
-    for (span, nth), features in token_meta.items():
-        if not _is_correct_span(word, span, nth, features, nlp):
-            continue
-        for key, val in features.items():
+    for span_features in features:
+        for key, val in span_features.items():
             if key not in all_meta:
                 misc += "|{}={}".format(key, val)
     return misc
 
 
-def _process_string(
-    plain, path, save_as, corpus_name, language, constituencies, speakers, corpus_path
-):
+def _prepare_string(plain, speakers):
     """
-    spacy: process a string of text
+    Split file metadata off the top of some plain text, and strip the rest of
+    the metadata out of the text a line at a time, ready for parsing
+
+    Return: file metadata, and DocumentParser holding text and metadata
     """
     # break into lines, removing empty
     plain = [i.strip(" ") for i in plain.splitlines() if i.strip(" ")]
     file_meta, _ = _make_meta_dict_from_sent(plain[0], first=True, speakers=speakers)
     if file_meta:
         plain = plain[1:]
-    plain = "\n".join(plain)
-    stripped_data = _strip_metadata(plain, speakers)
+    metadata = DocumentParser(speakers=speakers)
+    metadata.feed("\n".join(plain))
+    return file_meta, metadata
+
+
+def _doc_to_sents(doc, file_meta, metadata, constituencies):
+    """
+    Get each sentence of a parsed spaCy Doc as its metadata and token fields
+    """
+    token_meta = _align_token_meta(doc, metadata.spans)
+    sents = list()
+    for sent_index, sent in enumerate(doc.sents, start=1):
+        # the sentence metadata is on the line where the sentence starts
+        n = bisect.bisect_right(metadata.line_starts, sent.start_char) - 1
+        line = metadata.sent_meta[n], metadata.line_spans[n]
+        sents.append(_process_sent(sent_index, sent, file_meta, line, token_meta, constituencies))
+    return sents
 
-    nlp = _get_nlp(language=language, constituencies=constituencies)
 
-    doc = nlp(stripped_data)
+def _sents_to_conllu(sents):
+    """
+    Format sentences from _doc_to_sents as CONLL-U
+    """
     output = list()
+    for sent_meta, rows in sents:
+        lines = ["# {} = {}".format(field, value) for field, value in sent_meta.items()]
+        lines += ["\t".join(parts) for parts in rows]
+        output.append("\n".join(lines))
+    return "\n\n".join(output).strip() + "\n"
 
-    for sent_index, sent in enumerate(doc.sents, start=1):
-        sstr = _process_sent(
-            sent_index,
-            sent,
-            file_meta,
-            plain,
-            stripped_data,
-            language,
-            nlp,
-            constituencies,
-            speakers,
-        )
-        output.append(sstr)
-    output = "\n\n".join(output).strip() + "\n"
-
-    # path is the original filepath, corpus_path is the base
-    make_in = os.path.dirname(corpus_path)
-    outdir = os.path.join(make_in, "conllu")
-    os.makedirs(outdir, exist_ok=True)
-    outpath = path.replace(corpus_path, outdir)
-    outpath = os.path.splitext(outpath)[0] + ".conllu"
+
+def _doc_to_conllu(doc, file_meta, metadata, constituencies):
+    """
+    Format a parsed spaCy Doc as CONLL-U
+    """
+    return _sents_to_conllu(_doc_to_sents(doc, file_meta, metadata, constituencies))
+
+
+def _write_conllu(output, path, corpus_path):
+    outpath = _output_path(path, corpus_path)
+    os.makedirs(os.path.dirname(outpath), exist_ok=True)
     with open(outpath, "w") as fo:
         fo.write(output)
 
 
-def _process_sent(
-    sent_index,
-    sent,
-    file_meta,
-    plain,
-    stripped_data,
-    language,
-    nlp,
-    constituencies,
-    speakers,
+def _process_string(
+    plain, path, save_as, corpus_name, language, constituencies, speakers, corpus_path
+):
+    """
+    spacy: process a string of text
+    """
+    file_meta, metadata = _prepare_string(plain, speakers)
+    nlp = _get_nlp(language=language, constituencies=constituencies)
+    doc = nlp(metadata.text)
+    output = _doc_to_conllu(doc, file_meta, metadata, constituencies)
+    _write_conllu(output, path, corpus_path)
+
+
+def _process_files(
+    paths, language, constituencies, speakers, corpus_path, batch_size=PARSE_BATCH_SIZE, cache=None
 ):
+    """
+    spacy: parse plain text files, streaming them through nlp.pipe in batches.
+    Each file is written as soon as its batch is done.
+
+    cache: a CorpusCache for the parsed corpus. If given, each file is also
+    stored there in columnar form, straight from the parsed sentences.
+
+    Yield: the path of each file, once written
+    """
+    nlp = _get_nlp(language=language, constituencies=constituencies)
+
+    def _texts():
+        for path in paths:
+            with open(path, "r") as fo:
+                plain = fo.read().strip()
+            file_meta, metadata = _prepare_string(plain, speakers)
+            yield metadata.text, (path, file_meta, metadata)
+
+    docs = nlp.pipe(_texts(), as_tuples=True, batch_size=batch_size)
+    for doc, (path, file_meta, metadata) in docs:
+        sents = _doc_to_sents(doc, file_meta, metadata, constituencies)
+        _write_conllu(_sents_to_conllu(sents), path, corpus_path)
+        if cache is not None:
+            from .file import File
+
+            cache.store(File(_output_path(path, corpus_path)), sents)
+        yield path
+
+
+def _output_path(path, corpus_path):
+    """
+    Get the path of the CONLL-U made from the file at path.
+
+    path is the original filepath, corpus_path is the base
+    """
+    outdir = os.path.join(os.path.dirname(corpus_path), "conllu")
+    outpath = path.replace(corpus_path, outdir)
+    return os.path.splitext(outpath)[0] + ".conllu"
+
+
+def _package_version(name):
+    """
+    Get the installed version of a package (e.g. a spaCy model), or None
+    """
+    try:
+        import pkg_resources
+
+        return pkg_resources.get_distribution(name).version
+    except Exception:
+        return
+
+
+def _parse_settings(language, constituencies, speakers):
+    """
+    Everything besides the text itself that affects the parser output
+    """
+    import spacy
+    from . import __version__
+
+    language = language.lower()
+    model = LANGUAGE_TO_MODEL.get(language, language)
+    settings = dict(
+        buzz=__version__,
+        spacy=spacy.__version__,
+        model=[model, _package_version(model)],
+        language=language,
+        constituencies=bool(constituencies),
+        speakers=bool(speakers),
+    )
+    if constituencies and language in BENEPAR_LANGUAGES:
+        settings["benepar"] = [BENEPAR_LANGUAGES[language], _package_version("benepar")]
+    return settings
+
+
+def _read_parse_manifest(outdir):
+    try:
+        with open(os.path.join(outdir, PARSE_MANIFEST), "r") as fo:
+            return json.load(fo)
+    except (OSError, ValueError):
+        return
+
+
+def _source_entry(path, known=None):
+    """
+    Describe a source file for the parse manifest. The hash is only worked out
+    again if the size or modification time differ from those known.
+    """
+    stat = os.stat(path)
+    entry = dict(size=stat.st_size, mtime=stat.st_mtime_ns)
+    if known and known["size"] == entry["size"] and known["mtime"] == entry["mtime"]:
+        entry["hash"] = known["hash"]
+    else:
+        entry["hash"] = _hash_file(path)
+    return entry
+
+
+def _plan_parse(paths, corpus_path, settings):
+    """
+    Work out which source files need parsing, by comparing them with the
+    manifest left by the last parse. Files are parsed again when their text
+    changes, or when anything in settings (e.g. the model version) does.
+
+    Parsed files whose source has gone are deleted. Parsed corpora without a
+    manifest (made by older versions of buzz) are trusted as they are.
+
+    Return: list of paths to parse, and the source entries for the manifest
+    """
+    outdir = os.path.join(os.path.dirname(corpus_path), "conllu")
+    manifest = _read_parse_manifest(outdir)
+    # from before there were manifests: keep what is already parsed
+    if manifest is None:
+        known = dict()
+        todo = [p for p in paths if not os.path.isfile(_output_path(p, corpus_path))]
+    elif manifest.get("settings") != settings:
+        known, todo = dict(), list(paths)
+    else:
+        known, todo = manifest.get("files", dict()), list()
+    base = os.path.abspath(corpus_path)
+    sources, parsing = dict(), set(todo)
+    for path in paths:
+        key = os.path.relpath(os.path.abspath(path), base)
+        previous = known.get(key)
+        entry = _source_entry(path, previous)
+        if manifest is not None and path not in parsing:
+            if not previous or entry["hash"] != previous["hash"]:
+                todo.append(path)
+            elif not os.path.isfile(_output_path(path, corpus_path)):
+                todo.append(path)
+        sources[key] = entry
+    if manifest is not None:
+        for key in set(manifest.get("files", dict())) - set(sources):
+            orphan = _output_path(os.path.join(base, key), base)
+            if os.path.isfile(orphan):
+                os.remove(orphan)
+    return todo, sources
+
+
+def _write_parse_manifest(outdir, settings, sources):
+    manifest = dict(settings=settings, files=sources)
+    os.makedirs(outdir, exist_ok=True)
+    tmp = os.path.join(outdir, PARSE_MANIFEST + ".tmp")
+    with open(tmp, "w") as fo:
+        json.dump(manifest, fo, indent=4, sort_keys=True)
+    os.replace(tmp, os.path.join(outdir, PARSE_MANIFEST))
+
+
+def _process_sent(sent_index, sent, file_meta, line, token_meta, constituencies):
+    """
+    Get a sentence's metadata and the CONLL-U fields of each of its tokens
+
+    line: sentence metadata of the line the sentence starts on, and whether
+    it has annotated spans
+    token_meta: features of annotated spans, by token index
+
+    Return: dict of metadata, sorted by field, and list of ten fields per token
+    """
     word_index = 1
-    sent_parts = list()
+    rows = list()
     text = sent.text.strip(" ").replace("\n", " ")
     toks = [i for i in sent if not i.is_space]
     sent_meta = dict(sent_id=str(sent_index), text=text.strip(), sent_len=len(toks))
     if constituencies:
         sent_meta["parse"] = str(sent._.parse_string).replace("\n", " ")
 
-    metaline = _get_line_with_meta(sent.start_char, plain, stripped_data)
-    inner_sent_meta, token_meta = _make_meta_dict_from_sent(metaline, speakers=speakers)
-    all_meta = {**file_meta, **sent_meta, **inner_sent_meta}
-
-    for field, value in sorted(all_meta.items()):
-        sent_parts.append("# {} = {}".format(field, value))
+    inner_sent_meta, line_spans = line
+    all_meta = dict(sorted({**file_meta, **sent_meta, **inner_sent_meta}.items()))
 
     for word in sent:
 
         if word.is_space:
             continue
 
-        governor = _get_governor_id(word)
+        governor = _get_governor_id(word, sent.start)
         word_text = _normalise_word(str(word))
-        named_ent = _make_misc_field(word, token_meta, nlp, all_meta)
+        features = token_meta.get(word.i, list())
+        named_ent = _make_misc_field(word, features, line_spans, all_meta)
         if "__" in word.tag_ and len(word.tag_) > 2:
             tag, morph = word.tag_.split("__", 1)
         else:
@@ -215,11 +332,10 @@ def _process_sent(
             named_ent,
         ]
 
-        line = "\t".join(parts)
-        sent_parts.append(line)
+        rows.append(parts)
         word_index += 1
 
-    return "\n".join(sent_parts)
+    return all_meta, rows
 
 
 def _parse_cmd_line():
@@ -254,9 +370,18 @@ class Parser:
     """
 
     def __init__(
-        self, language="en", multiprocess=False, constituencies=False, speakers=True, just_missing=False
+        self,
+        language="en",
+        multiprocess=False,
+        constituencies=False,
+        speakers=True,
+        just_missing=False,
+        batch_size=PARSE_BATCH_SIZE,
+        cache=False,
     ):
         self.multiprocess = multiprocess
+        self.batch_size = batch_size
+        self.cache = cache
         self.language = language
         self.constituencies = constituencies
         self.speakers = speakers
@@ -279,30 +404,43 @@ class Parser:
         else:
             abspath = os.path.abspath(os.getcwd())
             fs = [os.path.join(abspath, f.path) for f in self.plain_corpus.files]
-            # if just_missing mode is on (used in buzzword, we skip files that exist)
+            corpus_path = self.plain_corpus.path
+            settings = _parse_settings(self.language, self.constituencies, self.speakers)
+            # if just_missing mode is on (used in buzzword), only parse new and changed files
+            todo, sources = _plan_parse(fs, corpus_path, settings)
             if self.just_missing:
-                todo = []
-                for f in fs:
-                    parsed_path = f.replace(".txt", ".conllu").replace("/txt/", "/conllu/")
-                    if not os.path.isfile(parsed_path):
-                        todo.append(f)
                 fs = todo
-            multiprocess = multi.how_many(self.multiprocess)
-            chunks = np.array_split(fs, multiprocess)
-            delay = (
-                multi.parse(
-                    x,
-                    i,
-                    self.save_as,
-                    self.corpus_name,
-                    self.language,
-                    self.constituencies,
-                    self.speakers,
-                    self.plain_corpus.path
-                )
-                for i, x in enumerate(chunks)
-            )
-            Parallel(n_jobs=multiprocess)(delay)
+            outdir = os.path.join(os.path.dirname(corpus_path), "conllu")
+            cache = None
+            if self.cache:
+                from .cache import CorpusCache
+
+                cache = CorpusCache(outdir)
+            self._parse_paths(fs, cache)
+            if cache is not None:
+                cache.save()
+            # only once everything has been parsed, note what it was made from
+            _write_parse_manifest(outdir, settings, sources)
+
+    def _parse_paths(self, fs, cache=None):
+        """
+        Parse plain text files at paths fs, in as many processes as needed,
+        storing them in cache (a CorpusCache) as well if given
+        """
+        if not len(fs):
+            return
+        multiprocess = multi.how_many(self.multiprocess)
+        args = (self.language, self.constituencies, self.speakers, self.plain_corpus.path)
+        if multiprocess > 1:
+            kwargs = dict(batch_size=self.batch_size, cache=cache is not None)
+            changed = multi.parse(fs, multiprocess, *args, **kwargs)
+            if cache is not None:
+                cache.changed.update(changed)
+            return
+        t = tqdm(ncols=120, unit="file", desc="Parsing", total=len(fs))
+        for _ in _process_files(fs, *args, batch_size=self.batch_size, cache=cache):
+            _tqdm_update(t)
+        _tqdm_close(t)
 
     def run(self, corpus, save_as=None):
         """
@@ -366,7 +504,7 @@ class Parser:
         if as_string is not None:
             parsed = Corpus.from_string(as_string, save_as=False)
         else:
-            parsed = Corpus(self.parsed_path)
+            parsed = Corpus(self.parsed_path, cache=self.cache)
         return parsed
 
 
@@ -0,0 +1,200 @@
+"""
+buzz: lazy just/skip/see chains over parsed corpora on disk
+
+corpus.just.speaker.MOOKIE.skip.x.PUNCT.see.l.by.file
+
+While a chain like this is built, each new filter is only tried on the first
+file, so that bad queries fail straight away. When the result is needed,
+every filter is run on each file in a single pass, loading only the columns
+the chain uses where possible. For a corpus that keeps a load cache, the
+corpus index picks out the files (and rows) matching the first filter.
+"""
+from .utils import _concat_categories, _order_df_columns
+
+# columns that are not in the data, but searched over all of it
+SEARCH_COLUMNS = {"dependencies", "depgrep", "deps", "d", "tgrep", "trees", "t", "tree"}
+
+INDEX_COLUMNS = {"file", "s", "i"}
+
+
+class Step(object):
+    """
+    One just/skip filter in a query plan
+    """
+
+    def __init__(self, column, entry, inverse=False, **kwargs):
+        self.column = column
+        self.entry = entry
+        self.inverse = inverse
+        self.kwargs = kwargs
+
+    def __call__(self, df):
+        """
+        Run this filter over the (loaded) DataFrame df
+        """
+        from .slice import Filter
+
+        return Filter(df, self.column, inverse=self.inverse)(self.entry, **self.kwargs)
+
+    def usecols(self):
+        """
+        Columns needed to run this filter, or None if it needs all of them
+        """
+        if self.column in SEARCH_COLUMNS:
+            return
+        return set() if self.column in INDEX_COLUMNS else {self.column}
+
+
+class Query(object):
+    """
+    A chain of just/skip filters over a parsed Corpus, run only when needed.
+
+    Anything a Dataset can do, a Query can too: the filters are run over
+    the corpus the first time that the data itself is needed.
+    """
+
+    def __init__(self, corpus, steps=None, usecols=None):
+        self.corpus = corpus
+        self.steps = steps or list()
+        self.usecols = usecols
+        self._result = None
+
+    def _filter(self, column, entry, inverse=False, usecols=None, **kwargs):
+        """
+        Make a new Query, with one more filter on the end.
+
+        The filter is tried on the first file right away, so that bad queries
+        fail where they are written, rather than when the Query is run.
+        """
+        step = Step(column, entry, inverse=inverse, **kwargs)
+        if usecols:
+            usecols = set(usecols) | set(self.usecols or ())
+        else:
+            usecols = self.usecols
+        if self.corpus.files:
+            cols, cache = step.usecols(), self._cache()
+            step(self._load_file(self.corpus.files[0], cache, usecols=cols and sorted(cols)))
+            if cache is not None:
+                cache.save()
+        return Query(self.corpus, self.steps + [step], usecols=usecols)
+
+    def _cache(self):
+        """
+        The load cache of the corpus, or None if it does not keep one
+        """
+        from .cache import CorpusCache
+
+        if getattr(self.corpus, "cache", False):
+            return CorpusCache(self.corpus)
+
+    def _load_file(self, file, cache, usecols=None):
+        if cache is not None:
+            return cache.load_file(file, usecols=usecols)
+        return file.load(usecols=usecols) if usecols else file.load()
+
+    def _usecols(self, usecols=None):
+        """
+        Prune columns: everything the filters use, plus usecols, or None for all
+        """
+        usecols = set(usecols or ()) | set(self.usecols or ())
+        if not usecols:
+            return
+        for step in self.steps:
+            cols = step.usecols()
+            if cols is None:
+                return
+            usecols |= cols
+        return sorted(usecols - INDEX_COLUMNS)
+
+    def _files(self, cache, usecols=None):
+        """
+        Get each file's data, and the filters still to be run over it.
+
+        If the corpus keeps a load cache, and the first filter is an exact
+        match, the corpus index can find the matching rows, and files without
+        any are never read.
+        """
+        from .index import CorpusIndex, _can_use_postings
+
+        first, kwargs = self.steps[0], dict(usecols=usecols) if usecols else dict()
+        usable = cache is not None and first.column not in INDEX_COLUMNS
+        if usable and _can_use_postings(first.entry, **first.kwargs):
+            index = CorpusIndex(self.corpus)
+            frames = index.filter(first.column, first.entry, inverse=first.inverse, **kwargs)
+            return frames, self.steps[1:]
+        frames = (self._load_file(file, cache, **kwargs) for file in self.corpus.files)
+        return frames, self.steps
+
+    def load(self, usecols=None):
+        """
+        Run the query over the corpus, in one pass over its files.
+
+        usecols: columns needed in the result, in addition to those given when
+        making the query. By default, all of them are kept.
+
+        Return: Dataset
+        """
+        usecols = self._usecols(usecols)
+        if usecols is None and self._result is not None:
+            return self._result
+        cache = self._cache()
+        frames, steps = self._files(cache, usecols)
+        results = list()
+        for df in frames:
+            for step in steps:
+                df = step(df)
+            results.append(df)
+        if cache is not None:
+            cache.save(self.corpus.files)
+        # categories for the whole corpus, as Corpus.load makes them
+        df = _order_df_columns(_concat_categories(results))
+        if usecols is None:
+            self._result = df
+        return df
+
+    @property
+    def just(self):
+        """
+        Add a filter: query.just.word.the
+        """
+        from .corpus import SliceHelper
+
+        return SliceHelper(self)
+
+    @property
+    def skip(self):
+        """
+        Add an inverse filter: query.skip.word.the
+        """
+        from .corpus import SliceHelper
+
+        return SliceHelper(self, inverse=True)
+
+    @property
+    def see(self):
+        """
+        Make a table from the query results: query.see.word.by.speaker
+        """
+        from .corpus import SliceHelper
+
+        return SliceHelper(self, inverse=True, see=True)
+
+    def __getattr__(self, attr):
+        """
+        Anything else needs the data, so get it and use that
+        """
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __len__(self):
+        return len(self.load())
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __repr__(self):
+        return repr(self.load())
@@ -1,8 +1,11 @@
+import numpy as np
 import pandas as pd
 from nltk.tgrep import tgrep_compile
 
 from depgrep import depgrep_compile
 
+from .depgrep import Unsupported, _Tokens, _vectorised_depgrep
+from .tgrep import _compile, _tgrep_grams, _Trees
 from .utils import (_get_tqdm,
     _make_tree,
     _tqdm_close,
@@ -39,14 +42,17 @@ class Searcher(object):
 
         return to_search, reference
 
-    def _tgrep_iteration(self, df):
+    def _tgrep_iteration(self, df, trees=None):
         """
         Search a DataFrame-like object's parse column using tgrep.
+
+        trees: the parse trees of df as arrays, if already made
         """
-        df["_gram"] = False
         tree_once = _tree_once(df)
-        if isinstance(tree_once.values[0], str):
-            tree_once = tree_once.apply(_make_tree)
+        if self.native is not None:
+            if trees is None:
+                trees = _Trees.from_strings(tree_once)
+            return _tgrep_grams(trees, self.native.mask(trees), tree_once.index)
 
         # results go here
         indices_to_keep = dict()
@@ -61,19 +67,27 @@ class Searcher(object):
             )
 
         for n, tree in tree_once.items():
+            if isinstance(tree, str):
+                tree = _make_tree(tree)
             if not tree:
                 continue
             match_count = 0
             # a tree is a bunch of positions. we iterate over each and check for match there
-            root_positions = tree.treepositions(order="leaves")
+            root_positions = {p: i for i, p in enumerate(tree.treepositions(order="leaves"))}
             positions = tree.treepositions()
             for position in positions:
-                if self.query(tree[position]):
+                node = tree[position]
+                if self.query(node):
                     match_count += 1
-                    size = len(tree[position].leaves())  # how long is match for _gram
-                    first = tree[position].treepositions("leaves")[0]
-                    first = position + first
-                    pos = root_positions.index(first)
+                    # leaves are strings, and match just themselves
+                    if isinstance(node, str):
+                        size, first = 1, position
+                    else:
+                        size = len(node.leaves())  # how long is match for _gram
+                        if not size:
+                            continue
+                        first = position + node.treepositions("leaves")[0]
+                    pos = root_positions[first]
                     form = ",".join([str(x) for x in range(pos + 1, pos + size + 1)])
                     for x in range(pos + 1, pos + size + 1):
                         indices_to_keep[(n[0], n[1], x)] = form
@@ -116,25 +130,43 @@ class Searcher(object):
 
         return [bool(i) for i in matches.values]
 
-    def _depgrep_iteration(self, piece, query, position, multiword):
+    def _depgrep_frame(self, piece):
         """
-        depgrep over one piece of data, returning the matching lines
+        Get one piece of data ready for depgrep
         """
         # make multiindex and add an _n column, then remove old index
         df = piece.drop(["_n", "file", "s", "i"], axis=1, errors="ignore")
         df["_n"] = range(len(df))
-        df = df.reset_index(level=df.index.names)
-        positions = {y: x for x, y in enumerate(list(df.columns))}
-        values = df.values
-        # compile the query against this dataframe
-        self.query = depgrep_compile(
-            query,
-            values=values,
-            positions=positions,
-            case_sensitive=self.case_sensitive,
-        )
-        # run the query, returning a boolean index
-        bool_ix = self.depgrep(df, positions, position=position)
+        return df.reset_index(level=df.index.names)
+
+    def _depgrep_matches(self, df, query, position, tokens=None):
+        """
+        Boolean index of the rows of df matching query
+
+        tokens: _Tokens for df, shared between queries
+        """
+        # run the query over whole columns where we can
+        try:
+            return _vectorised_depgrep(query, df, tokens)
+        except Unsupported:
+            positions = {y: x for x, y in enumerate(list(df.columns))}
+            values = df.values
+            # compile the query against this dataframe
+            self.query = depgrep_compile(
+                query,
+                values=values,
+                positions=positions,
+                case_sensitive=self.case_sensitive,
+            )
+            # run the query row by row
+            return self.depgrep(df, positions, position=position)
+
+    def _depgrep_iteration(self, piece, query, position, multiword):
+        """
+        depgrep over one piece of data, returning the matching lines
+        """
+        df = self._depgrep_frame(piece)
+        bool_ix = self._depgrep_matches(df, query, position)
         position_data = None
         if multiword:
             bool_ix, position_data = _bool_ix_for_multiword(df, bool_ix, multiword)
@@ -150,13 +182,19 @@ class Searcher(object):
         case_sensitive=True,
         inverse=False,
         position=0,
-        multiword=0
+        multiword=0,
+        cache=None,
     ):
         """
         Search either trees or dependencies for query
 
+        cache: for a Corpus on disk, read files from the load cache and keep
+        their trees with it. By default, only if the corpus has caching on.
+
         Return: Dataset of matching indices
         """
+        from .cache import CorpusCache
+        from .corpus import Corpus
         from .file import File
         from .dataset import Dataset
 
@@ -171,9 +209,19 @@ class Searcher(object):
         # where we store our results...
         results = list()
 
-        # unlike depgrep, tgrep queries are compiled without the file data, so can be done once
+        # unlike depgrep, tgrep queries are compiled without the file data, so can be done once.
+        # most can be run over whole arrays of trees; the rest go through nltk tree by tree
+        self.native = None
+        use_cache = getattr(corpus, "cache", False) if cache is None else cache
+        cache = None
         if target == "t":
-            self.query = tgrep_compile(query)
+            try:
+                self.native = _compile(query)
+            except Unsupported:
+                self.query = tgrep_compile(query)
+            # trees of a corpus on disk are kept with its cached files, if it has them
+            if isinstance(corpus, Corpus) and use_cache:
+                cache = CorpusCache(corpus)
 
         # progbar stuff
         tqdm = _get_tqdm()
@@ -188,7 +236,14 @@ class Searcher(object):
         # iterate over searchable bits, doing query with progbar
         n = 0
         for piece in self.to_search:
-            if isinstance(piece, File):
+            trees = None
+            if isinstance(piece, File) and cache is not None:
+                file, piece = piece, cache.load_file(piece)
+                if self.native is not None:
+                    trees = cache.trees(file, _tree_once(piece))
+                piece["_n"] = list(range(n, len(piece) + n))
+                n += len(piece)
+            elif isinstance(piece, File):
                 piece = piece.load()
                 piece["_n"] = list(range(n, len(piece) + n))
                 n += len(piece)
@@ -199,7 +254,9 @@ class Searcher(object):
                 if position_data:
                     res["_position"] = position_data
             elif self.target == "t":
-                gram_ser = self._tgrep_iteration(piece)
+                if trees is None and self.native is not None and isinstance(piece, Dataset):
+                    trees = piece._tree_arrays()
+                gram_ser = self._tgrep_iteration(piece, trees)
                 res = piece.loc[gram_ser.index]
                 res["_gram"] = gram_ser
 
@@ -207,6 +264,8 @@ class Searcher(object):
                 results.append(res)
             _tqdm_update(t)
         _tqdm_close(t)
+        if cache is not None:
+            cache.save(corpus.files)
 
         results = (
             Dataset(pd.concat(results, sort=False), name=name)
@@ -216,3 +275,57 @@ class Searcher(object):
         # if we already had reference corpus, it can stay...
         results.reference = self.reference
         return results
+
+    def run_many(self, corpus, queries, case_sensitive=True, inverse=False, position=0):
+        """
+        Search dependencies for a batch of queries, in one pass over the data.
+        Parts of queries written the same way, like the same node, are only
+        worked out once for all of them.
+
+        queries: list of queries, or dict of {label: query}
+
+        Return: dict of {label: Dataset of matches}, labelled by query for lists
+        """
+        from .file import File
+        from .dataset import Dataset
+
+        self.corpus = corpus
+        self.to_search, self.reference = self._understand_input_data(corpus)
+        self.target = "d"
+        self.case_sensitive = case_sensitive
+        if not isinstance(queries, dict):
+            queries = {query: query for query in queries}
+        name = getattr(corpus, "name", None)
+        results = {label: list() for label in queries}
+
+        tqdm = _get_tqdm()
+        kwa = dict(
+            total=len(self.to_search) * len(queries),
+            desc="Searching corpus",
+            ncols=120,
+            unit="query",
+        )
+        t = tqdm(**kwa) if len(queries) > 1 and position is not None else None
+
+        n = 0
+        for piece in self.to_search:
+            if isinstance(piece, File):
+                piece = piece.load()
+                piece["_n"] = list(range(n, len(piece) + n))
+                n += len(piece)
+            df = self._depgrep_frame(piece)
+            tokens = _Tokens(df)
+            for label, query in queries.items():
+                depg = np.asarray(self._depgrep_matches(df, query, position=None, tokens=tokens))
+                res = piece[depg] if not inverse else piece[~depg]
+                if not res.empty:
+                    results[label].append(res)
+                _tqdm_update(t)
+        _tqdm_close(t)
+
+        out = dict()
+        for label, found in results.items():
+            found = pd.concat(found, sort=False) if found else pd.DataFrame()
+            out[label] = Dataset(found, name=name)
+            out[label].reference = self.reference
+        return out
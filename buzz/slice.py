@@ -21,6 +21,7 @@ corpus.just.speaker.MOOKIE.skip.xpos.PUNCT.see.lemma.by.wordclass
 
 from abc import ABC, abstractmethod
 
+import numpy as np
 import pandas as pd
 
 from .exceptions import DataTypeError
@@ -118,7 +119,32 @@ class Filter(object):
             new_ser = None
         return bool_ix, new_ser
 
-    def _normalise(self, entry, case=True, exact_match=False, **kwargs):
+    def _from_postings(self, entry, case, exact_match, multiword, **kwargs):
+        """
+        Get a boolean index for exact matches from the Dataset's postings for
+        this column, without comparing every row. None if not possible.
+        """
+        from .index import _can_use_postings, _dataset_postings
+
+        if not _can_use_postings(entry, case, exact_match, multiword, **kwargs):
+            return
+        postings = _dataset_postings(self._corpus, self.column)
+        if postings is None:
+            return
+        bool_ix = np.zeros(len(self._corpus), dtype=bool)
+        bool_ix[postings.get(entry)] = True
+        return bool_ix
+
+    def _normalise(self, entry, case=True, exact_match=False, multiword=False, **kwargs):
+        from .corpus import Corpus
+        from .query import Query
+
+        # parsed corpora on disk get a lazy query, run when the data is needed
+        if isinstance(self._corpus, Corpus) and self._corpus.is_parsed:
+            self._corpus = Query(self._corpus)
+        if isinstance(self._corpus, Query):
+            kwa = dict(case=case, exact_match=exact_match, multiword=multiword, **kwargs)
+            return self._corpus._filter(self.column, entry, inverse=self.inverse, **kwa)
         if not isinstance(self._corpus, pd.DataFrame) and self._corpus.files:
             results = []
             total = len(self._corpus.files)
@@ -129,11 +155,11 @@ class Filter(object):
             # help the user out: the column they are searching for must be in usecols!
             if "usecols" in usecols and self.column not in usecols["usecols"]:
                 usecols["usecols"].append(self.column)
-            print("USECOLS", usecols)
             for file in self._corpus.files:
                 self._corpus = file.load(**usecols)
                 _tqdm_update(t)
-                res = self.__call__(entry, case=case, exact_match=exact_match, **kwargs)
+                kwa = dict(case=case, exact_match=exact_match, multiword=multiword)
+                res = self.__call__(entry, **kwa, **kwargs)
                 results.append(res)
             _tqdm_close(t)
             df = pd.concat(results, sort=True)
@@ -149,7 +175,8 @@ class Filter(object):
         exact_match: match whole word, or just part of it
         """
         # if it's a corpus, do this in a loop over files
-        done = self._normalise(entry, case=case, exact_match=exact_match, **kwargs)
+        kwa = dict(case=case, exact_match=exact_match, multiword=multiword)
+        done = self._normalise(entry, **kwa, **kwargs)
         if done is not None:
             return done
 
@@ -163,9 +190,13 @@ class Filter(object):
                 return result
             return self._corpus[~self._corpus["_n"].isin(result["_n"])]
 
-        strung = self._make_column_to_match_against(case, entry)
-        entry = self._normalise_entry(entry, case)
-        bool_ix, new_ser = self._make_bool_index(entry, strung, exact_match, multiword, **kwargs)
+        bool_ix, new_ser = self._from_postings(entry, case, exact_match, multiword, **kwargs), None
+        if bool_ix is None:
+            strung = self._make_column_to_match_against(case, entry)
+            entry = self._normalise_entry(entry, case)
+            bool_ix, new_ser = self._make_bool_index(
+                entry, strung, exact_match, multiword, **kwargs
+            )
 
         if self.inverse:
             bool_ix = ~bool_ix
@@ -197,21 +228,21 @@ class Interim(Filter):
         return Interim(self._corpus, self.column)
 
     def __call__(self, entry=None, *args, **kwargs):
-        if not entry:
-            try:
-                return self._corpus[self.column].value_counts()
-            except Exception:
-                raise NotImplementedError("Not done yet.")
-        else:
-            entry = _ensure_list_of_short_names(entry)
+        entry = _ensure_list_of_short_names(entry) if entry else None
         if not isinstance(self._corpus, pd.DataFrame):
             if isinstance(self.column, str):
                 self.column = [self.column]
             self.column = (
                 self.column if isinstance(self.column, list) else [self.column]
             )
-            usecols = entry + self.column
+            usecols = (entry or []) + self.column
             self._corpus = self._corpus.load(usecols=usecols)
+        if not entry:
+            try:
+                column = self.column[0] if isinstance(self.column, list) else self.column
+                return self._corpus[column].value_counts()
+            except Exception:
+                raise NotImplementedError("Not done yet.")
         return self._corpus.table(subcorpora=self.column, show=entry, *args, **kwargs)
 
 
@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 
-from .views import _sort, _tabview
+from .views import _sort, _sort_sparse, _tabview
 
 
 class Table(pd.DataFrame):
@@ -94,3 +95,105 @@ class Table(pd.DataFrame):
         from .views import _keyness
 
         return _keyness(self, keyness, reference=reference)
+
+
+class SparseTable(object):
+    """
+    A table of counts held as a scipy sparse matrix, with row and column labels.
+
+    Good for tables with many subcorpora and many entries, where nearly every
+    cell would be zero. relative, sort and keyness all keep it sparse.
+    """
+
+    def __init__(self, matrix, index, columns, reference=None):
+        self.matrix = matrix
+        self.index = index
+        self.columns = columns
+        self._reference = reference
+        self.stats = None
+
+    def _new(self, matrix, columns=None):
+        return SparseTable(
+            matrix,
+            index=self.index,
+            columns=self.columns if columns is None else columns,
+            reference=self._reference,
+        )
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __repr__(self):
+        height, width = self.shape
+        stored = self.matrix.nnz
+        return f"<SparseTable: {height} x {width}, {stored} stored>\n{self.square()!r}"
+
+    def take(self, positions):
+        """
+        Get a new SparseTable with just the columns at positions, in that order
+        """
+        positions = np.asarray(positions, dtype=int)
+        return self._new(self.matrix[:, positions], columns=self.columns[positions])
+
+    def sum(self, axis=0):
+        """
+        Totals of each column (axis=0) or row (axis=1), as a Series
+        """
+        totals = np.asarray(self.matrix.sum(axis=axis)).ravel()
+        return pd.Series(totals, index=self.columns if axis == 0 else self.index)
+
+    def to_dense(self):
+        """
+        Get this table as a regular Table. Beware, this can be huge
+        """
+        data = self.matrix.toarray()
+        return Table(data, index=self.index, columns=self.columns, reference=self._reference)
+
+    def square(self, n=10):
+        """
+        The top left corner of the table, as a regular Table
+        """
+        data = self.matrix[:n, :n].toarray()
+        index, columns = self.index[:n], self.columns[:n]
+        return Table(data, index=index, columns=columns, reference=self._reference)
+
+    def sort(self, by="total", keep_stats=False, remove_above_p=False):
+        """
+        Sort this table, with the same options as Table.sort. If keep_stats,
+        the linear regression results are in the stats attribute.
+        """
+        return _sort_sparse(self, by=by, keep_stats=keep_stats, remove_above_p=remove_above_p)
+
+    def relative(self, denom=None):
+        """
+        Give a relative frequency version of this table
+        """
+        from scipy import sparse
+
+        from .dataset import Dataset
+
+        if denom is True or denom is None:
+            denom = self
+        if isinstance(denom, Dataset):
+            subcorpora = list(self.index.names)
+            if subcorpora == [None]:
+                subcorpora = None
+            denom = denom.table(subcorpora=subcorpora, sparse=True)
+        if not isinstance(denom, pd.Series):
+            denom = denom.sum(axis=1)
+        denom = denom.reindex(self.index).values.astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = sparse.diags(100.0 / denom)
+        return self._new((scale @ self.matrix).tocsr())
+
+    def keyness(self, keyness, reference=None):
+        """
+        Generate keywords for this table. Only cells with counts are scored.
+        """
+        from .views import _keyness
+
+        return _keyness(self, keyness, reference=reference)
@@ -17,9 +17,8 @@ import re
 import string
 import sys
 import unicodedata
-from collections import Counter
+from collections import Counter, OrderedDict
 from curses.textpad import Textbox
-from operator import itemgetter
 from subprocess import PIPE, Popen
 from textwrap import wrap
 
@@ -611,6 +610,8 @@ class Viewer(object):
     def _reverse_data(self, data, yp, xp):
         yp, xp = self._reverse_yp_xp(data, yp, xp)
         data.reverse()
+        if isinstance(data, PagedRows):
+            return data, yp, xp
         for idx, i in enumerate(data):
             i.reverse()
             data[idx] = i
@@ -724,39 +725,29 @@ class Viewer(object):
 
     def sort_by_column_numeric(self):
         xp = self.x + self.win_x
-        self.data = sorted(
-            self.data, key=lambda x: self.float_string_key(itemgetter(xp)(x))
-        )
+        self.data = self.data.sort(xp, key=self.float_string_key)
 
     def sort_by_column_numeric_reverse(self):
         xp = self.x + self.win_x
-        self.data = sorted(
-            self.data,
-            key=lambda x: self.float_string_key(itemgetter(xp)(x)),
-            reverse=True,
-        )
+        self.data = self.data.sort(xp, key=self.float_string_key, reverse=True)
 
     def sort_by_column(self):
         xp = self.x + self.win_x
-        self.data = sorted(self.data, key=itemgetter(xp))
+        self.data = self.data.sort(xp)
 
     def sort_by_column_reverse(self):
         xp = self.x + self.win_x
-        self.data = sorted(self.data, key=itemgetter(xp), reverse=True)
+        self.data = self.data.sort(xp, reverse=True)
 
     def sort_by_column_natural(self):
         xp = self.x + self.win_x
-        self.data = sorted(
-            self.data, key=lambda i: int(i[xp]) if i[xp].isdigit() else i[xp]
-        )
+        self.data = self.data.sort(xp, key=lambda i: int(i) if i.isdigit() else i)
         # self.data = self.sorted_nicely(self.data, itemgetter(xp self.index_depth))
 
     def sort_by_column_natural_reverse(self):
         xp = self.x + self.win_x
-        self.data = sorted(
-            self.data,
-            key=lambda i: int(i[xp]) if i[xp].isdigit() else i[xp],
-            reverse=True,
+        self.data = self.data.sort(
+            xp, key=lambda i: int(i) if i.isdigit() else i, reverse=True
         )
 
     def float_string_key(self, value):
@@ -793,8 +784,8 @@ class Viewer(object):
             self.modifier = str()
         else:
             width = 0
-            for y in range(0, len(self.data)):
-                width = max(width, self._cell_len(self.data[y][xs]))
+            for row in self.data.sample():
+                width = max(width, self._cell_len(row[xs]))
             width = min(250, width)
         self.column_width[xs] = width
         self.recalculate_layout()
@@ -975,7 +966,7 @@ class Viewer(object):
         max_y = str(len(self.data))
         max_x = str(len(self.data[0]))
         max_yx = yx_str.format(max_y, max_x)
-        y_cord = max(self.index, key=len) if self.index else "-"
+        y_cord = self.index.longest() if self.index else "-"
         max_label = label_str.format(y_cord, max(self.header, key=len))
         if self.header_offset != self.header_offset_orig:
             # Hide column labels if header row disabled
@@ -1187,9 +1178,9 @@ class Viewer(object):
 
         """
         if width == "max":
-            self.column_width = self._get_column_widths_max(self.data)
+            self.column_width = self._get_column_widths_max(self.data.sample())
         elif width == "mode":
-            self.column_width = self._get_column_widths_mode(self.data)
+            self.column_width = self._get_column_widths_mode(self.data.sample())
         else:
             try:
                 width = int(width)
@@ -1425,43 +1416,204 @@ def csv_sniff(data, enc):
     return dialect.delimiter
 
 
+def sample_positions(n, size=1000):
+    """
+    Row positions to measure widths from: the start, plus rows spread evenly
+    over the rest, so that nothing needs to look at every row
+    """
+    if n <= size:
+        return np.arange(n)
+    head = np.arange(size // 2)
+    rest = np.linspace(size // 2, n - 1, size - size // 2).astype(int)
+    return np.unique(np.concatenate([head, rest]))
+
+
+class PagedRows(object):
+    """
+    The rows of a DataFrame as lists of strings, for the viewer.
+
+    Rows are only formatted when asked for, a page at a time, and only a few
+    pages are kept, so that showing a huge result takes no longer and no more
+    memory than showing a small one. Sorting or deleting rows just reorders
+    the positions being shown.
+    """
+
+    page_size = 256
+    max_pages = 8
+
+    def __init__(self, df, positions=None, head=None):
+        self.df = df
+        self.positions = np.arange(len(df)) if positions is None else positions
+        # literal rows shown before the data, like the header when it is toggled
+        self.head = list() if head is None else head
+        self.depth = len(df.index.names)
+        self.flipped = False
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        return len(self.head) + len(self.positions)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _page(self, number):
+        """
+        Get one page of formatted rows, making it if need be
+        """
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+        start = number * self.page_size
+        rows = self._format(self.positions[start : start + self.page_size])
+        self._pages[number] = rows
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return rows
+
+    def _format(self, positions):
+        """
+        Make the rows at these positions in the DataFrame into lists of strings
+        """
+        chunk = self.df.iloc[positions]
+        levels = [chunk.index.get_level_values(i) for i in range(self.depth)]
+        cells = [np.asarray(i, dtype=object).reshape(-1, 1) for i in levels]
+        cells = np.hstack(cells + [chunk.values.astype(object)])
+        if cells.size:
+            cells = stringify(cells)
+        rows = cells.tolist()
+        if self.flipped:
+            rows = [row[::-1] for row in rows]
+        return rows
+
+    def __getitem__(self, y):
+        if isinstance(y, slice):
+            start, stop, step = y.indices(len(self))
+            if step != 1 or start < len(self.head):
+                return [self[i] for i in range(start, stop, step)]
+            positions = self.positions[start - len(self.head) : stop - len(self.head)]
+            return PagedRows(self.df, positions)
+        if y < 0:
+            y += len(self)
+        if not 0 <= y < len(self):
+            raise IndexError(y)
+        if y < len(self.head):
+            return self.head[y]
+        y -= len(self.head)
+        return self._page(y // self.page_size)[y % self.page_size]
+
+    def __iter__(self):
+        for row in self.head:
+            yield row
+        for number in range(0, -(-len(self.positions) // self.page_size)):
+            for row in self._page(number):
+                yield row
+
+    def __delitem__(self, y):
+        if y < len(self.head):
+            del self.head[y]
+        else:
+            self.positions = np.delete(self.positions, y - len(self.head))
+            self._pages.clear()
+
+    def insert(self, y, row):
+        if y > len(self.head):
+            raise IndexError("Rows can only be inserted before the data")
+        self.head.insert(y, row)
+
+    def index(self, row):
+        return self.head.index(row)
+
+    def reverse(self):
+        """
+        Flip the order of both rows and cells, for searching backwards
+        """
+        self.positions = self.positions[::-1]
+        self.head = [row[::-1] for row in self.head[::-1]]
+        self.flipped = not self.flipped
+        self._pages.clear()
+
+    def sample(self, size=1000):
+        """
+        Some rows to work out column widths from
+        """
+        positions = self.positions[sample_positions(len(self.positions), size)]
+        return self.head + self._format(positions)
+
+    def column(self, x):
+        """
+        All of the cells in one column, formatted just as rows are
+        """
+        if x < self.depth:
+            values = self.df.index.get_level_values(x)
+        else:
+            values = self.df.iloc[:, x - self.depth]
+        values = np.asarray(values, dtype=object)[self.positions]
+        return stringify(values) if values.size else values
+
+    def sort(self, x, key=None, reverse=False):
+        """
+        Reorder the rows by the cells in column x, leaving any head rows first
+        """
+        cells = self.column(x)
+        keys = cells if key is None else [key(i) for i in cells]
+        order = sorted(range(len(cells)), key=keys.__getitem__, reverse=reverse)
+        return PagedRows(self.df, self.positions[order], self.head)
+
+    def labels(self):
+        """
+        Row labels from the index, as the viewer shows them
+        """
+        return RowLabels(self)
+
+
+class RowLabels(object):
+    """
+    The index part of each row, joined up, worked out only when needed
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, y):
+        return " ".join(self.rows[y][: self.rows.depth])
+
+    def longest(self):
+        labels = [" ".join(row[: self.rows.depth]) for row in self.rows.sample()]
+        return max(labels, key=len, default="-")
+
+
+def stringify(cells):
+    """
+    Make every cell of an object array a string, with nothing for missing data
+    """
+    try:
+        cells = np.vectorize(str, otypes=[object])(cells)
+    except Exception:
+        np_codec = detect_encoding(cells.ravel().tolist())
+        cells = np.vectorize(lambda x: np_decode(x, np_codec), otypes=[object])(cells)
+    cells[cells == "nan"] = ""
+    return cells
+
+
 def process_data(data, enc=None, delim=None, **kwargs):
     """Given a data input, determine the input type and process data accordingly.
 
-    Returns a dictionary containing two entries: 'header', which corresponds to
-    the header row, and 'data', which corresponds to the data rows.
+    Returns a dictionary containing three entries: 'header', which corresponds to
+    the header row, 'data', which gives the data rows as they are needed, and
+    'index', the label of each row.
     """
-    if isinstance(data.index, pd.MultiIndex):
-        index = []
-        for item in list(data.index):
-            if isinstance(item, tuple):
-                item = [str(i) for i in item]
-                item = " ".join(item)
-            index.append(item)
+    names = list(data.index.names)
+    # as reset_index would name them
+    if len(names) == 1:
+        names = ["index" if names[0] is None else names[0]]
     else:
-        index = [str(i) for i in list(data.index)]
-    size = len(data.index.names)
-    try:
-        data = data.reset_index()
-    # happens if index name is in columns list
-    except ValueError:
-        # make a less likely name
-        data.index.names = ["__%s__" % str(x) for x in data.index.names]
-        data = data.reset_index()
-        fixed = [n.strip("_") for n in data.columns[:size]] + list(data.columns[size:])
-        data.columns = fixed
-    header = [str(i) for i in data.columns]
-    try:
-        unicode_convert = np.vectorize(str)
-        data = unicode_convert(data.values)
-    except:
-        np_codec = detect_encoding(
-            data.select_dtypes(include=["object"]).values.ravel().tolist()
-        )
-        unicode_convert = np.vectorize(lambda x: np_decode(x, np_codec))
-        data = unicode_convert(data.values)
-    data[np.where(data == "nan")] = ""
-    return {"data": data.tolist(), "header": header, "index": index}
+        names = ["level_%d" % i if n is None else n for i, n in enumerate(names)]
+    header = [str(i) for i in names + list(data.columns)]
+    rows = PagedRows(data)
+    return {"data": rows, "header": header, "index": rows.labels()}
 
 
 def np_decode(inp_str, codec):
@@ -0,0 +1,614 @@
+"""
+buzz: native tgrep over trees stored as arrays
+
+nltk's tgrep makes a ParentedTree from each bracketed parse, and then tests
+every node of every tree against a query made of python functions. Here,
+all of the trees in a DataFrame are instead parsed once, into arrays with one
+entry per node (leaves included) in preorder: its tree, its depth, its label
+and whether it is a leaf. Everything else (parents, subtrees, child
+numbers) is worked out from these with whole-array operations, and queries
+are compiled into boolean masks over all of the nodes at once.
+
+Results are the same as those of nltk's tgrep, where it does not fail: a
+matching leaf is a match of one token, rather than an error. Queries using
+features not handled here (node labels, macros, segmented patterns, N(), and
+the >>, and >>' relations, which nltk tests by equality of whole subtrees)
+raise Unsupported, so that the caller can fall back to nltk.
+"""
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+import pyparsing
+
+from .depgrep import Unsupported, _And, _Node, _Not, _Or
+
+# a tree string can't contain this, so it separates one tree from the next
+SEPARATOR = "\x00"
+
+# tokens as nltk's Tree.fromstring finds them, plus the separator
+TOKENS = re.compile(r"\x00|\(\s*[^\s()\x00]*|\)|[^\s()\x00]+")
+
+
+def _flat(tree):
+    """
+    A bracketed string for a parse, which may already be a tree, or missing
+    """
+    if isinstance(tree, str):
+        return tree
+    if hasattr(tree, "_pformat_flat"):
+        return tree._pformat_flat("", "()", False)
+    return ""
+
+
+def _starts(key):
+    """
+    Where each run of equal values in key begins
+    """
+    new = np.ones(len(key), dtype=bool)
+    new[1:] = key[1:] != key[:-1]
+    return new
+
+
+class _Trees(object):
+    """
+    Every node of a sequence of trees, as arrays in preorder
+    """
+
+    def __init__(self, tree, level, leaf, labels, n_trees):
+        self.tree = np.asarray(tree, dtype=np.int64)
+        self.level = np.asarray(level, dtype=np.int64)
+        self.leaf = np.asarray(leaf, dtype=bool)
+        # categorical labels, with words for leaves
+        self.labels = pd.Categorical(labels)
+        self.n_trees = n_trees
+        self.size = len(self.tree)
+        self.rows = np.arange(self.size)
+        self._make_structure()
+
+    @classmethod
+    def from_strings(cls, parses):
+        """
+        Parse bracketed trees, the parse column of one row per sentence, all at
+        once. Trees that nltk could not read are left out, like missing ones.
+        """
+        parses = [_flat(i) for i in parses]
+        tokens = TOKENS.findall(SEPARATOR.join(parses))
+        if not tokens:
+            return cls([], [], [], [], len(parses))
+        tokens = np.array(tokens, dtype=object)
+        kinds = tokens.astype("U1")
+        is_sep, is_open, is_close = kinds == SEPARATOR, kinds == "(", kinds == ")"
+        tree = np.cumsum(is_sep)
+        depth = np.cumsum(is_open.astype(np.int64) - is_close)
+        # depth within each tree, which a bad tree before it cannot change
+        base = np.concatenate([[0], depth[is_sep]])
+        depth = depth - base[tree]
+        # nltk needs an opening bracket, then depth above zero until the end
+        real = ~is_sep
+        last = np.append(is_sep[1:], True) & real
+        first = np.concatenate([[True], is_sep[:-1]]) & real
+        bad = (first & ~is_open) | (last & (depth != 0)) | (real & ~last & (depth <= 0))
+        bad_trees = np.zeros(len(parses), dtype=bool)
+        bad_trees[tree[bad]] = True
+        keep = (is_open | ~(is_sep | is_close)) & ~bad_trees[tree]
+        leaf = ~is_open[keep]
+        # leaves are one deeper than the bracket they are in
+        level = depth[keep] + leaf
+        labels = [t[1:].lstrip() if t[0] == "(" else t for t in tokens[keep]]
+        return cls(tree[keep], level, leaf, labels, len(parses))
+
+    @classmethod
+    def from_frame(cls, df, n_trees):
+        """
+        Trees as stored by to_frame
+        """
+        if len(df) and df["tree"].max() >= n_trees:
+            raise ValueError("Trees do not match the data")
+        return cls(df["tree"].values, df["level"].values, df["leaf"].values, df["label"], n_trees)
+
+    def to_frame(self):
+        """
+        Just what is needed to make these trees again, for storage
+        """
+        data = dict(
+            tree=self.tree.astype(np.int32),
+            level=self.level.astype(np.int16),
+            leaf=self.leaf,
+            label=self.labels,
+        )
+        return pd.DataFrame(data)
+
+    def _make_structure(self):
+        """
+        Parents, subtrees, child numbers and leaves of each node
+        """
+        n, rows, level = self.size, self.rows, self.level
+        parent = np.full(n, -1, dtype=np.int64)
+        by_level = np.argsort(level, kind="stable")
+        bounds = np.searchsorted(level[by_level], np.arange(level.max(initial=0) + 2))
+        for lvl in range(2, len(bounds) - 1):
+            above = by_level[bounds[lvl - 1] : bounds[lvl]]
+            above = above[~self.leaf[above]]
+            nodes = by_level[bounds[lvl] : bounds[lvl + 1]]
+            # the parent of a node is the last bracket opened one level up
+            parent[nodes] = above[np.searchsorted(above, nodes) - 1]
+        # number of descendants, counted from the bottom up
+        size = np.zeros(n, dtype=np.int64)
+        for lvl in range(len(bounds) - 2, 1, -1):
+            nodes = by_level[bounds[lvl] : bounds[lvl + 1]]
+            np.add.at(size, parent[nodes], size[nodes] + 1)
+        self.parent = parent
+        # a node's subtree is everything from it up to end, in preorder
+        self.end = rows + size + 1
+        self.tree_end = np.cumsum(np.bincount(self.tree, minlength=self.n_trees))
+        has_parent = parent >= 0
+        self.has_parent = has_parent & ~self.leaf
+        self.children = np.bincount(parent[has_parent], minlength=n)
+        # number of each child, and its sister before it
+        order = rows[has_parent][np.argsort(parent[has_parent], kind="stable")]
+        new = _starts(parent[order])
+        starts = np.maximum.accumulate(np.where(new, np.arange(len(order)), 0))
+        self.rank = np.zeros(n, dtype=np.int64)
+        self.rank[order] = np.arange(len(order)) - starts
+        self.before = np.full(n, -1, dtype=np.int64)
+        self.before[order[1:][~new[1:]]] = order[:-1][~new[1:]]
+        # the first node with no children at or after each node
+        childless = np.where(self.children == 0, rows, n)
+        self.childless = np.minimum.accumulate(childless[::-1])[::-1]
+        # leaves, numbered through all of the trees, for the tokens matched
+        leaves = np.cumsum(self.leaf)
+        self.first = leaves - self.leaf
+        self.last = leaves[np.maximum(self.end - 1, 0)] if n else self.first
+        tree_leaves = np.bincount(self.tree[self.leaf], minlength=self.n_trees)
+        self.tree_start = np.cumsum(tree_leaves) - tree_leaves
+
+    def column(self, test):
+        """
+        Test each distinct label once, returning a mask over nodes
+        """
+        codes, uniques = self.labels.codes, self.labels.categories
+        matches = np.array([bool(test(i)) for i in uniques] + [False], dtype=bool)
+        return matches[codes]
+
+    def counts_within(self, mask, starts, ends):
+        """
+        For each node, how many of the nodes from starts to ends match mask?
+        """
+        counts = np.concatenate([[0], np.cumsum(mask)])
+        return counts[np.clip(ends, 0, self.size)] - counts[np.clip(starts, 0, self.size)]
+
+    def parent_is(self, mask):
+        """
+        For each node but leaves, which nltk gives no parent, does its parent match?
+        """
+        return self.has_parent & mask[np.maximum(self.parent, 0)]
+
+    def parent_of(self, mask):
+        """
+        For each node, do any of its children match mask?
+        """
+        out = np.zeros(self.size, dtype=bool)
+        out[self.parent[mask & (self.parent >= 0)]] = True
+        return out
+
+    def runs(self, key):
+        """
+        First and last node of each node's run of nodes in a row with equal key
+        """
+        new = _starts(key)
+        first = np.maximum.accumulate(np.where(new, self.rows, 0))
+        ends = np.append(new[1:], True)
+        last = np.minimum.accumulate(np.where(ends, self.rows, self.size)[::-1])[::-1]
+        return first, last
+
+
+class _Label(_Node):
+    """
+    A test on a node's label, or for leaves their word
+    """
+
+    def __init__(self, token):
+        self.lower = token.startswith("i@")
+        if self.lower:
+            token = token[2:].lower()
+        if token in {"*", "__"}:
+            self.test = lambda value: True
+        elif token.startswith('"'):
+            self.test = token[1:-1].replace('\\"', '"').replace("\\\\", "\\").__eq__
+        elif token.startswith("/"):
+            try:
+                self.test = re.compile(token[1:-1]).search
+            except re.error as err:
+                raise Unsupported(str(err)) from err
+        else:
+            self.test = token.__eq__
+
+    def mask(self, trees):
+        if self.lower:
+            return trees.column(lambda value: self.test(value.lower()))
+        return trees.column(self.test)
+
+
+class _Relation(_Node):
+    """
+    A relation between each node and others, with predicate for the others
+    """
+
+    def __init__(self, operator, predicate):
+        self.operator = operator
+        self.predicate = predicate
+        self.place = None
+        for prefix in ["<-", ">-", "<", ">"]:
+            if operator.startswith(prefix) and operator[len(prefix) :].isdigit():
+                self.operator, self.place = prefix + "N", int(operator[len(prefix) :])
+                break
+        self.operator = SYNONYMS.get(self.operator, self.operator)
+        if self.operator not in RELATIONS or self.place == 0:
+            raise Unsupported(f"Operator {operator}")
+
+    def mask(self, trees):
+        return RELATIONS[self.operator](self, trees, self.predicate.mask(trees))
+
+
+def _child_number(rel, trees):
+    """
+    Which nodes are the child named by the operator: nth, or nth from last
+    """
+    place = rel.place or 1
+    if rel.operator[1] == "-":
+        return trees.rank == trees.children[np.maximum(trees.parent, 0)] - place
+    return trees.rank == place - 1
+
+
+def _parent_of(rel, trees, mask):
+    return trees.parent_of(mask)
+
+
+def _child_of(rel, trees, mask):
+    return trees.parent_is(mask)
+
+
+def _parent_of_nth(rel, trees, mask):
+    return trees.parent_of(mask & _child_number(rel, trees))
+
+
+def _nth_child_of(rel, trees, mask):
+    return trees.parent_is(mask) & _child_number(rel, trees)
+
+
+def _parent_of_only(rel, trees, mask):
+    after = np.append(mask[1:], False)
+    return (trees.children == 1) & after
+
+
+def _only_child_of(rel, trees, mask):
+    return trees.parent_is(mask & (trees.children == 1))
+
+
+def _dominates(rel, trees, mask):
+    return trees.counts_within(mask, trees.rows + 1, trees.end) > 0
+
+
+def _dominated_by(rel, trees, mask):
+    # count the matching nodes whose descendants each node is among
+    change = np.zeros(trees.size + 1, dtype=np.int64)
+    np.add.at(change, trees.rows[mask] + 1, 1)
+    np.add.at(change, trees.end[mask], -1)
+    return ~trees.leaf & (np.cumsum(change)[:-1] > 0)
+
+
+def _dominates_leftmost(rel, trees, mask):
+    # first children of first children, down to a node with none
+    below = trees.counts_within(mask, trees.rows + 1, trees.childless + 1) > 0
+    return (trees.children > 0) & below
+
+
+def _dominates_rightmost(rel, trees, mask):
+    # last children of last children: the descendants ending where it ends
+    order = np.lexsort((trees.rows, trees.end))
+    first, last = trees.runs(trees.end[order])
+    below = trees.counts_within(mask[order], np.arange(trees.size) + 1, last + 1) > 0
+    out = np.zeros(trees.size, dtype=bool)
+    out[order] = below
+    return out
+
+
+def _single_runs(trees):
+    """
+    Where each node's unbroken line of nodes with just one child starts and ends
+    """
+    single = trees.children == 1
+    first, last = trees.runs(single)
+    return np.where(single, first, trees.rows), np.where(single, last + 1, trees.rows)
+
+
+def _dominates_only(rel, trees, mask):
+    # a node's only child comes right after it
+    first, end = _single_runs(trees)
+    return trees.counts_within(mask, trees.rows + 1, end + 1) > 0
+
+
+def _only_descendant_of(rel, trees, mask):
+    # the nodes before a node with just one child each are all above it
+    first, _ = _single_runs(trees)
+    above = np.maximum(trees.rows - 1, 0)
+    single = (trees.rows > 0) & (trees.children[above] == 1)
+    starts = np.where(single, first[above], trees.rows)
+    return ~trees.leaf & (trees.counts_within(mask, starts, trees.rows) > 0)
+
+
+def _precedes_immediately(rel, trees, mask):
+    # the node after a subtree, and its first children of first children
+    after = np.minimum(trees.end, trees.size - 1)
+    inside = trees.end < trees.tree_end[trees.tree]
+    found = trees.counts_within(mask, after, trees.childless[after] + 1) > 0
+    return ~trees.leaf & inside & found
+
+
+def _follows_immediately(rel, trees, mask):
+    # go up through first children, then take the subtrees ending there
+    linked = np.zeros(trees.size, dtype=bool)
+    linked[1:] = trees.parent[1:] == trees.rows[:-1]
+    top = np.maximum.accumulate(np.where(linked, 0, trees.rows))
+    ends = np.zeros(trees.size + 1, dtype=bool)
+    ends[trees.end[mask]] = True
+    return ~trees.leaf & (trees.parent[top] >= 0) & ends[top]
+
+
+def _precedes(rel, trees, mask):
+    latest = np.full(trees.n_trees, -1, dtype=np.int64)
+    np.maximum.at(latest, trees.tree[mask], trees.rows[mask])
+    return ~trees.leaf & (latest[trees.tree] >= trees.end)
+
+
+def _follows(rel, trees, mask):
+    earliest = np.full(trees.n_trees, trees.size + 1, dtype=np.int64)
+    np.minimum.at(earliest, trees.tree[mask], trees.end[mask])
+    return ~trees.leaf & (earliest[trees.tree] <= trees.rows)
+
+
+def _sister_of(rel, trees, mask):
+    counts = np.bincount(trees.parent[mask & (trees.parent >= 0)], minlength=trees.size)
+    others = counts[np.maximum(trees.parent, 0)] - mask
+    return trees.has_parent & (others > 0)
+
+
+def _sister_before(rel, trees, mask):
+    # nltk skips sisters that are empty brackets
+    after = np.minimum(trees.end, trees.size - 1)
+    same = (trees.end < trees.size) & (trees.parent[after] == trees.parent)
+    full = trees.leaf | (trees.children > 0)
+    return trees.has_parent & same & (mask & full)[after]
+
+
+def _sister_after(rel, trees, mask):
+    before = np.maximum(trees.before, 0)
+    full = trees.leaf | (trees.children > 0)
+    return trees.has_parent & (trees.before >= 0) & (mask & full)[before]
+
+
+def _sister_somewhere(trees, mask, later):
+    found = mask & (trees.parent >= 0)
+    if later:
+        ranks = np.full(trees.size, -1, dtype=np.int64)
+        np.maximum.at(ranks, trees.parent[found], trees.rank[found])
+        hit = ranks[np.maximum(trees.parent, 0)] > trees.rank
+    else:
+        ranks = np.full(trees.size, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(ranks, trees.parent[found], trees.rank[found])
+        hit = ranks[np.maximum(trees.parent, 0)] < trees.rank
+    return trees.has_parent & hit
+
+
+def _sister_precedes(rel, trees, mask):
+    return _sister_somewhere(trees, mask, later=True)
+
+
+def _sister_follows(rel, trees, mask):
+    return _sister_somewhere(trees, mask, later=False)
+
+
+RELATIONS = {
+    "<": _parent_of,
+    ">": _child_of,
+    "<N": _parent_of_nth,
+    ">N": _nth_child_of,
+    "<-N": _parent_of_nth,
+    ">-N": _nth_child_of,
+    "<:": _parent_of_only,
+    ">:": _only_child_of,
+    "<<": _dominates,
+    ">>": _dominated_by,
+    "<<,": _dominates_leftmost,
+    "<<'": _dominates_rightmost,
+    "<<:": _dominates_only,
+    ">>:": _only_descendant_of,
+    ".": _precedes_immediately,
+    ",": _follows_immediately,
+    "..": _precedes,
+    ",,": _follows,
+    "$": _sister_of,
+    "$.": _sister_before,
+    "$,": _sister_after,
+    "$..": _sister_precedes,
+    "$,,": _sister_follows,
+}
+
+# other ways of writing the same operators
+SYNONYMS = {
+    "<,": "<N",
+    ">,": ">N",
+    "<'": "<-N",
+    "<-": "<-N",
+    ">'": ">-N",
+    ">-": ">-N",
+    "<<1": "<<,",
+    "%": "$",
+    "%.": "$.",
+    "%,": "$,",
+    "%..": "$..",
+    "%,,": "$,,",
+}
+
+
+def _unsupported_action(_s, _l, tokens):
+    raise Unsupported(f"Cannot run natively: {tokens}")
+
+
+def _node_action(_s, _l, tokens):
+    if tokens[0] == "'":
+        tokens = tokens[1:]
+    if len(tokens) > 1:
+        return _Or([_node_action(_s, _l, [node]) for node in tokens[::2]])
+    if isinstance(tokens[0], _Node):
+        return tokens[0]
+    return _Label(tokens[0])
+
+
+def _node_label_action(_s, _l, tokens):
+    if len(tokens) > 1:
+        raise Unsupported("Node labels")
+    return tokens[0]
+
+
+def _relation_action(_s, _l, tokens):
+    negated = tokens[0] == "!"
+    if negated:
+        tokens = tokens[1:]
+    if tokens[0] == "[":
+        relation = tokens[1]
+    else:
+        relation = _Relation(*tokens)
+    return _Not(relation) if negated else relation
+
+
+def _conjunction_action(_s, _l, tokens, join_char="&"):
+    tokens = [i for i in tokens if i != join_char]
+    if len(tokens) == 1:
+        return tokens[0]
+    return _And(tokens)
+
+
+def _disjunction_action(_s, _l, tokens):
+    tokens = [i for i in tokens if i not in {"|", ";"}]
+    if len(tokens) == 1:
+        return tokens[0]
+    return _Or(tokens)
+
+
+@functools.lru_cache(maxsize=1)
+def _build_parser():
+    """
+    nltk's tgrep grammar, with actions that build _Nodes rather than functions
+    """
+    op = pyparsing.Optional("!") + pyparsing.Regex("[$%,.<>][%,.<>0-9-':]*")
+    qstring = pyparsing.QuotedString(quoteChar='"', escChar="\\", unquoteResults=False)
+    node_regex = pyparsing.QuotedString(quoteChar="/", escChar="\\", unquoteResults=False)
+    qstring_icase = pyparsing.Regex('i@\\"(?:[^"\\n\\r\\\\]|(?:\\\\.))*\\"')
+    node_regex_icase = pyparsing.Regex("i@\\/(?:[^/\\n\\r\\\\]|(?:\\\\.))*\\/")
+    node_literal = pyparsing.Regex("[^][ \r\t\n;:.,&|<>()$!@%'^=]+")
+    expr = pyparsing.Forward()
+    relations = pyparsing.Forward()
+    parens = pyparsing.Literal("(") + expr + ")"
+    tree_pos = pyparsing.Regex(r"N\([0-9,]*\)")
+    node_label = pyparsing.Regex("[A-Za-z0-9]+")
+    node_label_use = pyparsing.Combine("=" + node_label)
+    node_label_use_pred = node_label_use.copy()
+    macro_name = pyparsing.Regex("[^];:.,&|<>()[$!@%'^=\r\t\n ]+")
+    macro_name.setWhitespaceChars("")
+    macro_use = pyparsing.Combine("@" + macro_name)
+    node_expr = (
+        node_label_use_pred
+        | macro_use
+        | tree_pos
+        | qstring_icase
+        | node_regex_icase
+        | qstring
+        | node_regex
+        | "*"
+        | node_literal
+    )
+    node_expr2 = (
+        node_expr
+        + pyparsing.Literal("=").setWhitespaceChars("")
+        + node_label.copy().setWhitespaceChars("")
+    ) | node_expr
+    node = parens | (
+        pyparsing.Optional("'") + node_expr2 + pyparsing.ZeroOrMore("|" + node_expr)
+    )
+    brackets = pyparsing.Optional("!") + "[" + relations + "]"
+    relation = brackets | (op + node)
+    rel_conjunction = pyparsing.Forward()
+    rel_conjunction << (relation + pyparsing.ZeroOrMore(pyparsing.Optional("&") + rel_conjunction))
+    relations << rel_conjunction + pyparsing.ZeroOrMore("|" + relations)
+    expr << node + pyparsing.Optional(relations)
+    expr_labeled = node_label_use + pyparsing.Optional(relations)
+    expr2 = expr + pyparsing.ZeroOrMore(":" + expr_labeled)
+    macro_defn = pyparsing.Literal("@") + pyparsing.White().suppress() + macro_name + expr2
+    exprs = (
+        pyparsing.Optional(macro_defn + pyparsing.ZeroOrMore(";" + macro_defn) + ";")
+        + expr2
+        + pyparsing.ZeroOrMore(";" + (macro_defn | expr2))
+        + pyparsing.ZeroOrMore(";").suppress()
+    )
+
+    node_label_use.setParseAction(_unsupported_action)
+    node_label_use_pred.setParseAction(_unsupported_action)
+    macro_use.setParseAction(_unsupported_action)
+    macro_defn.setParseAction(_unsupported_action)
+    expr_labeled.setParseAction(_unsupported_action)
+    tree_pos.setParseAction(_unsupported_action)
+    node.setParseAction(_node_action)
+    node_expr2.setParseAction(_node_label_action)
+    parens.setParseAction(lambda s, _l, t: t[1])
+    relation.setParseAction(_relation_action)
+    rel_conjunction.setParseAction(_conjunction_action)
+    relations.setParseAction(_disjunction_action)
+    expr.setParseAction(_conjunction_action)
+    expr2.setParseAction(functools.partial(_conjunction_action, join_char=":"))
+    exprs.setParseAction(_disjunction_action)
+    return exprs.ignore("#" + pyparsing.restOfLine)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(query):
+    """
+    Turn a tgrep query into a _Node, raising Unsupported if we can't
+    """
+    if isinstance(query, bytes):
+        query = query.decode()
+    try:
+        return list(_build_parser().parseString(query, parseAll=True))[0]
+    except pyparsing.ParseBaseException as err:
+        raise Unsupported(str(err)) from err
+
+
+def _tgrep_grams(trees, mask, keys):
+    """
+    Turn matching nodes into what Searcher._tgrep_iteration gives: for each
+    token of a match, the token numbers of the match joined by commas. Where
+    matches overlap, the last one in preorder wins.
+
+    keys: (file, s, i) index of the row holding each tree
+    """
+    nodes = np.flatnonzero(mask)
+    if not len(nodes):
+        return pd.Series(dict())
+    # token numbers of each match, from 1 in its sentence
+    starts = trees.first[nodes] - trees.tree_start[trees.tree[nodes]] + 1
+    lengths = trees.last[nodes] - trees.first[nodes]
+    forms = [",".join(map(str, range(s, s + n))) for s, n in zip(starts, lengths)]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    tokens = np.repeat(starts, lengths) + offsets
+    rows = np.repeat(trees.tree[nodes], lengths)
+    files = keys.get_level_values(0)[rows]
+    sents = keys.get_level_values(1)[rows]
+    index = pd.MultiIndex.from_arrays([files, sents, tokens])
+    grams = pd.Series(np.repeat(np.array(forms, dtype=object), lengths), index=index)
+    if not index.has_duplicates:
+        return grams
+    # rows in the order they were first matched, with their last match
+    last = grams[~index.duplicated(keep="last")]
+    return last.reindex(index[~index.duplicated(keep="first")])
@@ -2,18 +2,16 @@
 buzz's topology method
 """
 
-from collections import defaultdict
 import pandas as pd
 import numpy as np
 from joblib import Parallel
 from .constants import TOPOLOGY_QUERIES
+from .depgrep import Unsupported, _depgrep_pairs, _Tokens
 from . import multi
-from .utils import _get_tqdm, _tqdm_update, _tqdm_close
+from .search import Searcher
 
 from scipy.spatial.distance import cosine
 
-tqdm = _get_tqdm()
-
 
 def _cos_unit(row, df=None):
     """
@@ -83,28 +81,18 @@ class TopologyData(pd.DataFrame):
         return self.T.word_axis("euclid", "cos_unit")
 
 
-def _process_chunk(dataset, word, name, query, is_bool, features_of_interest, counts):
-    # dataset = pd.read_pickle(dataset)
+def _count_features(result, word, name, features_of_interest, counts):
+    """
+    Count the features of one search result for word, relative to its frequency
+    """
     results = dict()
-    if not isinstance(query, str):
-        # lambda query can be done as an apply, no depgrep
-        result = dataset[dataset.apply(query, axis=1)]
-    else:
-        # put the lemma into the unformatted query
-        query = query.format(query=f'l"{word}"')
-        result = dataset.depgrep(query, position=None)
-    if result.empty:
-        # or return df
-        return
     # if we have not specified which particular features to count,
     # e.g. {w, l, x}, we just count the result row itself
     if not features_of_interest:
         count = len(result) / counts[word]
         if count > 0:
-            return word, {name.lower(): count}
-        else:
-            return
-
+            results[name.lower()] = count
+        return results
     # this is almost certainly if we want the index of the word (i)
     if any(i in {"file", "s", "i"} for i in features_of_interest):
         result = result.reset_index()
@@ -118,14 +106,81 @@ def _process_chunk(dataset, word, name, query, is_bool, features_of_interest, co
             bits = [name, col, str(realisation)]
             # the replace is for -pron- lemma mostly
             feature_name = "_".join(bits).lower().replace("-", "")
-            # divide occurrences by length of corpus
-            # a value of 1 would indicate that all that occurred in the
-            # corpus was this feature??
-            count = subc / len(dataset)
-            if count > 0:
+            if subc > 0:
                 # not sure if we should divide by corpus length instead?
-                results[feature_name] = subc / counts[word]
-        return word, results
+                # realisations differing only in case are the same feature
+                results[feature_name] = results.get(feature_name, 0) + subc / counts[word]
+    return results
+
+
+def _word_rows(df, words):
+    """
+    The rows that l"word" matches, for each word by its number
+    """
+    numbers = dict()
+    for n, word in enumerate(words):
+        numbers.setdefault(word.lower(), list()).append(n)
+    column = df["l"]
+    if column.dtype.name == "category":
+        codes, uniques = column.cat.codes.values, column.cat.categories
+    else:
+        codes, uniques = pd.factorize(column.values)
+    # word numbers for each distinct lemma, and none for missing ones (code -1)
+    found = [numbers.get(i.lower(), []) if isinstance(i, str) else [] for i in uniques] + [[]]
+    sizes = np.array([len(i) for i in found])
+    flat = np.array([n for i in found for n in i], dtype=np.int64)
+    starts = np.cumsum(sizes) - sizes
+    rows = np.flatnonzero(sizes[codes] > 0)
+    repeats = sizes[codes[rows]]
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return np.repeat(rows, repeats), flat[np.repeat(starts[codes[rows]], repeats) + offsets]
+
+
+def _template_counts(df, tokens, slots, words, name, query, features_of_interest, counts):
+    """
+    Count the features of the results of query for every word at once, as
+    _count_features does for one word's results
+
+    slots: the rows and word numbers from _word_rows
+
+    Return: list of (word, {feature: count}) tuples
+    """
+    rows, numbers = _depgrep_pairs(query, df, *slots, len(words), tokens)
+    totals = counts[words].values
+    results = [dict() for _ in words]
+    if not features_of_interest:
+        found = np.bincount(numbers, minlength=len(words))
+        for n in np.flatnonzero(found):
+            results[n][name.lower()] = found[n] / totals[n]
+    for col in features_of_interest or ():
+        found = pd.DataFrame(dict(word=numbers, value=df[col].values[rows]))
+        found = found.groupby(["word", "value"], observed=True, sort=False).size()
+        for (n, realisation), subc in found.items():
+            bits = [name, col, str(realisation)]
+            # the replace is for -pron- lemma mostly
+            feature_name = "_".join(bits).lower().replace("-", "")
+            results[n][feature_name] = results[n].get(feature_name, 0) + subc / totals[n]
+    return [(words[n], i) for n, i in enumerate(results) if i]
+
+
+def _process_chunk(dataset, searches, counts, position=0):
+    """
+    Run a chunk of searches in one pass over dataset, counting the features
+    of each result. Queries for the same word share their lemma test, and
+    all of them share their other nodes.
+
+    Return: list of (word, {feature: count}) tuples
+    """
+    # put the lemma into the unformatted query
+    queries = {(word, name): query.format(query=f'l"{word}"') for word, name, query, *_ in searches}
+    found = Searcher().run_many(dataset, queries, position=position)
+    out = list()
+    for word, name, _query, _is_bool, features_of_interest in searches:
+        result = found[(word, name)]
+        if result.empty:
+            continue
+        out.append((word, _count_features(result, word, name, features_of_interest, counts)))
+    return out
 
 
 def _topology(dataset, kind="verb", wordlist=None, min_occur=10, *args, **kwargs):
@@ -143,75 +198,44 @@ def _topology(dataset, kind="verb", wordlist=None, min_occur=10, *args, **kwargs
     n_search = n_tok * len(queries)
     formatted = ", ".join(to_search)
     print(f"To be analysed ({n_tok} tokens, {n_search} searches): {formatted}\n\n")
-    # all the results end up in this huge dict
-    huge = defaultdict(dict)
-    searches = list()
     multiprocess = multi.how_many(kwargs.pop("multiprocess", True))
-    for word in to_search:
-        for name, (query, is_bool, features_of_interest) in queries.items():
-            # todo: remove when there are no more lambdas
-            if isinstance(query, str):
-                searches.append(
-                    [word, name, query, is_bool, features_of_interest, counts.copy()]
-                )
-
-    if multiprocess and multiprocess > 1:
-        # multiprocess does not work with lambda queries!
-        chunks = np.array_split(searches, multiprocess)
-        delay = (multi.topology(dataset, x, i) for i, x in enumerate(chunks))
-        results = Parallel(n_jobs=multiprocess)(delay)
-        results = [item for sublist in results for item in sublist]
-        out = defaultdict(dict)
-        for result in results:
-            if result is None:
-                continue
-            term, freq = result
-            out[term].update(freq)
-        top = TopologyData(out)
-        return top.fillna(0.0)
-
-    t = tqdm(ncols=120, unit="query", desc=f"Counting {kind.lower()}s", total=n_search)
-    for word, name, query, _is_bool, features_of_interest, _ in searches:
-        huge[word] = dict()
+    # each query is compiled once and run for every word together, where it can be
+    df = Searcher()._depgrep_frame(dataset)
+    tokens = _Tokens(df)
+    slots = _word_rows(df, to_search)
+    # but l"root" would match the governor of root tokens, which the slot cannot
+    templates = not any(word.lower() == "root" for word in to_search)
+    results = list()
+    searches = list()
+    for name, (query, is_bool, features_of_interest) in queries.items():
+        # todo: remove when there are no more lambdas
         if not isinstance(query, str):
-            # lambda query can be done as an apply, no depgrep
-            result = dataset[dataset.apply(query, axis=1)]
-        else:
-            # put the lemma into the unformatted query
-            query = query.format(query=f'l"{word}"')
-            result = dataset.depgrep(query, position=None)
-        if result.empty:
-            _tqdm_update(t, postfix=word)
             continue
-        # if we have not specified which particular features to count,
-        # e.g. {w, l, x}, we just count the result row itself
-        if not features_of_interest:
-            count = len(result) / counts[word]
-            if count > 0:
-                huge[word][name.lower()] = count
-            _tqdm_update(t, postfix=word)
-            continue
-        # this is almost certainly if we want the index of the word (i)
-        if any(i in {"file", "s", "i"} for i in features_of_interest):
-            result = result.reset_index()
-        for col in features_of_interest:
-            # in our search result, count tokens (rows) by feature of interest
-            valcount = result[col].value_counts()
-            # this could be an apply, but we need both key and value
-            # so we would need to make it into a DataFrame... annoying
-            for realisation, subc in valcount.items():
-                # make the feature name
-                bits = [name, col, str(realisation)]
-                # the replace is for -pron- lemma mostly
-                feature_name = "_".join(bits).lower().replace("-", "")
-                # divide occurrences by length of corpus
-                # a value of 1 would indicate that all that occurred in the
-                # corpus was this feature??
-                count = subc / len(dataset)
-                if count > 0:
-                    # not sure if we should divide by corpus length instead?
-                    huge[word][feature_name] = subc / counts[word]
-            _tqdm_update(t, postfix=word)
-    _tqdm_close(t)
+        try:
+            if not templates:
+                raise Unsupported("ROOT as a word")
+            found = _template_counts(
+                df, tokens, slots, to_search, name, query, features_of_interest, counts
+            )
+            results += found
+        except Unsupported:
+            # otherwise, one search for each word
+            searches += [[word, name, query, is_bool, features_of_interest] for word in to_search]
+
+    if searches and multiprocess and multiprocess > 1:
+        # multiprocess does not work with lambda queries!
+        chunks = np.array_split(np.array(searches, dtype=object), multiprocess)
+        # workers map one shared copy of the data, and need only the searched counts
+        with multi.shared(dataset, multiprocess) as data:
+            delay = (multi.topology(data, x, counts[to_search], i) for i, x in enumerate(chunks))
+            nested = Parallel(n_jobs=multiprocess)(delay)
+        results += [item for sublist in nested for item in sublist]
+    elif searches:
+        results += _process_chunk(dataset, searches, counts)
+
+    # all the results end up in this huge dict
+    huge = {word: dict() for word in to_search}
+    for word, freq in results:
+        huge[word].update(freq)
     top = TopologyData(huge)
     return top.fillna(0.0)
@@ -1,7 +1,7 @@
 import os
-import re
 import shutil
-from io import StringIO
+import zlib
+from functools import lru_cache
 from typing import List, Optional
 
 import numpy as np
@@ -13,11 +13,11 @@ from tqdm import tqdm, tqdm_notebook
 from .constants import (
     BENEPAR_LANGUAGES,
     COLUMN_NAMES,
-    CONLL_COLUMNS,
     DTYPES,
     LONG_NAMES,
     MORPH_FIELDS,
     LANGUAGE_TO_MODEL,
+    LOAD_MAX_BYTES,
 )
 
 
@@ -198,9 +198,10 @@ def _make_tree(tree):
         return
 
 
+@lru_cache(maxsize=None)
 def _get_nlp(language="en", constituencies=False):
     """
-    Get spaCY/benepar with models by language
+    Get spaCY/benepar with models by language, loading each only once per process
     """
     import spacy
 
@@ -241,66 +242,6 @@ def cast(text):
         return text
 
 
-def _make_csv(raw_lines, fname, usecols, folders):
-    """
-    Turn raw CONLL-U file data into something pandas' CSV reader can easily and quickly read.
-
-    The main thing to do is to add the [file, sent#, token#] index, and transform the metadata
-    stored as comments into additional columns
-
-    folders: a seperate column for subcorpus, or should it
-    be in the file level of the multiindex
-
-    Return: str (CSV data) and list of dicts (metadata for each discovered sentence)
-    """
-    csvdat = list()  # a list of csv strings as we make them
-    meta_dicts = list()  # our sent-level metadata will go in here
-    # todo: find better way to use correct path as file index
-    fname = os.path.normcase(fname)
-    fname = fname.rsplit("-parsed" + os.sep)[-1]
-    # no file extensions!
-    if ".txt" in fname:
-        fname = fname.split(".txt", 1)[0]
-    # how to deal with folders??
-    if folders == "column" or not folders:
-        colname, fname = fname.rsplit("/", 1)
-        colname = colname.split("/conllu/", 1)[-1]
-    else:
-        fname = fname.split("/conllu/", 1)[-1]
-
-    # make list of sentence strings
-    sents = raw_lines.strip().split("\n\n")
-    # split into metadata and csv parts by getting first numbered row. probably but not always 1
-    splut = [re.split("\n([0-9])", s, 1) for s in sents]
-    regex = "^# (.*?) = (.*?)$"
-    enumerated = enumerate(splut, start=1)
-    for sent_id, triplet in enumerated:
-        # error handling: if the regex didn't end up with 3 parts, there is a problem with the data
-        if len(triplet) != 3:
-            raise ValueError(f"Data format problem in {fname}: {triplet}")
-        raw_sent_meta, one, text = triplet
-        text = one + text  # rejoin it as it was
-        sent_meta = dict()
-        if folders == "column":
-            sent_meta["subcorpus"] = colname
-        # get every metadata row, split into key//value
-        found = re.findall(regex, raw_sent_meta, re.MULTILINE)
-        for key, value in found:
-            # turn the string into an object if it's valid json
-            if usecols and key.strip() not in usecols:
-                continue
-            sent_meta[key.strip()] = cast(value.strip())
-        # add the fsi part to every row
-        lines = text.splitlines()
-        text = "\n".join(f"{fname}\t{sent_id}\t{line}" for line in lines)
-        # add csv and meta to our collection
-        csvdat.append(text)
-        meta_dicts.append(sent_meta)
-
-    # return the csv without the double newline so it can be read all at once. add meta_dicts later.
-    return "\n".join(csvdat), meta_dicts
-
-
 def _order_df_columns(df, metadata=None, morph=None):
     if metadata is None:
         metadata = [i for i in list(df.columns) if i not in COLUMN_NAMES]
@@ -313,29 +254,70 @@ def _order_df_columns(df, metadata=None, morph=None):
     return df[with_n]
 
 
-def _apply_governor(row, df=None, dummy=None):
+def _sentence_offsets(index):
     """
-    Appliable function to get the governor of a token. Slow.
+    Row number at which each sentence starts, from a file/s/i MultiIndex
     """
-    try:
-        return df.loc[row.name[0], row.name[1], row["g"]]
-    except Exception:
-        return dummy
+    if not len(index):
+        return np.array([], dtype=np.int64)
+    files, sents = index.codes[0], index.codes[1]
+    change = (files[1:] != files[:-1]) | (sents[1:] != sents[:-1])
+    return np.concatenate([[0], np.flatnonzero(change) + 1]).astype(np.int64)
+
+
+def _fingerprint(values):
+    """
+    Identify the contents of an array or pd.Categorical cheaply, so that a
+    cache made from it can tell when it has been replaced or edited in place
+    """
+    if isinstance(values, pd.Categorical):
+        categories = values.categories
+        return _fingerprint(values.codes) + (id(categories), len(categories))
+    values = np.asarray(values)
+    address = values.__array_interface__["data"][0]
+    if values.dtype == object:
+        # no buffer to checksum, so use which objects it holds
+        values = np.fromiter(map(id, values), dtype=np.intp, count=len(values))
+    return address, len(values), zlib.crc32(np.ascontiguousarray(values))
+
+
+def _governor_positions(df):
+    """
+    Row number of each token's governor, or -1 for root (or missing) governors.
+
+    If the index has duplicates, as when a Dataset is concatenated with itself,
+    governors are looked up at the first row with the matching file, s and i.
+    """
+    if "g" not in df.columns:
+        return
+    index = df.index
+    target = pd.MultiIndex.from_arrays(
+        [index.get_level_values("file"), index.get_level_values("s"), df["g"].values]
+    )
+    if index.is_unique:
+        return index.get_indexer(target).astype(np.int64)
+    first = ~index.duplicated()
+    found = index[first].get_indexer(target)
+    return np.where(found >= 0, np.flatnonzero(first)[found], -1).astype(np.int64)
 
 
 def _add_governor(df):
     """
-    Add governor features to dataframe. Slow.
+    Add governor features to dataframe
     """
     cols = ["w", "l", "x", "p", "f", "g"]
-    dummy = pd.Series(["ROOT", "ROOT", "ROOT", "ROOT", "ROOT", 0])
-    govs = df.apply(
-        _apply_governor, df=df[cols], axis=1, result_type="reduce", dummy=dummy
-    )
-    govs["g"] = govs["g"].fillna(0).astype(int)
+    positions = getattr(df, "governor_positions", None)
+    if positions is None:
+        positions = _governor_positions(df)
+    found = positions >= 0
+    govs = dict()
+    for col in cols:
+        values = np.full(len(df), 0 if col == "g" else "ROOT", dtype=object)
+        values[found] = np.asarray(df[col].values, dtype=object)[positions[found]]
+        govs["g" + col] = values
+    govs = pd.DataFrame(govs, index=df.index)
+    govs["gg"] = govs["gg"].fillna(0).astype(int)
     govs = govs.fillna("ROOT")
-    govs = govs[["w", "l", "x", "p", "f", "g"]]
-    govs.columns = ["g" + i for i in list(govs.columns)]
     return pd.concat([df, govs], axis=1, sort=False)
 
 
@@ -384,10 +366,13 @@ def _to_df(
     morph: bool = True,
     misc: bool = True,
     _complete: bool = True,  # internal use only
+    _origins: Optional[dict] = None,  # internal use only
+    _sents: Optional[list] = None,  # internal use only
 ):
     """
     Turn buzz.corpus.Corpus into a Dataset (i.e. pd.DataFrame-like object)
     """
+    from .conllu import _read_conllu, _read_sents
     from .corpus import Corpus
     from .dataset import Dataset
     from .file import File
@@ -396,42 +381,36 @@ def _to_df(
     # path to a conll file
     if isinstance(corpus, str) and os.path.isfile(corpus):
         corpus = File(corpus)
+    # sentences of this file that the parser already has in memory
+    if _sents is not None:
+        if not _sents:
+            return
     # a buzz corpus or file: get raw contents
-    if isinstance(corpus, (Corpus, File)):
+    elif isinstance(corpus, (Corpus, File)):
         with open(corpus.path, "r") as fo:
             data = fo.read().strip("\n")
 
-    if not data.strip():
+    if _sents is None and not data.strip():
         # print(f"File empty: {corpus.path}")
         return
     # if a directory, do nothing much
     elif isinstance(corpus, str) and not os.path.exists(corpus):
         data = corpus
 
-    # add file and s columns to the csv string; get metadata as well
-    data, metadata = _make_csv(data, usename or corpus.path, usecols, folders)
-
     # user can only load a subset, but index always needed
-    csv_usecols = None
     if usecols is not None:
         usecols = usecols + [i for i in ["file", "s", "i"] if i not in usecols]
-        # usecols for pandas read_csv. todo: can i just make it usecols?
-        csv_usecols = [i for i in usecols if i in ["file", "s"] + CONLL_COLUMNS]
-
-    df = pd.read_csv(
-        StringIO(data),
-        sep="\t",
-        header=None,
-        names=COLUMN_NAMES,
-        quoting=3,
-        index_col=["file", "s", "i"],
-        engine="c",
-        na_filter=False,
-        # na_values="_",
-        usecols=csv_usecols,
-    )
 
-    # df = df.set_index(["file", "s", "i"])
+    # read straight into column arrays, getting sentence metadata as well
+    if _sents is not None:
+        columns, metadata = _read_sents(_sents, usename or corpus.path, usecols, folders)
+    else:
+        columns, metadata = _read_conllu(data, usename or corpus.path, usecols, folders)
+    index = pd.MultiIndex.from_arrays(
+        [columns.pop("file"), columns.pop("s"), columns.pop("i")],
+        names=["file", "s", "i"],
+    )
+    df = pd.DataFrame(columns, index=index)
 
     morph_cols, misc_cols = list(), list()
     if morph and "m" in df.columns and (~df["m"].isin(["_", ""])).any():
@@ -440,6 +419,10 @@ def _to_df(
     if misc and "o" in df.columns and (~df["o"].isin(["_", ""])).any():
         df, misc_cols = _parse_out_multiples(df, path=corpus.path)
 
+    # let the caller know which columns came from the m and o fields
+    if _origins is not None:
+        _origins.update(morph=morph_cols, misc=misc_cols)
+
     # make a dataframe containing sentence level metadata, then join it to main df
     metadata = {i: d for i, d in enumerate(metadata, start=1)}
     metadata = pd.DataFrame(metadata).T
@@ -460,11 +443,77 @@ def _to_df(
     badcols = ["o", "m"]
     df = df.drop(badcols, axis=1, errors="ignore")
 
-    df = df.fillna("_")
-
     # setting types is really expensive, cheaper on whole corpus
     # do not do
-    if set_data_types and _complete:
+    df = _finish_df(df, set_data_types and _complete, add_governor)
+    # but categories are cheap to make now, and save a lot of memory later
+    if set_data_types and not _complete:
+        df = _encode_categories(df)
+    return Dataset(df, name=usename or corpus.name)
+
+
+def _encode_categories(df):
+    """
+    Dictionary-encode the columns that will end up categorical, with categories
+    in order of appearance. `_concat_categories` makes them match across files.
+    """
+    for col in df.columns:
+        if DTYPES.get(col) != "category" or df[col].dtype.name == "category":
+            continue
+        try:
+            codes, uniques = pd.factorize(df[col].values)
+        # unhashable values, which can't be categories anyway
+        except TypeError:
+            continue
+        df[col] = pd.Categorical.from_codes(codes, uniques)
+    return df
+
+
+def _decode_categories(df):
+    """
+    Undo _encode_categories, for when categories are not wanted
+    """
+    for col in df.columns:
+        if df[col].dtype.name == "category":
+            df[col] = df[col].astype(object)
+    return df
+
+
+def _concat_categories(dfs):
+    """
+    Concatenate DataFrames, first giving each categorical column the same
+    categories in every one of them. This way, pandas only has to join up the
+    integer codes, and never makes a column of strings for the whole corpus.
+
+    Categories are sorted as `astype("category")` would sort them.
+    """
+    columns = dict()
+    for df in dfs:
+        for col in df.columns:
+            columns.setdefault(col, list()).append(df[col].dtype.name == "category")
+    for col, categorical in columns.items():
+        if not all(categorical):
+            continue
+        # every category, in order of appearance, then sorted like pandas does
+        found = [df[col].cat.categories for df in dfs if col in df.columns]
+        vocabulary = pd.unique(np.concatenate([np.asarray(i, dtype=object) for i in found]))
+        categories = pd.Categorical(vocabulary).categories
+        dtype = pd.CategoricalDtype(categories)
+        for df in dfs:
+            if col in df.columns:
+                df[col] = df[col].cat.set_categories(categories)
+            else:
+                df[col] = pd.Categorical.from_codes(np.full(len(df), -1), dtype=dtype)
+    return pd.concat(dfs, sort=False)
+
+
+def _finish_df(df, set_data_types=True, add_governor=False):
+    """
+    Last steps of turning a file into a DataFrame: set types, add governor
+    and use nan for missing values
+    """
+    df = df.fillna("_")
+    if set_data_types:
         df = _set_best_data_types(df)
     # adding governor is cheaper when corpus is in chunks, so do now
     if "g" in df.columns and add_governor:
@@ -474,7 +523,7 @@ def _to_df(
     # sometimes w can be missing for some non-loaded corpora
     if "w" in df.columns:
         df["w"] = df["w"].replace(np.nan, "_")
-    return Dataset(df, name=usename or corpus.name)
+    return df
 
 
 def _get_short_name_from_long_name(longname):
@@ -536,6 +585,15 @@ def _series_to_wordlist(series, by, top):
     return lst + [None] * (top - len(lst))
 
 
+def _load_one(file, cache=None, **kwargs):
+    """
+    Load or read one file in this process
+    """
+    if cache is not None:
+        return cache.load(file, **kwargs)
+    return file.load(**kwargs) if file.is_parsed else file.read()
+
+
 def _load_corpus(self, **kwargs):
     """
     Generic loader for corpus or contents
@@ -546,29 +604,39 @@ def _load_corpus(self, **kwargs):
 
     # current favourite line in buzz codebase :P
     multiprocess = multi.how_many(kwargs.pop("multiprocess", self.is_parsed))
+    max_bytes = kwargs.pop("max_bytes", LOAD_MAX_BYTES)
     to_iter = self.files if isinstance(self, Corpus) else self
     order = {f.path: i for i, f in enumerate(to_iter, start=1)}
 
-    # i would love to only ever use joblib, and therefore just use the first
-    # part of these conditionals, but django and joblib don't play nice.
-    if multiprocess and multiprocess > 1:
+    # parsed corpora on disk can keep a columnar cache of each file next to them
+    cache = None
+    use_cache = kwargs.pop("cache", getattr(self, "cache", False))
+    if use_cache and self.is_parsed and isinstance(self, Corpus):
+        from .cache import CorpusCache
+
+        cache = CorpusCache(self, **kwargs)
+
+    # i would love to only ever use joblib, but django and joblib don't play
+    # nice. parsed files are handed out one by one, and come back in order
+    if multiprocess and multiprocess > 1 and not self.is_parsed:
         chunks = np.array_split(to_iter, multiprocess)
-        if self.is_parsed:
-            delay = (multi.load(x, i, order=order, **kwargs) for i, x in enumerate(chunks))
-        else:
-            delay = (multi.read(x, i) for i, x in enumerate(chunks))
+        delay = (multi.read(x, i) for i, x in enumerate(chunks))
         loaded = Parallel(n_jobs=multiprocess)(delay)
         # unpack the nested list that multiprocessing creates
         loaded = [item for sublist in loaded for item in sublist]
     else:
+        if multiprocess and multiprocess > 1:
+            kw = dict(cache=cache, max_bytes=max_bytes, **kwargs)
+            files = multi.stream(list(to_iter), multiprocess, **kw)
+        else:
+            files = ((file, _load_one(file, cache, **kwargs)) for file in to_iter)
         kwa = dict(ncols=120, unit="file", desc="Loading", total=len(self))
         t = tqdm(**kwa) if len(to_iter) > 1 else None
         loaded = list()
-        for i, file in enumerate(to_iter, start=1):
-            data = file.load(**kwargs) if file.is_parsed else file.read()
+        for file, data in files:
             if data is not None:
-                if "order" not in data.columns:
-                    data["order"] = i
+                if self.is_parsed and "order" not in data.columns:
+                    data["order"] = order[file.path]
                 loaded.append(data)
             _tqdm_update(t)
         _tqdm_close(t)
@@ -579,8 +647,13 @@ def _load_corpus(self, **kwargs):
         keys = self.filepaths if self.is_parsed else [i.path for i in self.files]
         return dict(sorted(zip(keys, loaded)))
 
+    if cache is not None:
+        cache.save(to_iter)
+
     # for parsed corpora, we merge each file contents into one huge dataframe
-    df = pd.concat(loaded, sort=False)
+    df = _concat_categories(loaded)
+    # let the pieces go before the steps below make copies of the whole thing
+    del loaded
 
     df["_n"] = range(len(df))
     if kwargs.get("set_data_types", True):
@@ -2,8 +2,6 @@
 in buzz, searches result in corpus subsets. views represent subsets as stats,
 or as concordance lines, or as figures...
 """
-import math
-
 import numpy as np
 import pandas as pd
 
@@ -11,6 +9,9 @@ from .utils import _auto_window, _make_match_col
 
 
 def _get_widths(df, is_conc, window):
+    """
+    Alignment, truncation and width of each column; df can be just a sample
+    """
     tot = len(df.columns) + len(df.index.names)
     aligns = [True] * tot
     truncs = [False] * tot
@@ -46,25 +47,13 @@ def _tabview(df, reference, window="auto", **kwargs):
     from .conc import Concordance
 
     try:
-        from .tabview import view
+        from .tabview import sample_positions, view
     except Exception:  # windows, ModuleNotFoundError?
         raise OSError("Not available on Windows, sorry.")
 
     is_conc = type(df) == Concordance
-
-    # needs review
-    if isinstance(df.index, pd.MultiIndex):
-        index_as_iterable = list(zip(*df.index.to_series()))
-        widths = list()
-        for index in index_as_iterable:
-            biggest = max([len(str(x)) for x in index])
-            if biggest < 10:
-                widths.append(biggest)
-            else:
-                widths.append(10)
-    # if index is flat, make into string and find longest
-    else:
-        widths = [5]
+    # widths come from some of the rows, so that big results open right away
+    sample = df.iloc[sample_positions(len(df))]
 
     # expand single window integer to both sides
     if isinstance(window, int):
@@ -76,10 +65,10 @@ def _tabview(df, reference, window="auto", **kwargs):
 
     # make window smaller if it can be
     if is_conc:
-        window[0] = max(df["left"].str.len().max(), window[0])
-        window[1] = max(df["right"].str.len().max(), window[1])
+        window[0] = max(sample["left"].str.len().max(), window[0])
+        window[1] = max(sample["right"].str.len().max(), window[1])
 
-    aligns, truncs, widths = _get_widths(df, is_conc, window)
+    aligns, truncs, widths = _get_widths(sample, is_conc, window)
 
     view_style = dict(column_widths=widths, reference=reference, df=df)
 
@@ -90,163 +79,221 @@ def _tabview(df, reference, window="auto", **kwargs):
     view(df, **view_style)
 
 
-def _lingres(ser, index):
+def _regression_stats(matrix):
     """
-    Appliable stats calculation
-    """
-    from scipy.stats import linregress
+    What scipy's linregress gives for each column of matrix (dense or sparse)
+    against its row numbers, worked out for every column at once
 
-    ix = ["_slope", "_intercept", "_r", "_p", "_stderr"]
-    return pd.Series(linregress(index, ser.values), index=ix)
+    Return: slope, intercept, r, p and stderr, each an array with one value per column
+    """
+    from scipy.special import stdtr
+
+    n = matrix.shape[0]
+    x = np.arange(n, dtype=float)
+    xmean = x.mean()
+    ssxm = (x ** 2).mean() - xmean ** 2
+    ymean = np.asarray(matrix.sum(axis=0), dtype=float).ravel() / n
+    xy = np.asarray(matrix.T.dot(x), dtype=float).ravel()
+    squares = matrix.multiply(matrix) if hasattr(matrix, "multiply") else matrix ** 2
+    yy = np.asarray(squares.sum(axis=0), dtype=float).ravel()
+    ssxym = xy / n - xmean * ymean
+    ssym = np.maximum(yy / n - ymean ** 2, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_den = np.sqrt(ssxm * ssym)
+        r = np.where(r_den == 0.0, 0.0, np.clip(ssxym / r_den, -1.0, 1.0))
+        slope = ssxym / ssxm
+        intercept = ymean - slope * xmean
+        df = n - 2
+        if n == 2:
+            rows = matrix.toarray() if hasattr(matrix, "toarray") else np.asarray(matrix)
+            p = np.where(rows[0] == rows[1], 1.0, 0.0)
+            stderr = np.zeros(len(r))
+        else:
+            tiny = 1.0e-20
+            t = r * np.sqrt(df / ((1.0 - r + tiny) * (1.0 + r + tiny)))
+            p = 2 * stdtr(df, -np.abs(t))
+            stderr = np.sqrt((1 - r ** 2) * ssym / ssxm / df)
+    return slope, intercept, r, p, stderr
+
+
+STAT_FIELD = ["_slope", "_intercept", "_r", "_p", "_stderr"]
+
+
+def _sort_by(by, keep_stats=False):
+    """
+    Translate sort options, and say whether the stats are needed for them
+    """
+    # allow some alternative names
+    by_convert = {"most": "total", True: "total", "least": "infreq"}
+    by = by_convert.get(by, by)
+    stat_sorts = ["increase", "decrease", "static", "turbulent"]
+    return by, keep_stats or by in STAT_FIELD + stat_sorts
 
 
-def _sort(df, by=False, keep_stats=False, remove_above_p=False):
+def _stats_frame(matrix):
     """
-    Sort results, potentially using scipy's linregress
+    Linear regression stats for each column of matrix, one row per stat
     """
-    # translate options and make sure they are parseable
-    stat_field = ["_slope", "_intercept", "_r", "_p", "_stderr"]
-    easy_sorts = ["total", "infreq", "name", "most", "least", "reverse"]
-    stat_sorts = ["increase", "decrease", "static", "turbulent"]
+    stats = np.vstack(_regression_stats(matrix))
+    return pd.DataFrame(np.where(np.isinf(stats), 0.0, stats), index=STAT_FIELD)
 
-    options = stat_field + easy_sorts + stat_sorts
 
-    # allow some alternative names
-    by_convert = {"most": "total", True: "total", "least": "infreq"}
-    by = by_convert.get(by, by)
+def _sorted_positions(by, columns, totals, get_row, stats=None, remove_above_p=False):
+    """
+    Work out the order that the columns of a table should go in
 
-    if keep_stats or by in stat_field + stat_sorts:
-        n_column = list(range(len(df)))
-        # quick fix: do not have categorical index, because we might want to do regression on them
-        try:
-            df.index = df.index.astype(int)
-        except Exception:
-            try:
-                df.index = df.index.astype(object)
-            except Exception:
-                pass
-        stats = df.apply(_lingres, axis=0, index=n_column)
-        df = df.append(stats)
-        df = df.replace([np.inf, -np.inf], 0.0)
+    columns: the column labels
+    totals: array of column totals
+    get_row: function giving the values of the row with a given label
+    stats: from _stats_frame, if needed for this sort
 
+    Return: the positions of the columns to keep, in order
+    """
+    easy_sorts = ["total", "infreq", "name", "most", "least", "reverse"]
+    stat_sorts = ["increase", "decrease", "static", "turbulent"]
+    options = STAT_FIELD + easy_sorts + stat_sorts
+
+    order = pd.RangeIndex(len(columns))
     if by == "name":
         # currently case sensitive
-        df = df.reindex(sorted(df.columns), axis=1)
-
+        order = pd.Series(columns).sort_values().index
     elif by in {"total", "infreq"}:
-        ascending = by != "total"
-        df = df[list(df.sum().sort_values(ascending=ascending).index)]
-
+        order = pd.Series(totals).sort_values(ascending=by != "total").index
     elif by == "reverse":
-        df = df.loc[::, ::-1]
+        order = order[::-1]
 
     # sort by slope etc., or search by subcorpus name
-    if by in stat_field or by not in options:
+    if by in STAT_FIELD or by not in options:
         asc = False if by is True or by in {"total", "most"} else True
+        values = stats.loc[by] if by in STAT_FIELD else pd.Series(get_row(by))
+        order = values[order].sort_values(ascending=asc).index
 
-        df = df.T.sort_values(by=by, ascending=asc).T
-
-    if "_slope" in df.index:
-        slopes = df.loc["_slope"]
+    if stats is not None:
+        slopes = stats.loc["_slope"][order]
         if by == "increase":
-            std = slopes.sort_values(ascending=False)
-            df = df[std.index]
+            order = slopes.sort_values(ascending=False).index
         elif by == "decrease":
-            std = slopes.sort_values(ascending=True)
-            df = df[std.index]
+            order = slopes.sort_values(ascending=True).index
         elif by == "static":
-            std = slopes.abs().sort_values(ascending=True)
-            df = df[std.index]
+            order = slopes.abs().sort_values(ascending=True).index
         elif by == "turbulent":
-            std = slopes.abs().sort_values(ascending=False)
-            df = df[std.index]
+            order = slopes.abs().sort_values(ascending=False).index
         if remove_above_p is not False and remove_above_p > 0:
-            df = df.T
-            df = df[df["_p"] <= remove_above_p]
-            df = df.T
+            order = order[stats.loc["_p"][order].values <= remove_above_p]
+    return np.asarray(order)
 
-    # remove stats field by default
-    if not keep_stats:
-        df = df.drop(stat_field, axis=0, errors="ignore")
-    else:
-        df.index = [i.lstrip("_") if i in stat_field else i for i in list(df.index)]
+
+def _sort_sparse(table, by=False, keep_stats=False, remove_above_p=False):
+    """
+    Sort a SparseTable, working as _sort does for dense tables. Stats from the
+    linear regression are kept in table.stats, rather than as extra rows.
+    """
+    by, needs_stats = _sort_by(by, keep_stats)
+    stats = _stats_frame(table.matrix) if needs_stats else None
+
+    def get_row(label):
+        return table.matrix.getrow(table.index.get_loc(label)).toarray().ravel()
+
+    totals = table.sum().values
+    order = _sorted_positions(by, table.columns, totals, get_row, stats, remove_above_p)
+    table = table.take(order)
+    if keep_stats:
+        stats = stats[order]
+        stats.columns = table.columns
+        stats.index = [i.lstrip("_") for i in STAT_FIELD]
+        table.stats = stats
+    return table
+
+
+def _sort(df, by=False, keep_stats=False, remove_above_p=False):
+    """
+    Sort results, using linear regression stats for the trend sorts.
+
+    The table is only copied once, when its columns are put in order.
+    """
+    by, needs_stats = _sort_by(by, keep_stats)
+    stats = _stats_frame(df.values) if needs_stats else None
+
+    def get_row(label):
+        return df.loc[label].values
+
+    totals = df.sum().values
+    order = _sorted_positions(by, df.columns, totals, get_row, stats, remove_above_p)
+    df = df.iloc[:, order]
+
+    # stats go below the data, if the user wants them
+    if keep_stats:
+        stats = stats[order]
+        stats.columns = df.columns
+        stats.index = [i.lstrip("_") for i in STAT_FIELD]
+        # do not have categorical index, or the stats cannot be added to it
+        try:
+            df.index = df.index.astype(int)
+        except Exception:
+            try:
+                df.index = df.index.astype(object)
+            except Exception:
+                pass
+        df = pd.concat([df, stats])
     return df
 
 
-def _log_likelihood(data, target_sum, ref_sum):
+def _log_likelihood(word_in_target, word_in_ref, target_sum, ref_sum):
     """
     Calculate log likelihood keyness
+
+    All measures take arrays of counts in target and reference, plus their
+    totals, and work on every cell at once
     """
-    word_in_target, word_in_ref = data
-    neg = (word_in_target / float(target_sum)) < (word_in_ref / float(ref_sum))
-    ref_targ = float(word_in_ref) + float(word_in_target)
-    ref_targ_sum = float(ref_sum) + float(target_sum)
+    neg = (word_in_target / target_sum) < (word_in_ref / ref_sum)
+    ref_targ = word_in_ref + word_in_target
+    ref_targ_sum = ref_sum + target_sum
 
-    E1 = float(ref_sum) * (ref_targ / ref_targ_sum)
-    E2 = float(target_sum) * (ref_targ / ref_targ_sum)
+    E1 = ref_sum * (ref_targ / ref_targ_sum)
+    E2 = target_sum * (ref_targ / ref_targ_sum)
 
-    logaE1 = 0 if not word_in_ref else math.log(word_in_ref / E1)
-    logaE2 = 0 if not word_in_target else math.log(word_in_target / E2)
-    score = float(2 * ((word_in_ref * logaE1) + (word_in_target * logaE2)))
-    if neg:
-        score = -score
-    return score
+    # zero counts add nothing, rather than nan
+    shape = np.broadcast(word_in_target, word_in_ref).shape
+    logaE1 = np.log(word_in_ref / E1, out=np.zeros(shape), where=word_in_ref != 0)
+    logaE2 = np.log(word_in_target / E2, out=np.zeros(shape), where=word_in_target != 0)
+    score = 2 * ((word_in_ref * logaE1) + (word_in_target * logaE2))
+    return np.where(neg, -score, score)
 
 
-def _perc_diff(data, target_sum, ref_sum):
+def _perc_diff(word_in_target, word_in_ref, target_sum, ref_sum):
     """
     Calculate using perc diff measure :/
     """
-    word_in_target, word_in_ref = data
-    norm_target = float(word_in_target) / target_sum
-    norm_ref = float(word_in_ref) / ref_sum
+    norm_target = word_in_target / target_sum
+    norm_ref = word_in_ref / ref_sum
     # Gabrielatos and Marchi (2012) do it this way!
-    if norm_ref == 0:
-        norm_ref = 0.00000000000000000000000001
+    norm_ref = np.where(norm_ref == 0, 0.00000000000000000000000001, norm_ref)
     score = ((norm_target - norm_ref) * 100.0) / norm_ref
-    return 0 if score == -100.0 else score
+    return np.where(score == -100.0, 0.0, score)
 
 
-def _odds_ratio(data, target_sum, ref_sum):
-    word_in_target, word_in_ref = data
-    score = (word_in_target / (target_sum-word_in_target)) / (word_in_ref / (ref_sum-word_in_ref))
-    return score
+def _odds_ratio(word_in_target, word_in_ref, target_sum, ref_sum):
+    target_odds = word_in_target / (target_sum - word_in_target)
+    return target_odds / (word_in_ref / (ref_sum - word_in_ref))
 
 
-def _relrisk(data, target_sum, ref_sum):
-    word_in_target, word_in_ref = data
+def _relrisk(word_in_target, word_in_ref, target_sum, ref_sum):
     target_norm = word_in_target / target_sum
     ref_norm = word_in_ref / ref_sum
     return target_norm / ref_norm
 
 
-def _bayes_factor_bic(data, target_sum, ref_sum):
+def _bayes_factor_bic(word_in_target, word_in_ref, target_sum, ref_sum):
     degrees_of_freedom = 1
-    word_in_target, word_in_ref = data
-    ll = _log_likelihood(data, target_sum, ref_sum)
-    return ll - (degrees_of_freedom*math.log(sum([target_sum, ref_sum])))
+    ll = _log_likelihood(word_in_target, word_in_ref, target_sum, ref_sum)
+    return ll - (degrees_of_freedom * np.log(target_sum + ref_sum))
 
 
-def _effect_size_for_ll(data, target_sum, ref_sum):
-    word_in_target, word_in_ref = data
-    ll = _log_likelihood(data, target_sum, ref_sum)
-    expected_target = target_sum * (word_in_target+word_in_ref) / (target_sum + ref_sum)
-    expected_ref = ref_sum * (word_in_target+word_in_ref) / (target_sum + ref_sum)
-    return ll / (sum([target_sum, ref_sum]) * math.log(min([expected_target, expected_ref])))
-
-
-def _make_keywords(subcorpus, reference, ref_sum, measure):
-    """
-    Apply function for getting keyness calculations
-
-    subcorpus: Series of tokens and their counts for this subcorpus
-    """
-    # how many words are there in this subcorpus
-    target_sum = subcorpus.sum()
-    # make series with counts in reference
-    df = pd.DataFrame(subcorpus)
-    df["_ref_counts"] = reference
-    return df.apply(measure, axis=1, raw=True, args=(target_sum, ref_sum))
+def _effect_size_for_ll(word_in_target, word_in_ref, target_sum, ref_sum):
+    ll = _log_likelihood(word_in_target, word_in_ref, target_sum, ref_sum)
+    expected_target = target_sum * (word_in_target + word_in_ref) / (target_sum + ref_sum)
+    expected_ref = ref_sum * (word_in_target + word_in_ref) / (target_sum + ref_sum)
+    return ll / ((target_sum + ref_sum) * np.log(np.minimum(expected_target, expected_ref)))
 
 
 def _table(
@@ -262,10 +309,13 @@ def _table(
     keep_stats=False,
     show_entities=False,
     min_occur=0,
+    sparse=False,
     **kwargs,
 ):
     """
     Generate a result table view from Results, or a Results-like DataFrame
+
+    sparse: count into a SparseTable, for when most cells would be zero
     """
     from .table import Table
 
@@ -303,19 +353,25 @@ def _table(
         df = df[df._match.isin(enough)]
 
     # make the matrix
-    if subcorpora:
-        df["_count"] = 1
-        pivot = dict(index=subcorpora, columns="_match", values="_count", aggfunc=sum)
-        table = df.pivot_table(**pivot)
+    if sparse:
+        table = _sparse_counts(df, subcorpora, reference=reference)
     else:
-        table = pd.DataFrame(df["_match"].value_counts()).T
+        if subcorpora:
+            df["_count"] = 1
+            # only subcorpora that occur, not every category (nor every combination)
+            pivot = dict(
+                index=subcorpora, columns="_match", values="_count", aggfunc=sum, observed=True
+            )
+            table = df.pivot_table(**pivot)
+        else:
+            table = pd.DataFrame(df["_match"].value_counts()).T
 
-    table = table.fillna(0)
+        table = table.fillna(0)
 
-    # make table now so we can relative/sort
-    table = Table(table, reference=reference)
+        # make table now so we can relative/sort
+        table = Table(table, reference=reference)
 
-    table = table.astype(int)
+        table = table.astype(int)
 
     # relative frequency if user wants that
     if relative is not False:
@@ -343,6 +399,46 @@ def _table(
     return table
 
 
+def _sparse_counts(df, subcorpora, reference=None):
+    """
+    Count each _match in each subcorpus straight into a SparseTable, without
+    ever making the (mostly zero) dense matrix. Rows and columns are sorted,
+    and rows with missing values are left out, as pivot_table would do. Like
+    _table, only combinations of subcorpora that occur get a row, however many
+    categories a categorical subcorpus column has.
+    """
+    from scipy import sparse
+
+    from .table import SparseTable
+
+    matches = df["_match"]
+    if not subcorpora:
+        found = matches.notna().values
+        row_codes, index = np.zeros(found.sum(), dtype=int), pd.Index(["_match"])
+    else:
+        levels, codes = list(), list()
+        for name in subcorpora:
+            values = df[name] if name in df.columns else df.index.get_level_values(name)
+            level_codes, level = pd.factorize(values, sort=True)
+            codes.append(level_codes)
+            levels.append(level)
+        found = np.logical_and.reduce([i >= 0 for i in codes] + [matches.notna().values])
+        codes = [i[found] for i in codes]
+        # one number per combination of subcorpora, in sorted order
+        sizes = [len(i) for i in levels]
+        keys, row_codes = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+        if len(subcorpora) == 1:
+            index = pd.Index(levels[0][keys], name=subcorpora[0])
+        else:
+            level_codes = np.unravel_index(keys, sizes)
+            index = pd.MultiIndex(levels=levels, codes=level_codes, names=subcorpora)
+    col_codes, columns = pd.factorize(matches[found], sort=True)
+    counts = np.ones(len(col_codes), dtype=int)
+    shape = (len(index), len(columns))
+    matrix = sparse.coo_matrix((counts, (row_codes, col_codes)), shape=shape)
+    return SparseTable(matrix.tocsr(), index=index, columns=pd.Index(columns), reference=reference)
+
+
 def _keyness(table, keyness, reference=None):
     """
     Need a freq table, keyness measure and a reference corpus
@@ -352,7 +448,7 @@ def _keyness(table, keyness, reference=None):
         print(warn)
         reference = table
     # get the total counts for match column in reference, sorted
-    ref = reference["_match"].value_counts()[table.iloc[0].index]
+    ref = reference["_match"].value_counts()[table.columns]
     measures = {
         "ll": _log_likelihood,
         "pd": _perc_diff,
@@ -362,16 +458,41 @@ def _keyness(table, keyness, reference=None):
         "rr": _relrisk
     }
     measure = measures.get(keyness, _log_likelihood)
-    # kwargs for apply func. ref sum is number of words in reference, which is its shape
-    kwa = dict(axis=1, reference=ref, measure=measure, ref_sum=reference.shape[0])
-    # keywords runs over every subcorpus and then every match.
-    # first, for each row (subcorpus) in the table, we apply _make_keywords
-    applied = table.apply(_make_keywords, **kwa)
+    if hasattr(table, "matrix"):
+        return _sparse_keyness(table, measure, ref, float(reference.shape[0]))
+    # one row of counts per subcorpus, against one row of reference counts.
+    # ref sum is number of words in reference, which is its shape
+    counts = table.values.astype(float)
+    target_sum = counts.sum(axis=1, keepdims=True)
+    ref_counts = ref.values.astype(float)[np.newaxis, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = measure(counts, ref_counts, target_sum, float(reference.shape[0]))
+    applied = table._constructor(scores, index=table.index, columns=table.columns)
     top = applied.abs().sum().sort_values(ascending=False)
     table = applied[top.index]
     return table
 
 
+def _sparse_keyness(table, measure, ref, ref_sum):
+    """
+    Keyness for a SparseTable: only cells with counts get a score, so words
+    missing from a subcorpus are left out of it, rather than scored as underused
+    """
+    matrix = table.matrix.tocsr()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    target_sum = np.asarray(matrix.sum(axis=1), dtype=float).ravel()[rows]
+    ref_counts = ref.values.astype(float)[matrix.indices]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = measure(matrix.data.astype(float), ref_counts, target_sum, ref_sum)
+    matrix = matrix.astype(float)
+    matrix.data = scores
+    # order by total absolute score, ignoring nan, as for dense tables
+    weights = np.where(np.isnan(scores), 0.0, np.abs(scores))
+    top = np.bincount(matrix.indices, weights=weights, minlength=matrix.shape[1])
+    order = pd.Series(top).sort_values(ascending=False).index
+    return table._new(matrix).take(order)
+
+
 def _add_frequencies(series, relative, keyness, reference):
     """
     Series should be the _match column (for a subcorpus)
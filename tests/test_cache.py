@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from buzz.cache import CorpusCache, _cache_path
+from buzz.corpus import Corpus
+
+from .test_conllu import split_sents
+
+TREE_CONLLU = """# sent_id = 1
+# parse = (ROOT (S (NP (DT The) (NN dog)) (VP (VBD ran))))
+# text = The dog ran
+1\tThe\tthe\tDET\tDT\t_\t2\tdet\t_\t_
+2\tdog\tdog\tNOUN\tNN\t_\t3\tnsubj\t_\t_
+3\tran\trun\tVERB\tVBD\t_\t0\tROOT\t_\t_
+"""
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "testing-parsed")
+        shutil.copytree("tests/testing-parsed", self.path)
+        self.corpus = Corpus(self.path, cache=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cache_same_as_parse(self):
+        uncached = self.corpus.load(cache=False)
+        self.assertFalse(os.path.isdir(_cache_path(self.path)))
+        first = self.corpus.load()
+        self.assertTrue(os.path.isdir(_cache_path(self.path)))
+        second = self.corpus.load()
+        self.assertTrue(uncached.equals(first))
+        self.assertTrue(uncached.equals(second))
+        usecols = self.corpus.load(usecols=["w", "speaker"], cache=False)
+        self.assertTrue(usecols.equals(self.corpus.load(usecols=["w", "speaker"])))
+
+    def test_opt_in(self):
+        # without cache=True, loading, querying and searching write nothing
+        corpus = Corpus(self.path)
+        loaded = corpus.load()
+        self.assertEqual(len(corpus.just.wordclass.NOUN), len(loaded.just.wordclass.NOUN))
+        self.assertFalse(os.path.isdir(_cache_path(self.path)))
+        self.assertTrue(loaded.equals(corpus.load(cache=True)))
+        self.assertTrue(os.path.isdir(_cache_path(self.path)))
+
+    def test_tgrep_opt_in(self):
+        # trees are only kept with the cache when caching is on
+        path = os.path.join(self.tmp, "trees-parsed")
+        os.makedirs(path)
+        with open(os.path.join(path, "one.conllu"), "w") as fo:
+            fo.write(TREE_CONLLU)
+        corpus = Corpus(path)
+        self.assertEqual(len(corpus.tgrep("NP")), 2)
+        self.assertFalse(os.path.isdir(_cache_path(path)))
+        self.assertEqual(len(corpus.tgrep("NP", cache=True)), 2)
+        cache = CorpusCache(corpus)
+        self.assertTrue(cache.files[cache._key(corpus.files[0])]["trees"])
+
+    def test_invalidation(self):
+        self.corpus.load()
+        cache = CorpusCache(self.corpus)
+        self.assertTrue(all(cache.is_fresh(f) for f in self.corpus.files))
+        # touching a file does not make it stale, but editing it does
+        edited, touched = self.corpus.files[0], self.corpus.files[1]
+        os.utime(touched.path, None)
+        with open(edited.path, "r") as fo:
+            data = fo.read()
+        with open(edited.path, "w") as fo:
+            fo.write(data.replace("\tJungle\t", "\tForest\t"))
+        cache = CorpusCache(self.corpus)
+        self.assertTrue(cache.is_fresh(touched))
+        self.assertFalse(cache.is_fresh(edited))
+        loaded = self.corpus.load()
+        self.assertIn("Forest", set(loaded.w))
+        # removing a file removes it from the cache
+        os.remove(touched.path)
+        corpus = Corpus(self.path, cache=True)
+        self.assertEqual(len(corpus.load().index.levels[0]), 3)
+        self.assertEqual(len(CorpusCache(corpus).files), 3)
+
+    def test_categories_per_file(self):
+        cache = CorpusCache(self.corpus)
+        for file in self.corpus.files:
+            self.assertEqual(cache.load(file).l.dtype.name, "category")
+            self.assertEqual(cache.load(file).l.dtype.name, "category")
+            self.assertEqual(cache.load(file, set_data_types=False).l.dtype, object)
+        # merged into one vocabulary, sorted as if the whole column were converted
+        loaded = self.corpus.load()
+        strings = loaded.l.astype(object).astype("category")
+        self.assertEqual(list(loaded.l.cat.categories), list(strings.cat.categories))
+        self.assertEqual(self.corpus.load(set_data_types=False).l.dtype, object)
+
+    def test_multiprocess(self):
+        serial = self.corpus.load(multiprocess=1, cache=False)
+        # one file at a time, parsed and then read from the cache
+        for _ in range(2):
+            loaded = self.corpus.load(multiprocess=2, max_bytes=1)
+            self.assertTrue(serial.equals(loaded))
+        self.assertTrue(serial.equals(self.corpus.load(multiprocess=2, cache=False)))
+
+    def test_for_file(self):
+        self.corpus.load()
+        cache = CorpusCache(self.corpus)
+        file = self.corpus.files[0]
+        one = cache.for_file(file)
+        self.assertEqual(list(one.files), [cache._key(file)])
+        self.assertTrue(one.is_fresh(file))
+        self.assertGreater(len(cache.files), 1)
+
+    def test_store(self):
+        uncached = self.corpus.load(cache=False)
+        # as the parser does it, with the sentences it has just written
+        cache = CorpusCache(self.path)
+        for file in self.corpus.files:
+            with open(file.path, "r") as fo:
+                cache.store(file, split_sents(fo.read()))
+        cache.save()
+        cache = CorpusCache(self.corpus)
+        self.assertTrue(all(cache.is_fresh(f) for f in self.corpus.files))
+        self.assertTrue(uncached.equals(self.corpus.load()))
+
+    def test_trees(self):
+        file = self.corpus.files[0]
+        cache = CorpusCache(self.corpus)
+        cache.load_file(file)
+        parses = ["(S (NP (DT the) (NN dog)) (VP ran))", "(S (VP go))"]
+        trees = cache.trees(file, parses)
+        cache.save()
+        # stored with the file, and read back rather than made again
+        cached = CorpusCache(self.corpus).trees(file, ["(X y)", "(X y)"])
+        self.assertEqual(list(cached.labels), list(trees.labels))
+        self.assertTrue((cached.parent == trees.parent).all())
+        # but made again once the file changes
+        with open(file.path, "a") as fo:
+            fo.write("\n")
+        changed = CorpusCache(self.corpus).trees(file, ["(X y)", "(X y)"])
+        self.assertEqual(list(changed.labels), ["X", "y", "X", "y"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from buzz.conllu import _read_conllu, _read_sents
+from buzz.parse import _sents_to_conllu
+
+PATH = "tests/testing-parsed/third/space in name.txt.conllu"
+
+DATA = """# sent_id = 1
+# speaker = MOOKIE
+1\tHey\they\tINTJ\tUH\t_\t0\tROOT\t_\t_
+2\t!\t!\tPUNCT\t.\t_\t1\tpunct\t_\t_
+
+1\tYo\tyo\tINTJ\tUH\t_\t0\tROOT\t_\t_
+"""
+
+
+def split_sents(data):
+    """
+    Split CONLL-U into sentences of metadata and token fields, as the parser has them
+    """
+    sents = list()
+    for block in data.strip("\n").split("\n\n"):
+        lines = block.splitlines()
+        meta = [i[2:].split(" = ", 1) for i in lines if i.startswith("# ")]
+        rows = [i.split("\t") for i in lines if not i.startswith("#")]
+        sents.append((dict(meta), rows))
+    return sents
+
+
+class TestConllu(unittest.TestCase):
+    def test_read_file(self):
+        with open(PATH, "r") as fo:
+            data = fo.read()
+        columns, metadata = _read_conllu(data, PATH)
+        self.assertEqual(len(metadata), data.count("# sent_id = "))
+        self.assertEqual(len(columns["w"]), len(columns["s"]))
+        self.assertEqual(columns["file"][0], "third/space in name")
+        self.assertEqual(list(columns["w"][:3]), ["The", "Jungle", "Book"])
+        self.assertEqual(columns["g"].dtype.kind, "i")
+        self.assertEqual(metadata[0]["sent_len"], 18)
+
+    def test_usecols_and_folders(self):
+        columns, metadata = _read_conllu(
+            DATA, "corpus/conllu/sub/file.conllu", usecols=["w", "speaker"], folders="column"
+        )
+        self.assertEqual(set(columns), {"file", "s", "i", "w"})
+        self.assertEqual(list(columns["s"]), [1, 1, 2])
+        self.assertEqual(metadata[0], dict(subcorpus="sub", speaker="MOOKIE"))
+        # sentences do not need any metadata
+        self.assertEqual(metadata[1], dict(subcorpus="sub"))
+
+    def test_read_sents(self):
+        with open(PATH, "r") as fo:
+            data = fo.read()
+        sents = split_sents(data)
+        self.assertEqual(_sents_to_conllu(sents), data)
+        for kwargs in [dict(), dict(usecols=["w", "speaker"], folders="column")]:
+            columns, metadata = _read_conllu(data, PATH, **kwargs)
+            from_sents, sent_metadata = _read_sents(sents, PATH, **kwargs)
+            self.assertEqual(metadata, sent_metadata)
+            self.assertEqual(set(columns), set(from_sents))
+            for name, values in columns.items():
+                self.assertEqual(values.dtype, from_sents[name].dtype)
+                self.assertEqual(list(values), list(from_sents[name]))
+
+    def test_bad_data(self):
+        with self.assertRaises(ValueError):
+            _read_conllu("# sent_id = 1\n\n" + DATA, "corpus/conllu/file.conllu")
+
+
+if __name__ == "__main__":
+    unittest.main()
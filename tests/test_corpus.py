@@ -9,6 +9,7 @@ from buzz.contents import Contents
 from buzz.corpus import Corpus
 from buzz.dataset import Dataset
 from buzz.exceptions import DataTypeError, NoReferenceCorpus
+from buzz.query import Query
 from buzz.table import Table
 
 TOTAL_TOKENS = 342
@@ -158,6 +159,17 @@ class TestCorpus(unittest.TestCase):
         self.assertEqual(len(nobook_u), TOTAL_TOKENS - len(book_u))
         self.assertEqual(len(nobook_l), TOTAL_TOKENS - len(book_l))
 
+    def test_lazy_chain(self):
+        query = self.parsed.just.wordclass.NOUN.skip.lemmata("^b")
+        self.assertIsInstance(query, Query)
+        loaded = self.loaded.just.wordclass.NOUN.skip.lemmata("^b")
+        self.assertEqual(len(query), len(loaded))
+        self.assertEqual(list(query.w), list(loaded.w))
+        # categories for the whole corpus, not just the rows that were kept
+        self.assertTrue(query.l.cat.categories.equals(loaded.l.cat.categories))
+        tab = self.parsed.just.wordclass.NOUN.see.lemma.by.file
+        self.assertTrue(tab.equals(self.loaded.just.wordclass.NOUN.see.lemma.by.file))
+
     def test_all_slice_names(self):
         """
         Test that all slice names work and produce same result as column name
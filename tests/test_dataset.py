@@ -0,0 +1,104 @@
+import os
+import pickle
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from buzz.conc import _window_rows
+from buzz.corpus import Corpus
+from buzz.multi import SharedDataset, shared
+
+
+class TestDataset(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loaded = Corpus("tests/testing-parsed").load()
+
+    def _slow_sent(self, data, n):
+        return data.iloc[data.index.get_loc(data.index.droplevel("i").unique()[n])]
+
+    def test_sent(self):
+        offsets = self.loaded.sentence_offsets
+        self.assertEqual(len(offsets), len(self.loaded.sentences()))
+        self.assertIs(offsets, self.loaded.sentence_offsets)
+        for n in [0, 1, 5, -1]:
+            self.assertTrue(self.loaded.sent(n).equals(self._slow_sent(self.loaded, n)))
+        # sentences that are not in one piece
+        mixed = self.loaded.iloc[np.r_[0:5, 20:25, 5:10]]
+        for n in range(2):
+            self.assertTrue(mixed.sent(n).equals(self._slow_sent(mixed, n)))
+
+    def test_governor_positions(self):
+        positions = self.loaded.governor_positions
+        for n in [0, 10, 50]:
+            row = self.loaded.iloc[n]
+            file, s, _ = self.loaded.index[n]
+            if row.g:
+                self.assertEqual(self.loaded.index[positions[n]], (file, s, row.g))
+            else:
+                self.assertEqual(positions[n], -1)
+        # slices get their own positions
+        first = self.loaded.sent(0)
+        self.assertEqual(list(first.governor_positions), list(positions[: len(first)]))
+
+    def test_governor_positions_edited(self):
+        loaded = self.loaded.copy()
+        before = loaded.governor_positions
+        self.assertIs(before, loaded.governor_positions)
+        # edit governors in place, so the column keeps the same array
+        loaded["g"].values[:] = 0
+        self.assertTrue((loaded.governor_positions == -1).all())
+
+    def test_governor_positions_duplicates(self):
+        twice = pd.concat([self.loaded, self.loaded])
+        positions = self.loaded.governor_positions
+        self.assertEqual(list(twice.governor_positions), list(positions) * 2)
+
+    def test_add_governor(self):
+        governed = Corpus("tests/testing-parsed").load(add_governor=True, cache=False)
+        positions = self.loaded.governor_positions
+        words = np.where(positions >= 0, self.loaded.w.values[positions], "ROOT")
+        self.assertEqual(list(governed.gw), list(words))
+
+    def test_conc_within_sentence(self):
+        conc = self.loaded.conc(window=(30, 30), within_sentence=True, metadata=False)
+        free = self.loaded.conc(window=(30, 30), metadata=False)
+        starts = self.loaded.sentence_offsets
+        ends = np.append(starts[1:], len(self.loaded)) - 1
+        self.assertTrue((conc.left.iloc[starts] == "").all())
+        self.assertTrue((conc.right.iloc[ends] == "").all())
+        self.assertFalse((free.right.iloc[ends[:-1]] == "").all())
+        # context within a sentence is just as it would be otherwise
+        first = self.loaded.sent(0)
+        words = " ".join(first.w)
+        self.assertEqual(conc.right.iloc[0], free.right.iloc[0][: len(words) - len(first.w[0]) - 1])
+
+    def test_conc_few_hits(self):
+        # context made from just the words in their windows, as for every row
+        free = self.loaded.conc(window=(30, 30), metadata=False)
+        rows = [0, 3, 50, len(self.loaded) - 1]
+        few = self.loaded.iloc[rows].conc(window=(30, 30), metadata=False)
+        for side in ["left", "match", "right"]:
+            self.assertEqual(list(few[side]), list(free[side].iloc[rows]))
+        starts, ends = np.array([2, 5, 9, 9]), np.array([4, 8, 9, 12])
+        self.assertEqual(list(_window_rows(starts, ends, 12)), [2, 3, 5, 6, 7, 9, 10, 11])
+        # overlapping windows, covering more rows than there are
+        starts, ends = np.array([0, 1, 9, 9]), np.array([6, 8, 9, 12])
+        self.assertEqual(list(_window_rows(starts, ends, 12)), [0, 1, 2, 3, 4, 5, 6, 7, 9, 10, 11])
+
+    def test_shared(self):
+        with shared(self.loaded, 2) as handle:
+            self.assertIsInstance(handle, SharedDataset)
+            # workers are sent the path, not the data
+            self.assertLess(len(pickle.dumps(handle)), 1000)
+            loaded = pickle.loads(pickle.dumps(handle)).load()
+            self.assertTrue(loaded.equals(self.loaded))
+            self.assertTrue((loaded.dtypes == self.loaded.dtypes).all())
+        self.assertFalse(os.path.exists(handle.path))
+        with shared(self.loaded, 1) as handle:
+            self.assertIs(handle, self.loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+from depgrep import depgrep_compile
+
+from buzz.corpus import Corpus
+from buzz.depgrep import Unsupported, _depgrep_pairs, _vectorised_depgrep
+
+QUERIES = [
+    'x/^NOUN/ -> l"the"',
+    'f/nsubj/ <- x/VERB/',
+    'X"NOUN" <- f/root/',
+    'l/the/ + x/NOUN/',
+    'x/NOUN/ - l/the/',
+    'x/NOUN/ -2 x/VERB/',
+    'x/VERB/ ->> l"the"',
+    'l"the" <<- x/VERB/',
+    'x/VERB/ ->: x/NOUN/',
+    'x/NOUN/ <-: x/VERB/',
+    'x/NOUN/ <| x/VERB/',
+    'x/NOUN/ |> x/VERB/',
+    'x/NOUN/ $ x/ADJ/',
+    'x/NOUN/ !-> l"the"',
+    'x/NOUN/ [ <- x/VERB/ | -> f/amod/ ]',
+    'F/amod/ <- (X"NOUN" -> (x/ADJ/ = F"amod"))',
+    'w/x/ | w/y/ | l"the,a"',
+]
+
+
+class TestDepgrep(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        loaded = Corpus("tests/testing-parsed").load()
+        # the same preparation as Searcher._depgrep_iteration
+        df = loaded.drop(["_n", "file", "s", "i"], axis=1, errors="ignore")
+        df["_n"] = range(len(df))
+        cls.df = df.reset_index(level=df.index.names)
+
+    def _row_by_row(self, query):
+        positions = {y: x for x, y in enumerate(list(self.df.columns))}
+        compiled = depgrep_compile(query, values=self.df.values, positions=positions)
+        return np.array([bool(i) for i in self.df.apply(compiled, axis=1, raw=True)])
+
+    def test_same_as_depgrep(self):
+        for query in QUERIES:
+            vectorised = _vectorised_depgrep(query, self.df)
+            self.assertTrue((vectorised == self._row_by_row(query)).all(), query)
+
+    def test_unsupported(self):
+        for query in ['x/NOUN/=a -> x/DET/', 'x/VERB/ ->2 x/NOUN/']:
+            with self.assertRaises(Unsupported):
+                _vectorised_depgrep(query, self.df)
+        # incomplete sentences can't be searched by index arithmetic
+        with self.assertRaises(Unsupported):
+            _vectorised_depgrep('x/NOUN/ <- x/VERB/', self.df.iloc[1:])
+
+    def test_pairs(self):
+        words = ["be", "the", "jungle", "THE"]
+        lemmas = self.df.l.astype(str).str.lower().values
+        rows = [np.flatnonzero(lemmas == word.lower()) for word in words]
+        numbers = np.repeat(np.arange(len(words)), [len(i) for i in rows])
+        rows = np.concatenate(rows)
+        templates = [
+            "{query}",
+            "x/NOUN/ -> {query}",
+            "f/root/ ->> {query}",
+            "w/.*/ -2 {query}",
+            "F/det/ [ <- {query} | -> {query} ]",
+            "x/NOUN/ $ {query}",
+        ]
+        for template in templates:
+            found, number = _depgrep_pairs(template, self.df, rows, numbers, len(words))
+            for n, word in enumerate(words):
+                single = _vectorised_depgrep(template.format(query=f'l"{word}"'), self.df)
+                self.assertEqual(list(found[number == n]), list(np.flatnonzero(single)), template)
+        # a match without the word would be a match for every word
+        with self.assertRaises(Unsupported):
+            _depgrep_pairs("x/NOUN/ | {query}", self.df, rows, numbers, len(words))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from buzz.corpus import Corpus
+from buzz.index import CorpusIndex, Postings
+
+
+class TestIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, "testing-parsed")
+        shutil.copytree("tests/testing-parsed", cls.path)
+        cls.corpus = Corpus(cls.path, cache=True)
+        cls.loaded = cls.corpus.load(cache=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_postings(self):
+        cat = pd.Categorical(["a", "b", None, "a", 1, "1"])
+        postings = Postings.from_categorical(cat)
+        self.assertEqual(list(postings.get("a")), [0, 3])
+        self.assertEqual(list(postings.get("nan")), [2])
+        self.assertEqual(list(postings.get("1")), [4, 5])
+        self.assertEqual(list(postings.get({"b", "a", "z"})), [0, 1, 3])
+
+    def test_dataset_postings(self):
+        for column, entry in [("l", "book"), ("x", "PUNCT"), ("w", ["The", "the"])]:
+            values = [entry] if isinstance(entry, str) else entry
+            match = self.loaded[column].astype(str).isin(values)
+            just = getattr(self.loaded.just, column)(entry, exact_match=True)
+            skip = getattr(self.loaded.skip, column)(entry, exact_match=True)
+            self.assertTrue(just.equals(self.loaded[match]))
+            self.assertTrue(skip.equals(self.loaded[~match]))
+
+    def test_dataset_postings_edited(self):
+        loaded = self.loaded.copy()
+        self.assertEqual(len(loaded.just.x.PUNCT), (loaded.x == "PUNCT").sum())
+        # edit the column in place, so it keeps the same array
+        loaded["x"].array[(loaded.x == "PUNCT").values] = "NOUN"
+        self.assertEqual(len(loaded.just.x.PUNCT), 0)
+        loaded.loc[loaded.x == "NOUN", "x"] = "PUNCT"
+        self.assertEqual(len(loaded.just.x.PUNCT), (loaded.x == "PUNCT").sum())
+
+    def test_corpus_index(self):
+        book = self.corpus.just.lemmata.book
+        self.assertEqual(len(book), len(self.loaded.just.lemmata.book))
+        nobook = self.corpus.skip.lemmata.book
+        self.assertEqual(len(nobook), len(self.loaded) - len(book))
+        index = CorpusIndex(self.corpus)
+        # positions are the same as _n in the loaded corpus
+        rows = index.postings("x").get("PUNCT")
+        expect = self.loaded[self.loaded.x == "PUNCT"]._n
+        self.assertEqual(list(rows), list(expect))
+        # only files with matches are returned
+        files = set(book.index.get_level_values("file"))
+        self.assertEqual(len(index.filter("l", "book")), len(files))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from nltk.tree import ParentedTree
+
+from buzz.corpus import Corpus
+from buzz.dataset import Dataset
+from buzz.mapped import MappedDataset
+
+
+class TestMapped(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, "saved.feather")
+        Corpus("tests/testing-parsed").load(cache=False).save(cls.path, compression="uncompressed")
+        cls.loaded = Dataset.load(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_memory_map(self):
+        mapped = Dataset.load(self.path, memory_map=True)
+        self.assertIsInstance(mapped, MappedDataset)
+        self.assertEqual(mapped.shape, self.loaded.shape)
+        self.assertEqual(mapped.columns, list(self.loaded.columns))
+        self.assertTrue(mapped.load().equals(self.loaded))
+        self.assertTrue(mapped["w"].equals(self.loaded["w"]))
+
+    def test_compressed(self):
+        self.assertTrue(Dataset.load(self.path, memory_map=True).mapped)
+        path = os.path.join(self.tmp, "compressed.feather")
+        self.loaded.save(path, compression="lz4")
+        mapped = Dataset.load(path, memory_map=True)
+        # still works, but from memory
+        self.assertFalse(mapped.mapped)
+        self.assertTrue(mapped.load().equals(self.loaded))
+
+    def test_columns_and_rows(self):
+        # starting mid-sentence still gets the sentence-level metadata
+        part = Dataset.load(self.path, columns=["w", "speaker"], rows=(5, 40))
+        expect = self.loaded[["w", "speaker"]].iloc[5:40]
+        self.assertEqual(list(part.columns), ["w", "speaker"])
+        pd.testing.assert_frame_equal(part, expect, check_categorical=False)
+        mapped = Dataset.load(self.path, memory_map=True)
+        part = mapped[5:40][["w", "speaker"]]
+        pd.testing.assert_frame_equal(part, expect, check_categorical=False)
+
+    def test_chunks(self):
+        mapped = Dataset.load(self.path, memory_map=True)
+        chunks = list(mapped.chunks(size=50, columns=["w"]))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.index[0][2] == 1 for chunk in chunks))
+        joined = pd.concat(chunks)
+        self.assertEqual(list(joined.w.astype(str)), list(self.loaded.w.astype(str)))
+
+    def test_trees(self):
+        path = os.path.join(self.tmp, "trees.feather")
+        data = self.loaded.copy()
+        # trees made by older versions, or strings as parsed
+        tree = ParentedTree.fromstring("(S (NP (PRP I)) (VP (VBD ran)))")
+        data["parse"] = [tree] * 10 + ["(S (X y))"] * (len(data) - 10)
+        data.save(path)
+        loaded = Dataset.load(path)
+        self.assertEqual(loaded.parse.iloc[0], "(S (NP (PRP I)) (VP (VBD ran)))")
+        self.assertEqual(loaded.tree(0), tree)
+        self.assertEqual(len(loaded.tgrep("NP < PRP")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import spacy
+
+from buzz.multi import _size_groups
+from buzz.parse import (
+    _align_token_meta,
+    _output_path,
+    _plan_parse,
+    _prepare_string,
+    _write_parse_manifest,
+)
+
+SETTINGS = dict(language="en", model=["en_core_web_sm", "2.3.1"])
+
+
+class TestParse(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "txt")
+        self.outdir = os.path.join(self.tmp, "conllu")
+        os.makedirs(self.path)
+        os.makedirs(self.outdir)
+        self.paths = list()
+        for name in ["one", "two", "three"]:
+            path = os.path.join(self.path, name + ".txt")
+            with open(path, "w") as fo:
+                fo.write(f"Text of {name}.\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _parse(self, paths, settings=SETTINGS):
+        """
+        Pretend to parse, as Parser._spacy_parse would
+        """
+        todo, sources = _plan_parse(paths, self.path, settings)
+        for path in todo:
+            with open(_output_path(path, self.path), "w") as fo:
+                fo.write("parsed\n")
+        _write_parse_manifest(self.outdir, settings, sources)
+        return todo
+
+    def test_plan_parse(self):
+        self.assertEqual(self._parse(self.paths), self.paths)
+        self.assertEqual(self._parse(self.paths), [])
+        # touching a file is not enough, but editing it is
+        os.utime(self.paths[0], None)
+        with open(self.paths[1], "a") as fo:
+            fo.write("More text.\n")
+        self.assertEqual(self._parse(self.paths), [self.paths[1]])
+        # new settings mean everything is parsed again
+        settings = dict(SETTINGS, model=["en_core_web_sm", "2.3.2"])
+        self.assertEqual(self._parse(self.paths, settings), self.paths)
+        # removed sources lose their parsed files
+        os.remove(self.paths[2])
+        self.assertEqual(self._parse(self.paths[:2], settings), [])
+        expected = [".buzz-parse.json", "one.conllu", "two.conllu"]
+        self.assertEqual(sorted(os.listdir(self.outdir)), expected)
+
+    def test_no_manifest(self):
+        # parsed before there were manifests: only missing files are parsed
+        with open(_output_path(self.paths[0], self.path), "w") as fo:
+            fo.write("parsed\n")
+        self.assertEqual(self._parse(self.paths), self.paths[1:])
+        self.assertEqual(self._parse(self.paths), [])
+
+    def test_size_groups(self):
+        with open(self.paths[1], "w") as fo:
+            fo.write("A much longer text than the others. " * 100)
+        groups = _size_groups(self.paths, 2)
+        # biggest first and alone, then the rest together
+        self.assertEqual(groups, [[self.paths[1]], [self.paths[2], self.paths[0]]])
+        singles = _size_groups(self.paths, 2, batch_size=1)
+        self.assertEqual(singles, [[self.paths[1]], [self.paths[2]], [self.paths[0]]])
+
+    def test_align_token_meta(self):
+        text = (
+            'SAL: Take <meta kind="cash">money</meta>, more <meta kind="cash">money</meta>.\n'
+            'The <meta pos="adj">big dog</meta> ate. <meta scene=2>'
+        )
+        _, metadata = _prepare_string(text, speakers=True)
+        self.assertEqual(metadata.text, "Take money, more money.\nThe big dog ate. ")
+        self.assertEqual(metadata.line_starts, [0, 24])
+        self.assertEqual(metadata.sent_meta, [dict(speaker="SAL"), dict(scene=2)])
+        self.assertEqual(metadata.line_spans, [True, True])
+        doc = spacy.blank("en").tokenizer(metadata.text)
+        found = _align_token_meta(doc, metadata.spans)
+        annotated = {doc[i].text: features for i, features in found.items()}
+        self.assertEqual(sorted(i for i in found), [1, 4, 8, 9])
+        self.assertEqual(annotated["money"], [dict(kind="cash")])
+        self.assertEqual(annotated["dog"], [dict(pos="adj")])
+
+    def test_stray_brackets(self):
+        # a < that starts no tag is text, and does not swallow the lines after it
+        text = "A: I think x <y is true\nB: more text here\nC: the end is near"
+        _, metadata = _prepare_string(text, speakers=True)
+        self.assertEqual(metadata.text, "I think x <y is true\nmore text here\nthe end is near")
+        self.assertEqual(metadata.line_starts, [0, 21, 36])
+        self.assertEqual([i["speaker"] for i in metadata.sent_meta], ["A", "B", "C"])
+        _, metadata = _prepare_string('x <y and a<b <meta k="v">ok</meta> end', speakers=True)
+        self.assertEqual(metadata.text, "x <y and a<b ok end")
+        self.assertEqual(metadata.spans, [(13, 15, dict(k="v"))])
+
+
+if __name__ == "__main__":
+    unittest.main()
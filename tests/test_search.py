@@ -61,3 +61,19 @@ class TestSearch(unittest.TestCase):
                 self.assertTrue(gov.name in res.index)
                 count += 1
         self.assertEqual(count, len(res))
+
+    def test_run_many(self):
+        from buzz.search import Searcher
+
+        queries = ['x/^NOUN/ -> l"the"', 'l/book/ = x/NOUN/', 'x/NOUN/ <- l"the"', 'l"nothing"']
+        # incomplete sentences need depgrep row by row for relations
+        for corpus in [self.loaded, self.parsed, self.loaded.iloc[1:]]:
+            found = Searcher().run_many(corpus, queries, position=None)
+            self.assertEqual(list(found), queries)
+            for query in queries:
+                single = corpus.depgrep(query)
+                self.assertEqual(list(found[query].index), list(single.index), query)
+                if len(single):
+                    self.assertEqual(list(found[query]._n), list(single._n), query)
+        labelled = Searcher().run_many(self.loaded, dict(the=queries[0]), position=None)
+        self.assertEqual(len(labelled["the"]), 24)
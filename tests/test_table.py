@@ -1,8 +1,11 @@
 import unittest
 from unittest.mock import patch
 
+import numpy as np
+import pandas as pd
+
 from buzz.corpus import Corpus
-from buzz.table import Table
+from buzz.table import SparseTable, Table
 
 TOTAL_TOKENS = 329
 
@@ -54,6 +57,49 @@ class TestTable(unittest.TestCase):
         self.assertEqual(word_pos.shape[1], 181)
         self.assertEqual(word_pos.columns[0], "his/prp$")
 
+    def test_keyness_measures(self):
+        # counts of two words in two subcorpora, the second of which lacks one
+        counts = Table(pd.DataFrame([[10, 5], [0, 5]], index=["a", "b"], columns=["x", "y"]))
+        reference = pd.DataFrame(dict(_match=["x"] * 10 + ["y"] * 10 + ["z"] * 80))
+        ll = counts.keyness("ll", reference=reference)
+        # by hand: 2 * (10 * log(10 / 17.39...) + 10 * log(10 / 2.60...))
+        self.assertAlmostEqual(ll.loc["a", "x"], 15.8070, places=4)
+        self.assertGreater(ll.loc["a", "y"], 0)
+        # a word missing from a subcorpus is underused there, not nan
+        self.assertAlmostEqual(ll.loc["b", "x"], -0.9758, places=4)
+        pd_scores = counts.keyness("pd", reference=reference)
+        self.assertAlmostEqual(pd_scores.loc["a", "x"], 566.6667, places=4)
+        self.assertEqual(pd_scores.loc["b", "x"], 0)
+        for measure in ["or", "bf", "el", "rr"]:
+            self.assertEqual(counts.keyness(measure, reference=reference).shape, (2, 2))
+
+    def test_sparse(self):
+        options = [dict(), dict(subcorpora=["file", "speaker"]), dict(sort="name", relative=True)]
+        for kwargs in options:
+            dense = LOADED.table(**kwargs)
+            sparse = LOADED.table(sparse=True, **kwargs)
+            self.assertIsInstance(sparse, SparseTable)
+            as_dense = sparse.to_dense()
+            self.assertTrue(as_dense.index.equals(dense.index))
+            self.assertEqual(set(as_dense.columns), set(dense.columns))
+            self.assertTrue(np.allclose(as_dense[dense.columns].values, dense.values))
+        # the same trends, though tied entries may come in another order
+        sparse = LOADED.table(sparse=True, sort="increase", keep_stats=True)
+        slopes = LOADED.table(sort="increase", keep_stats=True).loc["slope"]
+        self.assertEqual(list(sparse.stats.loc["slope"]), sorted(slopes, reverse=True))
+
+    def test_unused_categories(self):
+        # categories that no row has do not become rows of zeros, densely or sparsely
+        data = LOADED.copy()
+        data["part"] = pd.Categorical(["a"] * len(data), categories=["a", "b", "c"])
+        for subcorpora in [["part"], ["file", "part"]]:
+            dense = data.table(subcorpora=subcorpora)
+            as_dense = data.table(subcorpora=subcorpora, sparse=True).to_dense()
+            self.assertEqual(list(dense.index.get_level_values("part").unique()), ["a"])
+            self.assertEqual(len(dense), 1 if subcorpora == ["part"] else 4)
+            self.assertTrue(as_dense.index.equals(dense.index))
+            self.assertTrue(np.allclose(as_dense[dense.columns].values, dense.values))
+
     def test_pd_keyword(self):
         word_pos = LOADED.table(show=["w", "p"], keyness="pd")
         self.assertEqual(word_pos.shape[0], 4)
@@ -119,3 +165,21 @@ class TestTable(unittest.TestCase):
             conc = LOADED.just.lemmata.book.conc()
             with self.assertRaises(ValueError):
                 conc.view()
+
+    def test_paged_rows(self):
+        from buzz.tabview import PagedRows, process_data
+
+        conc = LOADED.conc(metadata=False)
+        buf = process_data(conc)
+        rows = buf["data"]
+        self.assertIsInstance(rows, PagedRows)
+        self.assertEqual(buf["header"], ["index", "left", "match", "right"])
+        self.assertEqual(len(rows), len(conc))
+        self.assertEqual(rows[300], [str(conc.index[300])] + list(conc.iloc[300]))
+        self.assertEqual(buf["index"][300], rows[300][0])
+        # only a few pages are ever kept
+        self.assertEqual(len(list(rows)), len(conc))
+        self.assertLessEqual(len(rows._pages), PagedRows.max_pages)
+        ordered = rows.sort(2)
+        self.assertEqual([r[2] for r in ordered], sorted(conc.match))
+        self.assertEqual(len(rows.sample(10)), 10)
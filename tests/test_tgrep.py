@@ -0,0 +1,100 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from nltk.tgrep import tgrep_compile
+from nltk.tree import ParentedTree
+
+from buzz.depgrep import Unsupported
+from buzz.tgrep import _compile, _tgrep_grams, _Trees
+
+TREES = [
+    "(ROOT (S (NP (DT the) (NN dog)) (VP (VBD ran) (PP (IN to) (NP (PRP me)))) (. .)))",
+    "(ROOT (S (NP (PRP It)) (VP (VBZ is) (NP (NP (DT a) (NN test)) (_SP  ))) (_SP  )))",
+    "(ROOT (FRAG (NP (NP (JJ big) (NNS dogs)) (PP (IN of) (NP (NNP Rome))))))",
+    "(S (X (Y (Z a))) b c)",
+    "not a tree (",
+    "",
+]
+
+QUERIES = [
+    "NP",
+    "NP < DT",
+    "NP > S",
+    "NP <1 DT",
+    "NP <-1 NN",
+    "NN >-1 NP",
+    "NP <: PRP",
+    "PRP >: NP",
+    "S << PRP",
+    "PRP >> S",
+    "S <<, DT",
+    "S <<' /\\./",
+    "NP <<: __",
+    "__ >>: S",
+    "/^VB/ . NP",
+    "NP , /^VB/",
+    "NP .. VP",
+    "VP ,, NP",
+    "NP $ VP",
+    "NP $. VP",
+    "VP $, NP",
+    "__ $.. __",
+    "__ $,, __",
+    "i@\"THE\"",
+    "NP !< DT",
+    "NP [< DT | < PRP]",
+    "__ < (NP << PRP)",
+    "__ . __",
+    "__ , __",
+]
+
+
+class TestTgrep(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.trees = _Trees.from_strings(TREES)
+        cls.nltk = list()
+        for tree in TREES:
+            try:
+                cls.nltk.append(ParentedTree.fromstring(tree))
+            except ValueError:
+                continue
+
+    def _node_by_node(self, query):
+        compiled = tgrep_compile(query)
+        matches = list()
+        for tree in self.nltk:
+            matches += [bool(compiled(tree[i])) for i in tree.treepositions()]
+        return np.array(matches)
+
+    def test_same_as_nltk(self):
+        for query in QUERIES:
+            native = _compile(query).mask(self.trees)
+            self.assertTrue((native == self._node_by_node(query)).all(), query)
+
+    def test_unsupported(self):
+        for query in ["@NP NP; @NP", "NP=x < DT", "NP >>, S", "NP : DT"]:
+            with self.assertRaises(Unsupported):
+                _compile(query)
+
+    def test_stored(self):
+        stored = _Trees.from_frame(self.trees.to_frame(), len(TREES))
+        for query in QUERIES[:5]:
+            expected = _compile(query).mask(self.trees)
+            self.assertTrue((_compile(query).mask(stored) == expected).all(), query)
+
+    def test_grams(self):
+        keys = pd.MultiIndex.from_tuples([("f", s, 1) for s in range(1, len(TREES) + 1)])
+        grams = _tgrep_grams(self.trees, _compile("NP").mask(self.trees), keys)
+        self.assertEqual(grams[("f", 1, 1)], "1,2")
+        self.assertEqual(grams[("f", 1, 5)], "5")
+        # empty brackets match no tokens, and where matches overlap the last wins
+        self.assertEqual(grams[("f", 2, 4)], "3,4")
+        self.assertEqual(grams[("f", 3, 1)], "1,2")
+        self.assertEqual(grams[("f", 3, 3)], "1,2,3,4")
+        self.assertNotIn(4, grams.index.get_level_values(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from buzz.constants import TOPOLOGY_QUERIES
+from buzz.corpus import Corpus
+from buzz.depgrep import Unsupported, _Tokens
+from buzz.search import Searcher
+from buzz.topology import _process_chunk, _template_counts, _word_rows
+
+
+class TestTopology(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loaded = Corpus("tests/testing-parsed").load()
+
+    def _compare(self, kind):
+        relevant = getattr(self.loaded.just.wordclass, kind.upper())
+        relevant = relevant[relevant["l"].str.isalnum()]
+        counts = relevant.l.value_counts()
+        words = list(counts[counts >= 2].index)
+        self.assertTrue(words)
+        df = Searcher()._depgrep_frame(self.loaded)
+        tokens, slots = _Tokens(df), _word_rows(df, words)
+        queries = {**TOPOLOGY_QUERIES[kind.upper()], **TOPOLOGY_QUERIES["GENERAL"]}
+        templated = 0
+        for name, (query, is_bool, features) in queries.items():
+            try:
+                fast = _template_counts(df, tokens, slots, words, name, query, features, counts)
+            except Unsupported:
+                continue
+            templated += 1
+            # one search per word, as when the query cannot be a template
+            searches = [[word, name, query, is_bool, features] for word in words]
+            slow = _process_chunk(self.loaded, searches, counts)
+            fast = {word: found for word, found in fast}
+            slow = {word: found for word, found in slow if found}
+            self.assertEqual(set(fast), set(slow), name)
+            for word, found in slow.items():
+                self.assertEqual(set(fast[word]), set(found), (name, word))
+                for feature, count in found.items():
+                    self.assertAlmostEqual(fast[word][feature], count)
+        self.assertGreater(templated, 0)
+
+    def test_templates_verb(self):
+        self._compare("verb")
+
+    def test_templates_noun(self):
+        self._compare("noun")
+
+
+if __name__ == "__main__":
+    unittest.main()